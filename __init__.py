@@ -1,3 +1,9 @@
+import time
+_import_started = time.perf_counter()
+
 from . import models
 from . import services
-from . import controllers
\ No newline at end of file
+from . import controllers
+from . import cli
+
+services.startup.record('import', _import_started)
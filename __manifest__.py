@@ -2,12 +2,13 @@
     'name': 'Telegram Bot Manager',
     'version': '1.0',
     "category": "Tools",
-    'depends': ['base', 'myfansbook_core', 'website', 'auth_signup', 'auth_oauth'], 
+    'depends': ['base', 'bus', 'mail', 'myfansbook_core', 'website', 'auth_signup', 'auth_oauth'], 
     'sequence': 2,
     'data': [
         'security/ir.model.access.csv',
         'views/telegram_config_views.xml',
         "views/auth_oauth_views.xml",
+        'data/ir_cron_data.xml',
         # 'data/auth_oauth_provider_telegram.xml',
 
     ],
@@ -17,13 +18,17 @@
         'web.assets_backend': [
             'telegram_bot_manager/static/src/js/field_widget.js',
             'telegram_bot_manager/static/src/xml/field_widget.xml',
+            'telegram_bot_manager/static/src/js/bot_state_widget.js',
+            'telegram_bot_manager/static/src/xml/bot_state_widget.xml',
 
             
         ],
     },
 
     'external_dependencies': {
-        'python': ['telegram', 'httpx'],
+        # python-telegram-bot: services/conversation.py overrides private methods of the 21.x
+        # ConversationHandler; APScheduler is its job-queue extra, needed by the conversation timeouts
+        'python': ['python-telegram-bot>=21.0,<22.0', 'APScheduler', 'httpx', 'cryptography'],
     },
     'post_init_hook': 'post_init_hook',
     'installable': True,
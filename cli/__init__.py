@@ -0,0 +1,3 @@
+from . import telegram_bot
+from . import telegram_backfill
+from . import telegram_replay
@@ -0,0 +1,52 @@
+import argparse
+import itertools
+import logging
+import os
+import sys
+
+import odoo
+from odoo.cli import Command
+from odoo.tools import config
+
+from ..services.member_export import iter_export_users
+from ..services.seen_users import STORE_BATCH, store_seen_users
+
+_logger = logging.getLogger(__name__)
+
+
+class TelegramBackfill(Command):
+    """ Fill the telegram_id of the profiles only known by their Telegram username """
+    name = 'telegram-backfill'
+
+    def run(self, args):
+        parser = argparse.ArgumentParser(
+            prog='%s telegram-backfill' % os.path.basename(sys.argv[0]),
+            description=self.__doc__.strip(),
+        )
+        parser.add_argument('--export', action='append', default=[], metavar='FILE',
+                            help="JSON member list of a Telegram channel or group, with user ids and "
+                                 "usernames, to import first; read as a stream, may be given several times")
+        parser.add_argument('--no-backfill', action='store_true',
+                            help="Only import the exports into the seen users")
+        opts, odoo_args = parser.parse_known_args(args)
+
+        config.parse_config(odoo_args)
+        dbname = (config['db_name'] or '').split(',')[0]
+        if not dbname:
+            sys.exit("A database is required: odoo-bin telegram-backfill -d <database> [--export FILE]")
+
+        registry = odoo.modules.registry.Registry(dbname)
+        for path in opts.export:
+            imported = 0
+            pairs = iter_export_users(path)
+            with registry.cursor() as cr:
+                while batch := list(itertools.islice(pairs, STORE_BATCH)):
+                    imported += store_seen_users(cr, batch)
+                    cr.commit()
+            _logger.info("Imported %s Telegram users from %s", imported, path)
+
+        if not opts.no_backfill:
+            with registry.cursor() as cr:
+                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+                filled = env['telegram.config']._backfill_telegram_ids()
+            _logger.info("Filled the telegram_id of %s records", filled)
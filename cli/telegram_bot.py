@@ -0,0 +1,106 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+
+import odoo
+from odoo.cli import Command
+from odoo.tools import config
+
+from ..models.telegram_config import RUNNER_POLL_INTERVAL
+from ..services.lifecycle import get_manager
+
+_logger = logging.getLogger(__name__)
+
+
+class TelegramBot(Command):
+    """ Run the Telegram bots of a database in a dedicated process """
+    name = 'telegram-bot'
+
+    def __init__(self):
+        super().__init__()
+        self.manager = None  # created in run(): building the command must not start the lifecycle thread
+        self.stop_event = threading.Event()
+
+    def run(self, args):
+        parser = argparse.ArgumentParser(
+            prog='%s telegram-bot' % os.path.basename(sys.argv[0]),
+            description=self.__doc__.strip(),
+        )
+        parser.add_argument('--poll-interval', type=float, default=RUNNER_POLL_INTERVAL,
+                            help="Seconds between two reads of telegram.config (default: %(default)s)")
+        parser.add_argument('--consumers-only', action='store_true',
+                            help="Do not poll Telegram, only consume the durable update queue of the "
+                                 "bots using the Postgres ingestion (count it in their Consuming Processes)")
+        opts, odoo_args = parser.parse_known_args(args)
+        self.consumers_only = opts.consumers_only
+
+        config.parse_config(odoo_args)
+        dbname = (config['db_name'] or '').split(',')[0]
+        if not dbname:
+            sys.exit("A database is required: odoo-bin telegram-bot -d <database>")
+
+        self.manager = get_manager()
+        self.manager.polling = not opts.consumers_only
+
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+        registry = odoo.modules.registry.Registry(dbname)
+        _logger.info("Telegram bot runner started for DB %s (pid %s)", dbname, os.getpid())
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.reconcile(registry)
+                except Exception:
+                    _logger.exception("Telegram bot runner: reconciliation failed")
+                self.stop_event.wait(opts.poll_interval)
+        finally:
+            self.manager.stop_all()
+            if not self.consumers_only:
+                self._release(registry)
+        _logger.info("Telegram bot runner stopped for DB %s", dbname)
+
+    def _on_signal(self, signum, frame):
+        _logger.info("Telegram bot runner received signal %s, stopping", signum)
+        self.stop_event.set()
+
+    def reconcile(self, registry):
+        """ Align the bots of this process with the requested_state stored in the database. """
+        registry = registry.check_signaling()
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            domain = [('run_mode', '=', 'process')]
+            if self.consumers_only:
+                domain.append(('update_ingestion', '=', 'postgres'))
+            configs = env['telegram.config'].search(domain)
+            wanted = configs.filtered(lambda c: c.requested_state == 'running')
+
+            for config_id in set(self.manager.bots) - set(wanted.ids) - set(self.manager.pending):
+                self.manager.request(cr.dbname, config_id, 'stop')
+
+            for record in wanted:
+                # Bots that crashed stay in manager.bots: the supervisor restarts them with backoff
+                if record.id not in self.manager.bots and record.id not in self.manager.pending:
+                    self.manager.request(cr.dbname, record.id, 'start')
+
+            if self.consumers_only:
+                return  # the heartbeat belongs to the polling runner
+
+            alive = wanted.filtered(lambda c: self.manager.is_running(c.id))
+            alive.write({'runner_heartbeat': odoo.fields.Datetime.now(), 'runner_pid': os.getpid()})
+            (configs - alive).filtered(lambda c: c.runner_pid == os.getpid()).write({
+                'runner_heartbeat': False,
+                'runner_pid': 0,
+            })
+
+    def _release(self, registry):
+        """ Clear the heartbeat of every record this process was serving. """
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            env['telegram.config'].search([('runner_pid', '=', os.getpid())]).write({
+                'runner_heartbeat': False,
+                'runner_pid': 0,
+            })
@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import time
+
+import odoo
+from odoo.cli import Command
+from odoo.tools import config
+
+from ..services.fake_api import FAKE_BOT_ID, FakeBotApi
+from ..services.recorder import iter_segment, segments_of
+
+_logger = logging.getLogger(__name__)
+
+
+class TelegramReplay(Command):
+    """ Feed recorded Telegram updates to a bot talking to a fake Bot API """
+    name = 'telegram-replay'
+
+    def run(self, args):
+        parser = argparse.ArgumentParser(
+            prog='%s telegram-replay' % os.path.basename(sys.argv[0]),
+            description=self.__doc__.strip(),
+        )
+        parser.add_argument('segments', nargs='+',
+                            help="Segment files recorded by the bot, or directories of segments")
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help="Replay speed: 1 keeps the original pace, 10 is ten times faster, "
+                                 "0 sends the updates as fast as possible (default: %(default)s)")
+        parser.add_argument('--since', type=int, help="Skip the updates before this update_id")
+        parser.add_argument('--limit', type=int, help="Replay at most this many updates")
+        parser.add_argument('--config-id', type=int, help="telegram.config whose settings the bot uses "
+                                                          "(default: the first one)")
+        parser.add_argument('--api-port', type=int, default=0, help="Port of the fake Bot API (default: any)")
+        parser.add_argument('--api-latency', type=float, default=0.0,
+                            help="Seconds the fake Bot API takes to answer each call")
+        parser.add_argument('--member-status', default='member',
+                            help="Status getChatMember answers for every user (default: %(default)s)")
+        parser.add_argument('--allow-writes', action='store_true',
+                            help="Confirm that the database is a copy: the handlers create and update "
+                                 "records as in production (registrations, linked IDs...)")
+        opts, odoo_args = parser.parse_known_args(args)
+
+        config.parse_config(odoo_args)
+        dbname = (config['db_name'] or '').split(',')[0]
+        if not dbname:
+            sys.exit("A database is required: odoo-bin telegram-replay -d <database> SEGMENT...")
+        if not opts.allow_writes:
+            sys.exit("The replayed handlers write to database %s as in production. Replay against a copy "
+                     "of the database and pass --allow-writes." % dbname)
+
+        from ..services.telegram_worker import TelegramBotThread
+
+        api = FakeBotApi(port=opts.api_port, latency=opts.api_latency, member_status=opts.member_status).start()
+        bot = TelegramBotThread(dbname, '%s:replay' % FAKE_BOT_ID, self._bot_config(dbname, opts.config_id, api),
+                                polling=False)
+        bot.start()
+        bot.ready.wait()
+        if bot.error:
+            api.stop()
+            sys.exit("The bot did not start: %s" % bot.error)
+        _logger.warning("Replaying into database %s: handlers read and write it as in production", dbname)
+        try:
+            count, elapsed = self.replay(bot, opts)
+        finally:
+            bot.stop_polling()
+            bot.join()
+            api.stop()
+        print("Replayed %d updates in %.1fs (%.1f updates/s)" % (count, elapsed, count / elapsed if elapsed else 0))
+        for method, calls in api.calls.most_common():
+            print("  %-28s %d" % (method, calls))
+
+    def _bot_config(self, dbname, config_id, api):
+        """ Settings of the configuration, detached from its record: nothing is persisted or resumed,
+        and the bot's own bookkeeping (reachability, seen users, channel statuses) stays in memory. """
+        registry = odoo.modules.registry.Registry(dbname)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            Config = env['telegram.config']
+            record = Config.browse(config_id).exists() if config_id else Config.search([], limit=1)
+            if not record:
+                sys.exit("No telegram.config to take the settings from")
+            bot_config = record._prepare_bot_config()
+        bot_config.update({
+            'API_BASE_URL': api.base_url,
+            'UPDATE_INGESTION': 'memory',
+            'LAST_UPDATE_ID': 0,
+            'UPDATE_WINDOW': False,
+            'PERSISTENCE_INTERVAL': 0,
+            'RECORD_DIRECTORY': False,
+            'REPLAY': True,
+        })
+        return bot_config
+
+    def replay(self, bot, opts):
+        """ Put the recorded updates in the bot's queue at the recorded pace; returns (count, seconds). """
+        from telegram import Update
+
+        records = itertools.chain.from_iterable(
+            iter_segment(segment, opts.since) for path in opts.segments for segment in segments_of(path)
+        )
+        if opts.limit:
+            records = itertools.islice(records, opts.limit)
+        application = bot.application
+        started = time.monotonic()
+        first_at = None
+        count = 0
+        for recorded_at, data in records:
+            if first_at is None:
+                first_at = recorded_at
+            if opts.speed > 0:
+                delay = (recorded_at - first_at) / opts.speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            update = Update.de_json(data, application.bot)
+            bot.loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+            count += 1
+        # Wait for the handlers to be done with the queued updates
+        asyncio.run_coroutine_threadsafe(application.update_queue.join(), bot.loop).result()
+        return count, time.monotonic() - started
@@ -51,18 +51,27 @@ class TelegramAjaxAuth(http.Controller):
         Partner = request.env['res.partner'].sudo()
         user = False
 
-        # Strategy A: Check if a partner is already linked to this Telegram ID
-        # (Assuming you store tg_id in a field, otherwise skip to Username)
-        partner = Partner.search([('telegram_username', '=', tg_username)], limit=1)
-        
+        # Strategy A: Check if a partner is already linked to this Telegram ID (indexed)
+        partner = Partner.search([('telegram_id', '=', tg_id)], limit=1)
+
+        # Partners not backfilled yet: the username may only claim a partner without an ID,
+        # which is linked on the way so the next login goes by ID
+        if not partner and tg_username:
+            partner = Partner.search([('telegram_id', '=', False), ('telegram_username', '=', tg_username)], limit=1)
+            if partner:
+                partner.telegram_id = tg_id
+
         if partner:
             user = User.search([('partner_id', '=', partner.id)], limit=1)
 
-        # Strategy B: Fallback to searching by the generic 'username' field
+        # Strategy B: Fallback to searching by the generic 'username' field, under the same
+        # rule as above: never a partner already linked to another Telegram ID
         if not user and tg_username:
-            partner = Partner.search([('username', '=', tg_username)], limit=1)
+            partner = Partner.search([('telegram_id', '=', False), ('username', '=', tg_username)], limit=1)
             if partner:
                 user = User.search([('partner_id', '=', partner.id)], limit=1)
+                if user:
+                    partner.telegram_id = tg_id
 
         # Strategy C: If you use Phone registration, check if the tg_id matches a login
         if not user:
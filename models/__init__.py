@@ -1,2 +1,12 @@
 from . import telegram_config
+from . import telegram_update_queue
+from . import telegram_bot_data
+from . import telegram_message_expiry
+from . import telegram_unreachable_user
+from . import telegram_seen_user
+from . import telegram_channel_status
+from . import telegram_gate_channel
+from . import telegram_log_rule
+from . import myfans_user
+from . import res_partner
 # from . import ir_http
\ No newline at end of file
@@ -0,0 +1,29 @@
+from odoo import models, fields
+
+
+class MyfansUser(models.Model):
+    _inherit = 'myfans.user'
+
+    # Hot lookups of the bot and the WebApp login go by id only
+    telegram_id = fields.Char(index=True)
+
+    telegram_channel_status_ids = fields.One2many(
+        'telegram.channel.status', 'profile_id', string="Channel Statuses", readonly=True,
+        help="Status in each Telegram channel, refreshed by the membership reconciliation cron "
+             "and whenever the bot checks it live.")
+
+    def _is_telegram_channel_member(self, channel_id):
+        """ Whether the last status stored for ``channel_id`` counts as in the channel. """
+        self.ensure_one()
+        return any(line.is_member for line in self.telegram_channel_status_ids if line.channel_id == channel_id)
+
+    def _set_telegram_channel_status(self, channel_id, status):
+        """ Store a status just read from Telegram in ``channel_id``, for every profile of ``self``. """
+        Status = self.env['telegram.channel.status'].sudo()
+        now = fields.Datetime.now()
+        known = Status.search([('profile_id', 'in', self.ids), ('channel_id', '=', channel_id)])
+        known.write({'status': status, 'checked_at': now})
+        Status.create([
+            {'profile_id': profile.id, 'channel_id': channel_id, 'status': status, 'checked_at': now}
+            for profile in self - known.profile_id
+        ])
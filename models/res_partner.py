@@ -0,0 +1,16 @@
+from odoo import models, fields
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    # Hot lookups of the bot and the WebApp login go by id only
+    telegram_id = fields.Char(index=True)
+
+    telegram_bio = fields.Text(string="Telegram Bio", readonly=True, copy=False)
+    telegram_photo_unique_id = fields.Char(
+        string="Telegram Photo ID", readonly=True, copy=False,
+        help="file_unique_id of the Telegram profile photo the avatar was taken from: "
+             "the photo is only downloaded again when it changes."
+    )
+    telegram_profile_synced_at = fields.Datetime(string="Telegram Profile Synced On", readonly=True, copy=False)
@@ -0,0 +1,24 @@
+from odoo import models, fields
+
+
+class TelegramBotData(models.Model):
+    """
+    Persistent state of a running bot: ``user_data`` per Telegram user and
+    the current state of each persistent conversation. Written in batches by
+    services/persistence.py; sensitive values are stored encrypted.
+    """
+    _name = 'telegram.bot.data'
+    _description = 'Telegram Bot Persistent Data'
+
+    config_id = fields.Many2one('telegram.config', required=True, ondelete='cascade', index=True)
+    scope = fields.Selection([
+        ('user', 'User Data'),
+        ('conversation', 'Conversation'),
+    ], required=True)
+    name = fields.Char(string="Conversation", default='', required=True)
+    key = fields.Char(required=True, help="Telegram user id, or the JSON conversation key")
+    data = fields.Text(required=True)
+
+    _sql_constraints = [
+        ('entry_uniq', 'unique(config_id, scope, name, key)', "Bot data entries must be unique."),
+    ]
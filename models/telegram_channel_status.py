@@ -0,0 +1,37 @@
+from odoo import models, fields, api
+
+
+class TelegramChannelStatus(models.Model):
+    """
+    Status of a profile in a Telegram channel, refreshed by the membership
+    reconciliation cron of each configuration and whenever a bot checks it
+    live. Keyed by channel, so configurations following different channels
+    each keep their own answer for the same profile. See services/membership.py.
+    """
+    _name = 'telegram.channel.status'
+    _description = 'Telegram Channel Status'
+    _rec_name = 'channel_id'
+
+    profile_id = fields.Many2one('myfans.user', required=True, ondelete='cascade', index=True)
+    channel_id = fields.Char(string="Channel", required=True, help="@username or numeric id of the channel.")
+    status = fields.Selection([
+        ('creator', 'Owner'),
+        ('administrator', 'Administrator'),
+        ('member', 'Member'),
+        ('restricted', 'Restricted'),
+        ('left', 'Not a Member'),
+        ('kicked', 'Banned'),
+    ], required=True)
+    checked_at = fields.Datetime(string="Checked On", required=True, default=fields.Datetime.now)
+    is_member = fields.Boolean(string="In Channel", compute='_compute_is_member', store=True, index=True)
+
+    _sql_constraints = [
+        ('profile_channel_uniq', 'unique(profile_id, channel_id)', "A profile has one status per channel."),
+    ]
+
+    @api.depends('status')
+    def _compute_is_member(self):
+        from ..services.membership import MEMBER_STATUSES
+
+        for record in self:
+            record.is_member = record.status in MEMBER_STATUSES
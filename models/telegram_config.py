@@ -1,17 +1,280 @@
+import base64
+import time
+from datetime import timedelta
 from odoo import models, fields, api, tools
-from ..services.telegram_worker import TelegramBotThread
+from odoo.exceptions import UserError
 from odoo.http import request
+from ..services import startup
+from ..services.lifecycle import get_manager
 import logging
 _logger = logging.getLogger(__name__)
 
-# Global variable to keep track of the running thread
-BOT_THREAD = None
+# Bus channel the form listens on for bot_state changes
+BUS_CHANNEL = 'telegram_bot_manager'
+
+# A standalone runner refreshes its heartbeat every RUNNER_POLL_INTERVAL seconds;
+# it is considered gone after missing a few beats.
+RUNNER_POLL_INTERVAL = 5
+RUNNER_HEARTBEAT_TIMEOUT = 3 * RUNNER_POLL_INTERVAL
+
+# Summary of the activity scheduled when the update lag exceeds its threshold
+LAG_ACTIVITY_SUMMARY = "Telegram bot is lagging behind"
+
+# Seconds a run of the channel membership cron may spend before handing over to the next run
+MEMBERSHIP_SYNC_TIME_BUDGET = 240
+# Synced Telegram avatars are stored at most this large
+AVATAR_SIZE = (512, 512)
+# Profiles resolved per committed batch of the telegram_id backfill
+TELEGRAM_ID_BACKFILL_BATCH = 1000
 
 class TelegramConfig(models.Model):
     _name = 'telegram.config'
+    _inherit = ['mail.thread', 'mail.activity.mixin']
     _description = 'Telegram Configuration'
 
     auto_start = fields.Boolean(string="Auto-start on Boot", default=True)
+    run_mode = fields.Selection([
+        ('thread', 'Odoo Worker Thread'),
+        ('process', 'Standalone Process'),
+    ], string="Run Mode", default='thread', required=True,
+        help="Thread: the bot polls inside the Odoo server process.\n"
+             "Standalone Process: the bot is run by `odoo-bin telegram-bot -d <db>`, "
+             "which follows the Requested State stored on this record.")
+    requested_state = fields.Selection([
+        ('running', 'Running'),
+        ('stopped', 'Stopped'),
+    ], string="Requested State", default='stopped', required=True, copy=False)
+    runner_heartbeat = fields.Datetime(string="Runner Heartbeat", readonly=True, copy=False)
+    runner_pid = fields.Integer(string="Runner PID", readonly=True, copy=False)
+    bot_state = fields.Selection([
+        ('starting', 'Starting'),
+        ('running', 'Running'),
+        ('draining', 'Draining'),
+        ('stopped', 'Stopped'),
+        ('error', 'Error'),
+    ], string="Bot State", default='stopped', readonly=True, copy=False)
+    bot_state_message = fields.Char(string="State Details", readonly=True, copy=False)
+    restart_count = fields.Integer(string="Automatic Restarts", readonly=True, copy=False)
+    last_error = fields.Text(string="Last Error", readonly=True, copy=False)
+    last_error_date = fields.Datetime(string="Last Error On", readonly=True, copy=False)
+    lag_p95 = fields.Float(
+        string="Update Lag p95 (s)", readonly=True, copy=False,
+        help="Worst 95th percentile, over the update types, of the delay between the Telegram "
+             "date of an update and the end of its processing."
+    )
+    lag_report = fields.Html(string="Update Lag", readonly=True, copy=False, sanitize=False)
+    lag_updated_at = fields.Datetime(string="Lag Measured On", readonly=True, copy=False)
+    lag_alert_threshold = fields.Float(
+        string="Lag Alert Threshold (s)", default=10.0,
+        help="Alert when the update lag p95 exceeds this value. 0 disables the alert."
+    )
+    lag_alert_action = fields.Selection([
+        ('log', 'Log a Warning'),
+        ('activity', 'Schedule an Activity'),
+    ], string="Lag Alert", default='log', required=True)
+    last_update_id = fields.Integer(
+        string="Last Update ID", readonly=True, copy=False,
+        help="Highest update_id dispatched by the bot; polling resumes right after it. An update is "
+             "counted when its handlers start, so one interrupted by a crash is not processed again "
+             "(at-most-once delivery; the durable Postgres queue processes every update)."
+    )
+    update_window = fields.Char(
+        string="Recent Update IDs", readonly=True, copy=False,
+        help="Hex bitmap of the update_ids dispatched just below the Last Update ID, "
+             "used to drop redelivered updates."
+    )
+    update_ingestion = fields.Selection([
+        ('memory', 'In Memory'),
+        ('postgres', 'Durable Postgres Queue'),
+    ], string="Update Ingestion", default='memory', required=True,
+        help="In Memory: updates are processed straight from the polling queue.\n"
+             "Durable Postgres Queue: polled updates are first stored in telegram.update.queue, "
+             "then processed by consumers claiming them per chat partition, so nothing is lost "
+             "across restarts and extra `odoo-bin telegram-bot --consumers-only` processes can share the load.")
+    queue_partitions = fields.Integer(
+        string="Queue Partitions", default=8,
+        help="Updates are partitioned by chat; each partition is consumed in order by one consumer at a time."
+    )
+    queue_consumers = fields.Integer(string="Consumers per Process", default=4)
+    queue_processes = fields.Integer(
+        string="Consuming Processes", default=1,
+        help="Bot processes consuming the queue, the polling one included. Each process owns up to "
+             "partitions / processes partitions for as long as it runs, so a chat's conversation "
+             "always reaches the process holding its state."
+    )
+    queue_pending_count = fields.Integer(string="Pending Updates", compute="_compute_queue_pending_count")
+    persistence_interval = fields.Integer(
+        string="State Save Interval (s)", default=30,
+        help="Conversations and user data are saved in batches at this interval, "
+             "so a restart does not interrupt sign-ups. 0 keeps them in memory only."
+    )
+    conversation_timeout = fields.Integer(
+        string="Sign-up Idle Timeout (s)", default=600,
+        help="A registration left waiting for an answer longer than this is abandoned "
+             "and its data cleared. 0 disables the timeout."
+    )
+    conversation_secret_timeout = fields.Integer(
+        string="Password/OTP Idle Timeout (s)", default=300,
+        help="Shorter timeout for the steps holding a password or a one-time code."
+    )
+    data_max_users = fields.Integer(
+        string="Users Kept in Memory", default=10000,
+        help="Beyond this, the data of the least recently seen users is evicted from memory "
+             "(it stays saved in the database when state saving is enabled)."
+    )
+    data_max_chats = fields.Integer(string="Chats Kept in Memory", default=2000)
+    data_idle_ttl = fields.Integer(
+        string="Memory Idle TTL (s)", default=86400,
+        help="User and chat data untouched for this long is evicted from memory."
+    )
+    data_memory_report = fields.Char(string="Bot Data in Memory", readonly=True, copy=False)
+    link_warning_ttl = fields.Integer(
+        string="Link Warning Lifetime (s)", default=60,
+        help="Group warnings about forbidden links are deleted after this many seconds. 0 keeps them."
+    )
+    link_warning_cooldown = fields.Integer(
+        string="Link Warning Cooldown (s)", default=300,
+        help="Offending links are always deleted, but a user is warned (in the group and privately) "
+             "at most once per this many seconds."
+    )
+    raid_join_limit = fields.Integer(
+        string="Joins per Minute", default=15,
+        help="More joins than this in a chat within a minute switch it to lockdown. 0 disables it."
+    )
+    flood_message_limit = fields.Integer(
+        string="Messages per User per 10s", default=8,
+        help="A user sending more messages than this in a chat within 10 seconds switches it to lockdown. "
+             "0 disables it."
+    )
+    lockdown_duration = fields.Integer(
+        string="Lockdown Duration (s)", default=600,
+        help="During a lockdown new members are muted without being looked up or welcomed, "
+             "and flooding messages and links from non-admins are deleted in bulk."
+    )
+    spam_fingerprint_threshold = fields.Integer(
+        string="Repeated Content Limit", default=5,
+        help="A text or media posted more often than this, across all chats, within about one half-life "
+             "is deleted as spam. 0 disables the check."
+    )
+    spam_fingerprint_half_life = fields.Integer(
+        string="Repeated Content Half-life (s)", default=600,
+        help="How fast past occurrences stop counting: their weight halves every this many seconds."
+    )
+    breaker_failure_rate = fields.Integer(
+        string="Breaker Failure Rate (%)", default=50,
+        help="Odoo or the Bot API is considered down when this share of the calls of the last 30 seconds "
+             "failed or were slow; calls then fail fast until a trial call succeeds."
+    )
+    breaker_slow_call = fields.Float(string="Slow Call (s)", default=2.0)
+    breaker_reset_timeout = fields.Integer(
+        string="Breaker Retry After (s)", default=30,
+        help="How long calls are refused before a trial call is let through."
+    )
+    shedding_policy = fields.Selection([
+        ('off', 'Keep Everything'),
+        ('skip', 'Skip Non-essential Work'),
+        ('defer', 'Postpone Non-essential Work'),
+    ], string="Under Overload", default='skip', required=True,
+        help="What happens to welcome messages, greetings and profile enrichment while Odoo "
+             "or the Bot API is down. Moderation deletes always go on.")
+    http_pool_size = fields.Integer(
+        string="API Connections", default=32,
+        help="Connections shared by the Bot API calls of the handlers; raise it when "
+             "the pool wait counters grow."
+    )
+    polling_pool_size = fields.Integer(
+        string="Polling Connections", default=1,
+        help="Separate pool used by getUpdates, so polling never waits behind the handlers."
+    )
+    http2 = fields.Boolean(string="HTTP/2", help="Requires the `h2` package (httpx[http2]).")
+    http_keepalive = fields.Boolean(string="Keep-alive", default=True)
+    http_keepalive_expiry = fields.Float(string="Keep-alive Expiry (s)", default=30.0)
+    http_connect_timeout = fields.Float(string="Connect Timeout (s)", default=5.0)
+    http_read_timeout = fields.Float(string="Read Timeout (s)", default=5.0)
+    http_write_timeout = fields.Float(string="Write Timeout (s)", default=5.0)
+    http_pool_timeout = fields.Float(
+        string="Pool Timeout (s)", default=1.0,
+        help="How long a request may wait for a free connection before failing."
+    )
+    http_pool_report = fields.Char(string="Connection Pool Waits", readonly=True, copy=False)
+    profile_cpu = fields.Boolean(
+        string="CPU Profile", help="cProfile statistics (pstats) and sampled stacks (collapsed, for flame graphs) "
+                                   "of the bot's event loop thread."
+    )
+    profile_memory = fields.Boolean(
+        string="Memory Allocations", help="tracemalloc snapshots at start and end, diffed by allocation site."
+    )
+    profile_handlers = fields.Boolean(string="Handler Calls", help="Calls and time of every handler, as CSV.")
+    profile_duration = fields.Integer(string="Profiling Duration (s)", default=60)
+    profile_state = fields.Selection([
+        ('idle', 'Idle'),
+        ('requested', 'Requested'),
+        ('running', 'Running'),
+    ], string="Profiling", default='idle', required=True, readonly=True, copy=False)
+    profile_report = fields.Char(string="Last Profile", readonly=True, copy=False)
+    event_log_level = fields.Selection([
+        ('debug', 'Debug'),
+        ('info', 'Info'),
+        ('warning', 'Warning'),
+        ('error', 'Error'),
+    ], string="Handler Log Level", default='warning', required=True,
+        help="Level of the structured events of the busy handlers (link filter, welcome, membership checks...), "
+             "unless a rule below overrides it."
+    )
+    event_log_sample_rate = fields.Float(
+        string="Sampled Events (%)", default=100.0,
+        help="Share of the debug and info events logged; warnings and errors are always logged."
+    )
+    event_log_rule_ids = fields.One2many('telegram.log.rule', 'config_id', string="Per-Handler Logging")
+    trace_sample_ratio = fields.Float(
+        string="Sampled Updates (%)", default=0.0,
+        help="Share of the updates traced: one span for the update, each handler, "
+             "each Bot API call and each Odoo cursor. 0 disables tracing."
+    )
+    trace_exporter = fields.Selection([
+        ('file', 'JSON Lines File'),
+        ('otlp', 'OTLP/HTTP Collector'),
+    ], string="Trace Export", default='file')
+    trace_file = fields.Char(string="Trace File", help="Path of the JSON Lines file the spans are appended to.")
+    trace_file_size = fields.Integer(
+        string="Trace File Size (MB)", default=50,
+        help="The file is rotated past this size; 5 rotated files are kept."
+    )
+    trace_endpoint = fields.Char(
+        string="Collector Endpoint", help="OTLP/HTTP traces URL, e.g. http://localhost:4318/v1/traces."
+    )
+    record_updates = fields.Boolean(
+        string="Record Updates",
+        help="Append every update received to compressed segment files, "
+             "for replaying them with odoo-bin telegram-replay. Applied on the next start."
+    )
+    record_directory = fields.Char(string="Recording Directory", help="Directory of the segment files.")
+    record_segment_size = fields.Integer(
+        string="Segment Size (MB)", default=64,
+        help="A new segment file is started once the current one reaches this compressed size."
+    )
+    membership_sync_batch = fields.Integer(string="Profiles per Batch", default=200)
+    membership_sync_concurrency = fields.Integer(string="Parallel Calls", default=5)
+    membership_sync_rate = fields.Float(
+        string="Calls per Second", default=20.0,
+        help="Paces the membership and profile syncs below Telegram's limit of about 30 requests "
+             "per second per bot."
+    )
+    membership_sync_cursor = fields.Integer(
+        string="Membership Sync Position", readonly=True, copy=False,
+        help="Last profile checked by the pass in progress; the next cron run resumes after it."
+    )
+    membership_synced_at = fields.Datetime(string="Last Full Membership Pass", readonly=True, copy=False)
+    profile_sync_batch = fields.Integer(string="Partners per Batch", default=100)
+    profile_sync_cursor = fields.Integer(
+        string="Profile Sync Position", readonly=True, copy=False,
+        help="Last partner synced by the pass in progress; the next cron run resumes after it."
+    )
+    profile_synced_at = fields.Datetime(string="Last Full Profile Pass", readonly=True, copy=False)
+    drain_timeout = fields.Integer(
+        string="Drain Timeout (s)", default=10,
+        help="On stop, updates already fetched are processed for at most this many seconds."
+    )
 
     name = fields.Char(default="Bot Config")
     bot_token = fields.Char(string="Token", required=True)
@@ -30,6 +293,15 @@ class TelegramConfig(models.Model):
         default="start,setup_post,hello",
         help="Comma-separated list of allowed commands"
     )
+    gate_channel_ids = fields.One2many(
+        'telegram.gate.channel', 'config_id', string="Required Channels",
+        help="Channels users must have joined, per group. Without any line, only the Channel ID is required."
+    )
+    gate_cache_ttl = fields.Integer(
+        string="Membership Cache (s)", default=300,
+        help="How long a membership read from Telegram is trusted, per channel. "
+             "Non-members are checked again after a tenth of it, at most a minute, so joining takes effect quickly."
+    )
 
 
 
@@ -40,11 +312,23 @@ class TelegramConfig(models.Model):
     )
 
     def _compute_bot_running(self):
-        """ Checks if the global bot thread is alive """
-        global BOT_THREAD
-        status = bool(BOT_THREAD and BOT_THREAD.is_alive())
+        """ Checks if the bot thread of this process (or the standalone runner) is alive """
+        for record in self:
+            record.bot_running = record._is_bot_alive()
+
+    def _is_bot_alive(self):
+        self.ensure_one()
+        if self.run_mode == 'process':
+            limit = fields.Datetime.now() - timedelta(seconds=RUNNER_HEARTBEAT_TIMEOUT)
+            return bool(self.runner_heartbeat and self.runner_heartbeat >= limit)
+        return get_manager().is_running(self.id)
+
+    def _compute_queue_pending_count(self):
+        counts = dict(self.env['telegram.update.queue']._read_group(
+            [('config_id', 'in', self.ids), ('state', '=', 'pending')], ['config_id'], ['__count'],
+        ))
         for record in self:
-            record.bot_running = status
+            record.queue_pending_count = counts.get(record, 0)
 
     bot_status = fields.Selection([
         ('running', 'Live'),
@@ -52,10 +336,8 @@ class TelegramConfig(models.Model):
     ], compute="_compute_bot_status", string="Status")
 
     def _compute_bot_status(self):
-        global BOT_THREAD
-        is_alive = bool(BOT_THREAD and BOT_THREAD.is_alive())
         for record in self:
-            record.bot_status = 'running' if is_alive else 'stopped'
+            record.bot_status = 'running' if record._is_bot_alive() else 'stopped'
 
 
 
@@ -65,12 +347,23 @@ class TelegramConfig(models.Model):
         We use it to auto-start the bot thread if a configuration exists.
         """
         super(TelegramConfig, self)._register_hook()
+        started = time.perf_counter()
+        try:
+            self._auto_start_bots()
+        finally:
+            startup.record('register_hook', started)
+            startup.report()
 
+    def _auto_start_bots(self):
         if tools.config['workers'] != 0:
             return
         # Only start configurations marked for auto-start
         # configs = self.env['telegram.config'].search([('auto_start', '=', True)])
-        configs = self.env['telegram.config'].sudo().search([('auto_start', '=', True)])
+        # Standalone-process configs are owned by `odoo-bin telegram-bot`.
+        configs = self.env['telegram.config'].sudo().search([
+            ('auto_start', '=', True),
+            ('run_mode', '=', 'thread'),
+        ])
         for config in configs:
             _logger.info("Auto-starting Telegram Bot during Odoo startup...")
             _logger.info("Auto-starting Telegram Bot: %s", config.name)
@@ -78,62 +371,293 @@ class TelegramConfig(models.Model):
 
 
 
-    def action_start_bot(self):
-        global BOT_THREAD
-        if BOT_THREAD and BOT_THREAD.is_alive():
-            return  # Already running
+    @api.model
+    def _cron_sync_channel_membership(self):
+        for config in self.search([('channel_id', '!=', False)]):
+            config._sync_channel_membership()
+
+    def _sync_channel_membership(self, time_budget=MEMBERSHIP_SYNC_TIME_BUDGET):
+        """ Store the channel status of every profile having a telegram_id, batch after batch.
+
+        Each batch is committed with the position reached, so a pass spans
+        as many cron runs as needed and survives interruptions.
+        """
+        from ..services.membership import sync_channel_statuses
+
+        self.ensure_one()
+        Profile = self.env['myfans.user'].sudo()
+        deadline = time.monotonic() + time_budget
+        while time.monotonic() < deadline:
+            profiles = Profile.search([
+                ('telegram_id', '!=', False),
+                ('id', '>', self.membership_sync_cursor),
+            ], order='id', limit=max(1, self.membership_sync_batch))
+            if not profiles:
+                self.write({'membership_sync_cursor': 0, 'membership_synced_at': fields.Datetime.now()})
+                break
+            statuses = sync_channel_statuses(
+                self.bot_token, self.channel_id, set(profiles.mapped('telegram_id')),
+                self.membership_sync_concurrency or 1, self.membership_sync_rate or 1,
+            )
+            for status in set(statuses.values()):
+                profiles.filtered(lambda p: statuses.get(p.telegram_id) == status)._set_telegram_channel_status(
+                    self.channel_id, status,
+                )
+            self.membership_sync_cursor = profiles[-1].id
+            self.env.cr.commit()
 
+    @api.model
+    def _cron_sync_telegram_profiles(self):
+        for config in self.search([('bot_token', '!=', False)]):
+            config._sync_telegram_profiles()
 
-        # Build the config dictionary to pass to the thread
-        config_data = {
+    def _sync_telegram_profiles(self, time_budget=MEMBERSHIP_SYNC_TIME_BUDGET):
+        """ Refresh the bio and avatar of the partners having a telegram_id, batch after batch.
+
+        A photo is only downloaded (and resized) when its file_unique_id
+        differs from the one stored on the partner. Batches are committed
+        with the position reached, like the membership reconciliation.
+        """
+        from ..services.profile_sync import sync_profile_changes
+
+        self.ensure_one()
+        Partner = self.env['res.partner'].sudo()
+        deadline = time.monotonic() + time_budget
+        while time.monotonic() < deadline:
+            partners = Partner.search([
+                ('telegram_id', '!=', False),
+                ('id', '>', self.profile_sync_cursor),
+            ], order='id', limit=max(1, self.profile_sync_batch))
+            if not partners:
+                self.write({'profile_sync_cursor': 0, 'profile_synced_at': fields.Datetime.now()})
+                break
+            changes = sync_profile_changes(
+                self.bot_token,
+                [(partner.id, partner.telegram_id, partner.telegram_photo_unique_id) for partner in partners],
+                self.membership_sync_concurrency or 1, self.membership_sync_rate or 1,
+            )
+            now = fields.Datetime.now()
+            for partner in partners.filtered(lambda p: p.id in changes):
+                change = changes[partner.id]
+                vals = {'telegram_profile_synced_at': now}
+                if change['bio'] != (partner.telegram_bio or ''):
+                    vals['telegram_bio'] = change['bio']
+                if change['photo_unique_id'] != partner.telegram_photo_unique_id:
+                    # A removed Telegram photo keeps the current avatar
+                    vals['telegram_photo_unique_id'] = change['photo_unique_id']
+                if change.get('photo'):
+                    try:
+                        vals['image_1920'] = base64.b64encode(tools.image_process(change['photo'], size=AVATAR_SIZE))
+                    except Exception as e:
+                        _logger.warning("Invalid Telegram photo for partner %s: %s", partner.id, e)
+                        vals.pop('telegram_photo_unique_id', None)
+                partner.write(vals)
+            self.profile_sync_cursor = partners[-1].id
+            self.env.cr.commit()
+
+    @api.model
+    def _cron_backfill_telegram_ids(self):
+        self._backfill_telegram_ids()
+
+    @api.model
+    def _backfill_telegram_ids(self, batch_size=TELEGRAM_ID_BACKFILL_BATCH):
+        """ Fill the telegram_id of the profiles and partners only knowing a telegram_username.
+
+        Usernames are resolved through ``telegram.seen.user`` (users observed
+        by the bot or imported from a member export). A username shared by
+        several records, or resolving to an id another record already holds,
+        is left alone. Batches are committed; returns the number of records
+        filled.
+        """
+        SeenUser = self.env['telegram.seen.user'].sudo()
+        filled = 0
+        for model in ('myfans.user', 'res.partner'):
+            Records = self.env[model].sudo().with_context(active_test=False)
+            last_id = 0
+            while True:
+                records = Records.search([
+                    ('telegram_username', '!=', False),
+                    ('telegram_id', '=', False),
+                    ('id', '>', last_id),
+                ], order='id', limit=batch_size)
+                if not records:
+                    break
+                last_id = records[-1].id
+                by_username = {}
+                for record in records:
+                    by_username.setdefault(record.telegram_username.lstrip('@').lower(), []).append(record)
+                seen = SeenUser.search([('username', 'in', list(by_username))])
+                taken = set(Records.search([('telegram_id', 'in', seen.mapped('telegram_id'))]).mapped('telegram_id'))
+                for seen_user in seen:
+                    matches = by_username[seen_user.username]
+                    if len(matches) == 1 and seen_user.telegram_id not in taken:
+                        matches[0].telegram_id = seen_user.telegram_id
+                        filled += 1
+                self.env.cr.commit()
+            _logger.info("Telegram id backfill: %s %s records resolved so far", filled, model)
+        return filled
+
+    def _prepare_bot_config(self):
+        """ Snapshot of the record handed to the bot thread. """
+        self.ensure_one()
+        return {
             'CHANNEL_LINK': self.channel_link,
             'GROUP_LINK': self.group_invite_link,
             'CHANNEL_ID': self.channel_id,
+            'GATE_CHANNELS': tuple(
+                (line.group_id or '', line.channel_id, line.channel_link or False) for line in self.gate_channel_ids
+            ),
+            'GATE_CACHE_TTL': self.gate_cache_ttl,
             'OWNER_ID': self.owner_id,
             'DASHBOARD_URL': self.dashboard_url,
             'BOT_INBOX_URL': self.bot_inbox_url,
             'TELEGRAM_WEB_APP_URL': self.telegram_web_app_url,
             'WEBSITE_NAME': self.website_name,
             'LOG_FILE': self.log_message_id,
-            'ALLOWED_COMMANDS': [cmd.strip() for cmd in self.allowed_commands.split(',')]
+            'ALLOWED_COMMANDS': [cmd.strip() for cmd in self.allowed_commands.split(',')],
+            'DRAIN_TIMEOUT': self.drain_timeout,
+            'LAST_UPDATE_ID': self.last_update_id,
+            'UPDATE_WINDOW': self.update_window,
+            'UPDATE_INGESTION': self.update_ingestion,
+            'QUEUE_PARTITIONS': self.queue_partitions,
+            'QUEUE_CONSUMERS': self.queue_consumers,
+            'QUEUE_PROCESSES': self.queue_processes,
+            'PERSISTENCE_INTERVAL': self.persistence_interval,
+            'CONVERSATION_TIMEOUT': self.conversation_timeout,
+            'CONVERSATION_SECRET_TIMEOUT': self.conversation_secret_timeout,
+            'DATA_MAX_USERS': self.data_max_users,
+            'DATA_MAX_CHATS': self.data_max_chats,
+            'DATA_IDLE_TTL': self.data_idle_ttl,
+            'LINK_WARNING_TTL': self.link_warning_ttl,
+            'LINK_WARNING_COOLDOWN': self.link_warning_cooldown,
+            'RAID_JOIN_LIMIT': self.raid_join_limit,
+            'FLOOD_MESSAGE_LIMIT': self.flood_message_limit,
+            'LOCKDOWN_DURATION': self.lockdown_duration,
+            'SPAM_FINGERPRINT_THRESHOLD': self.spam_fingerprint_threshold,
+            'SPAM_FINGERPRINT_HALF_LIFE': self.spam_fingerprint_half_life,
+            'BREAKER_FAILURE_RATE': self.breaker_failure_rate,
+            'BREAKER_SLOW_CALL': self.breaker_slow_call,
+            'BREAKER_RESET_TIMEOUT': self.breaker_reset_timeout,
+            'SHEDDING_POLICY': self.shedding_policy,
+            'HTTP_POOL_SIZE': self.http_pool_size,
+            'POLLING_POOL_SIZE': self.polling_pool_size,
+            'HTTP2': self.http2,
+            'HTTP_KEEPALIVE': self.http_keepalive,
+            'HTTP_KEEPALIVE_EXPIRY': self.http_keepalive_expiry,
+            'HTTP_CONNECT_TIMEOUT': self.http_connect_timeout,
+            'HTTP_READ_TIMEOUT': self.http_read_timeout,
+            'HTTP_WRITE_TIMEOUT': self.http_write_timeout,
+            'HTTP_POOL_TIMEOUT': self.http_pool_timeout,
+            'TRACE_SAMPLE_RATIO': self.trace_sample_ratio / 100,
+            'EVENT_LOG_LEVEL': self.event_log_level,
+            'EVENT_LOG_SAMPLE_RATE': self.event_log_sample_rate / 100,
+            'EVENT_LOG_RULES': tuple(
+                (rule.handler, rule.level, rule.sample_rate / 100) for rule in self.event_log_rule_ids
+            ),
+            'TRACE_EXPORTER': self.trace_exporter,
+            'TRACE_FILE': self.trace_file,
+            'TRACE_FILE_SIZE': self.trace_file_size,
+            'TRACE_ENDPOINT': self.trace_endpoint,
+            'RECORD_DIRECTORY': self.record_updates and self.record_directory,
+            'RECORD_SEGMENT_SIZE': self.record_segment_size,
         }
-        # Pass the database name and registry so the thread can access models
-        BOT_THREAD = TelegramBotThread(
-            self.env.cr.dbname,
-            self.bot_token,
-            config_data
+
+    def _set_bot_state(self, state, message=False):
+        """ Store the lifecycle state and push it to the open forms through the bus. """
+        self.write({'bot_state': state, 'bot_state_message': message})
+        for record in self:
+            self.env['bus.bus']._sendone(BUS_CHANNEL, 'telegram_bot_state', {
+                'id': record.id,
+                'state': state,
+                'message': message,
+            })
+
+    def _store_lag_metrics(self, snapshot):
+        """ Store the rolling lag percentiles sent by the bot and alert when they exceed the threshold.
+
+        :param snapshot: ``{update_type: {'count', 'dequeue_p95', 'p50', 'p95', 'p99', 'max'}}``
+        """
+        self.ensure_one()
+        if not snapshot:
+            self.write({'lag_p95': 0.0, 'lag_updated_at': fields.Datetime.now(), 'lag_report': False})
+            return
+        worst = max(stats['p95'] for stats in snapshot.values())
+        rows = "".join(
+            "<tr><td>%s</td><td>%d</td><td>%.2f</td><td>%.2f</td><td>%.2f</td><td>%.2f</td><td>%.2f</td></tr>" % (
+                update_type, stats['count'], stats['dequeue_p95'],
+                stats['p50'], stats['p95'], stats['p99'], stats['max'],
+            )
+            for update_type, stats in sorted(snapshot.items())
         )
-        BOT_THREAD.start()
+        self.write({
+            'lag_p95': worst,
+            'lag_updated_at': fields.Datetime.now(),
+            'lag_report': (
+                "<table class='table table-sm'><thead><tr><th>Update</th><th>Samples</th>"
+                "<th>Dequeued p95</th><th>p50</th><th>p95</th><th>p99</th><th>Max</th></tr></thead>"
+                "<tbody>%s</tbody></table>" % rows
+            ),
+        })
 
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'reload',
-        }
+        if not self.lag_alert_threshold or worst <= self.lag_alert_threshold:
+            return
+        _logger.warning(
+            "Telegram bot %s is behind: update lag p95 %.1fs exceeds %.1fs",
+            self.name, worst, self.lag_alert_threshold,
+        )
+        warning = self.env.ref('mail.mail_activity_data_warning')
+        open_alert = self.activity_ids.filtered(
+            lambda activity: activity.activity_type_id == warning and activity.summary == LAG_ACTIVITY_SUMMARY
+        )
+        if self.lag_alert_action == 'activity' and not open_alert:
+            self.activity_schedule(
+                'mail.mail_activity_data_warning',
+                summary=LAG_ACTIVITY_SUMMARY,
+                note="Update lag p95 reached %.1fs (threshold %.1fs)." % (worst, self.lag_alert_threshold),
+                user_id=self.create_uid.id or self.env.ref('base.user_admin').id,
+            )
 
+    def _record_bot_failure(self, error, delay):
+        """ Called by the supervisor when a bot crashed or stalled and is about to be restarted. """
+        for record in self:
+            record.write({
+                'restart_count': record.restart_count + 1,
+                'last_error': error,
+                'last_error_date': fields.Datetime.now(),
+            })
+        self._set_bot_state('error', "%s - restarting in %ds" % (error, delay))
+
+    def action_start_bot(self):
+        """ Record the request and return; the transition happens in the background. """
+        self.requested_state = 'running'
+        for record in self.filtered(lambda c: c.run_mode == 'thread'):
+            record._set_bot_state('starting')
+            record._request_lifecycle('start')
+        # Standalone-process configs are picked up by the runner on its next poll
+        return True
 
     def action_stop_bot(self):
-        global BOT_THREAD
-        if BOT_THREAD:
-            try:
-                # Call the updated stop method
-                BOT_THREAD.stop_polling()
-                
-                # Wait for thread to finish for a max of 5 seconds
-                BOT_THREAD.join(timeout=5)
-                
-                if BOT_THREAD.is_alive():
-                    _logger.warning("Telegram thread did not exit cleanly, forcing cleanup.")
-            except Exception as e:
-                _logger.error(f"Error stopping bot thread: {e}")
-            finally:
-                # ALWAYS set to None so the 'Start' button becomes available again
-                BOT_THREAD = None
-        
-        # Trigger a UI refresh to update the status badge
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'reload',
-        }
+        self.requested_state = 'stopped'
+        for record in self.filtered(lambda c: c.run_mode == 'thread'):
+            record._set_bot_state('draining')
+            record._request_lifecycle('stop')
+        return True
+
+    def action_start_profiling(self):
+        """ Ask the running bot to profile itself; the results are posted on the record as attachments. """
+        for record in self:
+            if not (record.profile_cpu or record.profile_memory or record.profile_handlers):
+                raise UserError("Select what to profile first.")
+            if record.bot_state != 'running':
+                raise UserError("The bot must be running to be profiled.")
+        self.profile_state = 'requested'
+        return True
+
+    def _request_lifecycle(self, action):
+        """ Hand the transition over to the lifecycle manager once our transaction is committed. """
+        dbname, config_id = self.env.cr.dbname, self.id
+        self.env.cr.postcommit.add(lambda: get_manager().request(dbname, config_id, action))
+
     # def action_stop_bot(self):
     #     global BOT_THREAD
     #     if BOT_THREAD:
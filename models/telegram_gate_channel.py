@@ -0,0 +1,28 @@
+from odoo import models, fields
+
+
+class TelegramGateChannel(models.Model):
+    """
+    A channel users must have joined to take part in a group. The lines
+    with a Group Chat ID make up the rule of that group; the lines without
+    apply to every other chat. Without any line, only the Channel ID of the
+    configuration is required. The bot checks the channels of a rule
+    concurrently, see ``TelegramBotThread.is_member``.
+    """
+    _name = 'telegram.gate.channel'
+    _description = 'Telegram Gate Channel'
+    _order = 'config_id, group_id, sequence, id'
+    _rec_name = 'channel_id'
+
+    config_id = fields.Many2one('telegram.config', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(default=10)
+    group_id = fields.Char(
+        string="Group Chat ID",
+        help="Numeric id of the group this channel is required for, e.g. -1001234567890. "
+             "Leave empty to require it in every group without a rule of its own, and in private."
+    )
+    channel_id = fields.Char(string="Channel", required=True, help="@username or numeric id of the channel.")
+    channel_link = fields.Char(
+        string="Join Link",
+        help="Link of the join button; defaults to https://t.me/<username> for public channels."
+    )
@@ -0,0 +1,33 @@
+from odoo import models, fields
+
+from ..services.eventlog import HANDLERS
+
+LEVEL_SELECTION = [
+    ('debug', 'Debug'),
+    ('info', 'Info'),
+    ('warning', 'Warning'),
+    ('error', 'Error'),
+]
+
+
+class TelegramLogRule(models.Model):
+    """
+    Level and sample rate of the events of one handler, overriding the
+    defaults of the configuration. Applied live by the running bot, see
+    services/eventlog.py.
+    """
+    _name = 'telegram.log.rule'
+    _description = 'Telegram Handler Log Rule'
+    _rec_name = 'handler'
+
+    config_id = fields.Many2one('telegram.config', required=True, ondelete='cascade', index=True)
+    handler = fields.Selection(HANDLERS, required=True)
+    level = fields.Selection(LEVEL_SELECTION, required=True, default='info')
+    sample_rate = fields.Float(
+        string="Sampled (%)", default=100.0,
+        help="Share of the debug and info events logged; warnings and errors are always logged."
+    )
+
+    _sql_constraints = [
+        ('handler_uniq', 'unique(config_id, handler)', "A handler has one log rule per configuration."),
+    ]
@@ -0,0 +1,23 @@
+from datetime import timedelta
+from odoo import models, fields, api
+
+
+class TelegramMessageExpiry(models.Model):
+    """
+    Transient messages posted by the bot (warnings, status notices) and the
+    time they must be deleted at. The bot deletes the due ones in bulk (see
+    services/expiry.py); being stored, the schedule survives restarts.
+    """
+    _name = 'telegram.message.expiry'
+    _description = 'Telegram Message Expiry'
+    _order = 'expire_at, id'
+
+    config_id = fields.Many2one('telegram.config', required=True, ondelete='cascade', index=True)
+    chat_id = fields.Char(string="Chat ID", required=True)
+    message_id = fields.Integer(string="Message ID", required=True)
+    expire_at = fields.Datetime(string="Delete At", required=True, index=True)
+
+    @api.autovacuum
+    def _gc_stale_expiries(self):
+        """ Telegram refuses to delete bot messages older than 48h: drop what the bot missed. """
+        self.search([('expire_at', '<', fields.Datetime.now() - timedelta(days=2))]).unlink()
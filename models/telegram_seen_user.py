@@ -0,0 +1,22 @@
+from odoo import models, fields
+
+
+class TelegramSeenUser(models.Model):
+    """
+    Telegram id / username pairs the bot has observed in updates (senders,
+    joining members, member changes) or imported from a member export.
+    They let the id backfill resolve profiles that only know a username;
+    usernames are stored lowercase, the most recent owner of a username
+    wins. See services/seen_users.py.
+    """
+    _name = 'telegram.seen.user'
+    _description = 'Telegram Seen User'
+    _rec_name = 'username'
+
+    telegram_id = fields.Char(string="Telegram ID", required=True)
+    username = fields.Char(required=True, index=True)
+    seen_at = fields.Datetime(string="Last Seen", required=True, default=fields.Datetime.now)
+
+    _sql_constraints = [
+        ('telegram_id_uniq', 'unique(telegram_id)', "A Telegram user is recorded once."),
+    ]
@@ -0,0 +1,25 @@
+from odoo import models, fields
+
+
+class TelegramUnreachableUser(models.Model):
+    """
+    Users a bot cannot write to privately: they never started it, blocked
+    it, or were refused with ``Forbidden``. Keyed by the bot id (the numeric
+    prefix of the token) so every process and configuration running the
+    same bot shares it; a user becoming reachable again simply loses its row.
+    See services/reachability.py.
+    """
+    _name = 'telegram.unreachable.user'
+    _description = 'Telegram Unreachable User'
+    _rec_name = 'user_id'
+
+    bot_id = fields.Char(string="Bot ID", required=True, index=True)
+    user_id = fields.Char(string="Telegram User ID", required=True)
+    reason = fields.Selection([
+        ('forbidden', 'Private Message Refused'),
+        ('blocked', 'Bot Blocked'),
+    ], required=True, default='forbidden')
+
+    _sql_constraints = [
+        ('user_uniq', 'unique(bot_id, user_id)', "A user is listed once per bot."),
+    ]
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from odoo import models, fields, api
+
+# Days a failed update is kept for inspection before the autovacuum deletes it
+FAILED_RETENTION_DAYS = 7
+
+
+class TelegramUpdateQueue(models.Model):
+    """
+    Durable log of raw Telegram updates, filled by the polling bot when
+    telegram.config uses the 'postgres' ingestion and drained by consumers
+    (see services/update_queue.py) with ``FOR UPDATE SKIP LOCKED``.
+    """
+    _name = 'telegram.update.queue'
+    _description = 'Telegram Update Queue'
+    _order = 'id'
+
+    config_id = fields.Many2one('telegram.config', required=True, ondelete='cascade', index=True)
+    update_id = fields.Integer(string="Update ID", required=True)
+    chat_id = fields.Char(string="Chat ID")
+    partition = fields.Integer(
+        string="Partition", required=True,
+        help="Chat id modulo the number of partitions: updates of one partition are consumed in order."
+    )
+    payload = fields.Text(string="Raw Update", required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], default='pending', required=True, index=True)
+    attempts = fields.Integer(default=0)
+    error = fields.Text()
+
+    _sql_constraints = [
+        ('update_uniq', 'unique(config_id, update_id)', "An update can only be queued once per bot."),
+    ]
+
+    def init(self):
+        # Consumers look up the oldest pending rows of a partition
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS telegram_update_queue_pending_idx
+            ON telegram_update_queue (config_id, partition, id) WHERE state = 'pending'
+        """)
+
+    @api.autovacuum
+    def _gc_processed_updates(self):
+        """ Processed updates are only kept for a day, failed ones (raw user data) for a week. """
+        now = fields.Datetime.now()
+        self.search([
+            '|',
+            '&', ('state', '=', 'done'), ('write_date', '<', now - timedelta(days=1)),
+            '&', ('state', '=', 'failed'), ('write_date', '<', now - timedelta(days=FAILED_RETENTION_DAYS)),
+        ]).unlink()
@@ -1 +1,3 @@
-from . import telegram_worker
\ No newline at end of file
+# The bot implementation (telegram_worker) pulls in python-telegram-bot and
+# httpx; it is imported on demand when a bot is actually started.
+from . import startup
@@ -0,0 +1,49 @@
+import contextlib
+import time
+
+from telegram.ext import Application
+
+
+class BotApplication(Application):
+    """
+    Application with two extension points around :meth:`process_update`:
+
+    * ``update_gates``: callables receiving the update and returning False to
+      drop it before any handler sees it;
+    * ``update_observers``: callables receiving ``(update, dequeued_at,
+      finished_at)`` as epoch seconds for every processed update.
+
+    Wrapping :meth:`process_update` rather than adding handlers keeps both
+    reliable when a handler stops the propagation of the update.
+
+    With a ``tracer`` (see services/tracing.py), each dispatched update is
+    the root span of a trace.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.update_gates = []
+        self.update_observers = []
+        self.tracer = None
+
+    async def process_update(self, update):
+        if all(gate(update) for gate in self.update_gates):
+            await self.dispatch_update(update)
+
+    async def dispatch_update(self, update):
+        """ Run the handlers on ``update`` without consulting the gates.
+
+        Used for updates that already went through them, e.g. those read back
+        from the durable update queue.
+        """
+        dequeued_at = time.time()
+        trace = contextlib.nullcontext()
+        if self.tracer:
+            trace = self.tracer.trace('update', update_id=getattr(update, 'update_id', None) or 0)
+        try:
+            with trace:
+                await super().process_update(update)
+        finally:
+            finished_at = time.time()
+            for observer in self.update_observers:
+                observer(update, dequeued_at, finished_at)
@@ -0,0 +1,96 @@
+import types
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Keys of the telegram.config snapshot holding state the bot writes back, not settings
+STATE_KEYS = frozenset({'LAST_UPDATE_ID', 'UPDATE_WINDOW'})
+
+
+def config_settings(data):
+    """ The settings of a snapshot, without the runtime state: what a reload compares. """
+    return {key: value for key, value in data.items() if key not in STATE_KEYS}
+
+
+def _url_keyboard(*rows):
+    """ One URL button per row; rows whose URL is not configured are left out. """
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, url=url)] for text, url in rows if url])
+
+
+def _channel_url(channel_id, link=None):
+    if link:
+        return link
+    if channel_id.lstrip('-').isdigit():
+        return None  # private channel without an invite link
+    return f"https://t.me/{channel_id.lstrip('@')}"
+
+
+def _gate_rules(config):
+    """ ``{group chat id: ((channel, join link), ...)}``; ``''`` holds the default rule. """
+    rules = {}
+    for group_id, channel_id, link in config.get('GATE_CHANNELS') or ():
+        rules.setdefault(group_id.strip(), []).append((channel_id.strip(), _channel_url(channel_id.strip(), link)))
+    if '' not in rules:
+        main = (config.get('CHANNEL_ID') or '').strip()
+        rules[''] = [(main, _channel_url(main))] if main else []
+    return types.MappingProxyType({group_id: tuple(channels) for group_id, channels in rules.items()})
+
+
+def _join_keyboard(channels):
+    if len(channels) == 1:
+        return _url_keyboard(("Join Channel 📢", channels[0][1]))
+    return _url_keyboard(*((f"Join {channel_id} 📢", url) for channel_id, url in channels))
+
+
+def freeze_bot_config(data):
+    """
+    Read-only view of a ``telegram.config`` snapshot (see
+    ``_prepare_bot_config``), with what the handlers derive from it built
+    once instead of on every update:
+
+    * ``ALLOWED_COMMANDS`` is a frozenset;
+    * ``OWNER_ID`` is an int, compared with Telegram user ids (None when unset);
+    * ``KEYBOARDS`` maps names to the ``InlineKeyboardMarkup`` made of the
+      configured links (Telegram objects are immutable, so they are shared);
+      ``access`` links to the bot itself, from the ``BOT_USERNAME`` the
+      worker adds once the bot is initialized;
+    * ``GATE_RULES`` maps group chat ids (``''`` for the default rule) to
+      the ``(channel, join link)`` users must have joined, and
+      ``GATE_KEYBOARDS`` the same keys to their join buttons.
+
+    A new view is built and swapped in whole when the record changes, so a
+    handler never sees half of an update.
+    """
+    config = dict(data)
+    config['ALLOWED_COMMANDS'] = frozenset(config.get('ALLOWED_COMMANDS') or ())
+    owner_id = str(config.get('OWNER_ID') or '').strip()
+    config['OWNER_ID'] = int(owner_id) if owner_id.lstrip('-').isdigit() else None
+    login = ("Login to your account🔗", config.get('TELEGRAM_WEB_APP_URL'))
+    browser_login = ("Browser Login🔗", config.get('DASHBOARD_URL'))
+    inbox_url = config.get('BOT_INBOX_URL')
+    config['KEYBOARDS'] = types.MappingProxyType({
+        'registered': _url_keyboard(
+            login, browser_login,
+            ("Back to Channel", config.get('CHANNEL_LINK')),
+            ("Join Group", config.get('GROUP_LINK')),
+        ),
+        'link_help': _url_keyboard(
+            login,
+            ("Back to Channel", config.get('CHANNEL_LINK')),
+            ("Back to Group", config.get('GROUP_LINK')),
+        ),
+        'verified': _url_keyboard(
+            ("Go to Channel", config.get('CHANNEL_LINK')),
+            ("Go to Group", config.get('GROUP_LINK')),
+            login, browser_login,
+        ),
+        'assistant': _url_keyboard(("Go to your Assistant📢", inbox_url and f"{inbox_url}?start=join")),
+        'access': _url_keyboard((
+            f"Get Access to {config.get('WEBSITE_NAME') or 'Myfansbook'} Group 🚀",
+            config.get('BOT_USERNAME') and f"https://t.me/{config['BOT_USERNAME']}?start=join",
+        )),
+    })
+    config['GATE_RULES'] = _gate_rules(config)
+    config['GATE_KEYBOARDS'] = types.MappingProxyType({
+        group_id: _join_keyboard(channels) for group_id, channels in config['GATE_RULES'].items()
+    })
+    return types.MappingProxyType(config)
@@ -0,0 +1,34 @@
+from telegram.ext import ConversationHandler
+
+
+class TimedConversationHandler(ConversationHandler):
+    """
+    ConversationHandler whose idle timeout depends on the state the
+    conversation is waiting in.
+
+    ``state_timeouts`` maps states to seconds; states missing from it use
+    ``conversation_timeout``, which defaults to the longest of them. When a
+    timeout fires, the handlers of :attr:`ConversationHandler.TIMEOUT` run
+    as usual and the conversation ends.
+
+    Timeouts are jobs of the application's job queue, which only exists with
+    the ``python-telegram-bot[job-queue]`` extra. :meth:`_schedule_job` and
+    ``_conversation_timeout`` are private to PTB: this was written against
+    21.x, the range pinned in the manifest.
+    """
+
+    def __init__(self, *args, state_timeouts=None, **kwargs):
+        self.state_timeouts = {state: timeout for state, timeout in (state_timeouts or {}).items() if timeout}
+        kwargs.setdefault('conversation_timeout', max(self.state_timeouts.values(), default=None))
+        super().__init__(*args, **kwargs)
+
+    def _schedule_job(self, new_state, application, update, context, conversation_key):
+        timeout = self.state_timeouts.get(new_state)
+        if not timeout:
+            return super()._schedule_job(new_state, application, update, context, conversation_key)
+        # The base class reads the timeout from the attribute; scheduling is synchronous
+        default, self._conversation_timeout = self._conversation_timeout, timeout
+        try:
+            return super()._schedule_job(new_state, application, update, context, conversation_key)
+        finally:
+            self._conversation_timeout = default
@@ -0,0 +1,35 @@
+class UpdateWindow:
+    """
+    Compact record of the update_ids already dispatched.
+
+    Keeps the highest id seen plus a bitmap of the ``size`` ids below it
+    (bit ``n`` set means ``high - n`` was seen), which tolerates gaps and
+    out-of-order delivery. Ids older than the window are treated as seen.
+    """
+
+    def __init__(self, high=0, bits=0, size=1024):
+        self.high = high
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.bits = bits & self.mask
+
+    def add(self, update_id):
+        """ Record ``update_id``; return False if it was already seen (a duplicate). """
+        if update_id > self.high:
+            shift = update_id - self.high
+            self.bits = ((self.bits << shift) | 1) & self.mask if shift < self.size else 1
+            self.high = update_id
+            return True
+        offset = self.high - update_id
+        if offset >= self.size or self.bits >> offset & 1:
+            return False
+        self.bits |= 1 << offset
+        return True
+
+    def dump(self):
+        """ ``(high, hex bitmap)``, as stored on telegram.config. """
+        return self.high, format(self.bits, 'x')
+
+    @classmethod
+    def load(cls, high, bits_hex, size=1024):
+        return cls(high or 0, int(bits_hex or '0', 16), size)
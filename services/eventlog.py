@@ -0,0 +1,85 @@
+import json
+import logging
+import random
+
+_logger = logging.getLogger(__name__)
+
+# Handlers logging through EventLog, with the label shown in the configuration
+HANDLERS = [
+    ('link_handler', 'Link Filter'),
+    ('clear_chat', 'Clear Chat'),
+    ('is_member', 'Membership Checks'),
+    ('welcome_new_member', 'Welcome'),
+    ('greetings', 'Greetings'),
+]
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+
+class _JsonRecord:
+    """ Log argument rendered to compact JSON only if a log handler formats it. """
+
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+class EventLog:
+    """
+    Structured events of the hot handlers, one compact JSON record each.
+
+    Every handler has a level and a sample rate (``EVENT_LOG_*`` entries of
+    the bot config, see :meth:`configure`). An event below the level of its
+    handler, or not drawn by the sampling, returns after a dictionary lookup
+    and a comparison: nothing is formatted, so callers pass plain values
+    (ids, statuses) rather than Telegram objects. Warnings and errors are
+    never sampled out.
+
+    The level of the stdlib logger is left to the operator (``--log-handler``):
+    an event is written when both its handler's rule and the logger allow it.
+    """
+
+    def __init__(self, config=None, logger=_logger):
+        self.logger = logger
+        self._rules = {}  # handler -> (level, sample rate)
+        self._default = (logging.WARNING, 1.0)
+        self.configure(config or {})
+
+    def configure(self, config):
+        self._default = (LEVELS.get(config.get('EVENT_LOG_LEVEL'), logging.WARNING),
+                         config.get('EVENT_LOG_SAMPLE_RATE', 1.0))
+        self._rules = {
+            handler: (LEVELS.get(level, logging.WARNING), rate)
+            for handler, level, rate in config.get('EVENT_LOG_RULES') or ()
+        }
+
+    def enabled(self, handler, level=logging.DEBUG):
+        return level >= self._rules.get(handler, self._default)[0]
+
+    def log(self, handler, event, level=logging.DEBUG, **fields):
+        threshold, rate = self._rules.get(handler, self._default)
+        if level < threshold:
+            return
+        if level < logging.WARNING and rate < 1.0 and random.random() >= rate:
+            return
+        self.logger.log(level, "%s", _JsonRecord({'handler': handler, 'event': event, **fields}))
+
+    def debug(self, handler, event, **fields):
+        self.log(handler, event, logging.DEBUG, **fields)
+
+    def info(self, handler, event, **fields):
+        self.log(handler, event, logging.INFO, **fields)
+
+    def warning(self, handler, event, **fields):
+        self.log(handler, event, logging.WARNING, **fields)
+
+    def error(self, handler, event, **fields):
+        self.log(handler, event, logging.ERROR, **fields)
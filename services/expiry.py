@@ -0,0 +1,48 @@
+import odoo
+
+
+class MessageExpiry:
+    """
+    Deferred deletion of bot messages, stored in ``telegram_message_expiry``.
+
+    Messages are registered with a time to live; :meth:`pop_due` hands the
+    expired ones over, grouped per chat, to be deleted with one
+    ``deleteMessages`` call per 100 messages. Rows are taken with ``SKIP
+    LOCKED`` so several processes of the same bot never delete twice.
+    """
+
+    def __init__(self, dbname, config_id):
+        self.dbname = dbname
+        self.config_id = config_id
+
+    def schedule(self, messages, ttl):
+        """ Delete ``messages``, a list of ``(chat_id, message_id)``, in ``ttl`` seconds. """
+        if not messages:
+            return
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            for chat_id, message_id in messages:
+                cr.execute("""
+                    INSERT INTO telegram_message_expiry
+                        (config_id, chat_id, message_id, expire_at, create_uid, write_uid, create_date, write_date)
+                    VALUES (%s, %s, %s, now() at time zone 'UTC' + make_interval(secs => %s),
+                            %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+                """, (self.config_id, str(chat_id), message_id, ttl, odoo.SUPERUSER_ID, odoo.SUPERUSER_ID))
+
+    def pop_due(self, limit=1000):
+        """ Remove the expired rows and return ``{chat_id: [message_id, ...]}``. """
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            cr.execute("""
+                DELETE FROM telegram_message_expiry
+                WHERE id IN (
+                    SELECT id FROM telegram_message_expiry
+                    WHERE config_id = %s AND expire_at <= now() at time zone 'UTC'
+                    ORDER BY expire_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING chat_id, message_id
+            """, (self.config_id, limit))
+            due = {}
+            for chat_id, message_id in cr.fetchall():
+                due.setdefault(int(chat_id), []).append(message_id)
+            return due
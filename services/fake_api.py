@@ -0,0 +1,130 @@
+import collections
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_logger = logging.getLogger(__name__)
+
+FAKE_BOT_ID = 100000001
+FAKE_BOT_USERNAME = 'replay_bot'
+
+
+class FakeBotApi:
+    """
+    Minimal stand-in for the Telegram Bot API, for replaying recorded
+    traffic: every method succeeds, with plausible results for the ones
+    whose answer the bot reads (``getMe``, the ``send*`` methods,
+    ``getChatMember``...). Calls are counted per method; ``latency``
+    seconds are added to every answer to mimic the real API.
+
+    Serve it with :meth:`start` and point the bot at :attr:`base_url`.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, member_status='member'):
+        self.latency = latency
+        self.member_status = member_status
+        self.calls = collections.Counter()
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                api._handle(self)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%s/bot' % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle(self, request):
+        path = urllib.parse.urlsplit(request.path).path
+        method = path.rsplit('/', 1)[-1]
+        params = self._params(request)
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.dumps({'ok': True, 'result': self._result(method, params)}).encode()
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    @staticmethod
+    def _params(request):
+        """ Parameters of a form-encoded or JSON call; multipart uploads are not parsed. """
+        length = int(request.headers.get('Content-Length') or 0)
+        raw = request.rfile.read(length) if length else b''
+        content_type = request.headers.get('Content-Type') or ''
+        if content_type.startswith('application/json'):
+            return json.loads(raw or b'{}')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            params = {}
+            for key, value in urllib.parse.parse_qsl(raw.decode()):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+            return params
+        return {}
+
+    def _user(self, user_id):
+        return {'id': int(user_id or 1), 'is_bot': False, 'first_name': 'Replayed User'}
+
+    def _chat(self, chat_id):
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = -1000000000001  # @username of a channel
+        return {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup', 'title': 'Replay'}
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'Replay Bot', 'username': FAKE_BOT_USERNAME,
+                    'can_join_groups': True, 'can_read_all_group_messages': True, 'supports_inline_queries': False}
+        if method.startswith('send') or method in ('editMessageText', 'editMessageReplyMarkup', 'copyMessage'):
+            with self._lock:
+                message_id = next(self._message_ids)
+            if method == 'copyMessage':
+                return {'message_id': message_id}
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': self._chat(params.get('chat_id')),
+                'from': {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'Replay Bot', 'username': FAKE_BOT_USERNAME},
+                'text': params.get('text') or params.get('caption') or '',
+            }
+        if method == 'getChatMember':
+            return {'status': self.member_status, 'user': self._user(params.get('user_id'))}
+        if method == 'getChatAdministrators':
+            return []
+        if method == 'getChat':
+            return {**self._chat(params.get('chat_id')), 'accent_color_id': 0, 'max_reaction_count': 11}
+        if method == 'getUserProfilePhotos':
+            return {'total_count': 0, 'photos': []}
+        if method == 'getUpdates':
+            return []
+        return True
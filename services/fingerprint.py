@@ -0,0 +1,75 @@
+import array
+import hashlib
+import math
+import re
+import time
+import unicodedata
+
+# Texts shorter than this (once normalized) are too common to be fingerprinted
+MIN_TEXT_LENGTH = 20
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_text(text):
+    """ Fold case, accents and look-alike characters and drop everything but letters and digits. """
+    text = unicodedata.normalize('NFKD', text).casefold()
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub('', text)
+
+
+def message_fingerprints(message):
+    """ Fingerprints of a message: its normalized text or caption, and the ``file_unique_id`` of its media. """
+    fingerprints = []
+    text = normalize_text(message.text or message.caption or '')
+    if len(text) >= MIN_TEXT_LENGTH:
+        fingerprints.append('t:' + text)
+    media = (message.photo[-1] if message.photo else None) or message.video or message.animation \
+        or message.document or message.audio or message.voice or message.video_note
+    if media:
+        fingerprints.append('f:' + media.file_unique_id)
+    return fingerprints
+
+
+class DecayingCountMinSketch:
+    """
+    Approximate, time-decaying number of occurrences of keys, in fixed memory.
+
+    A count-min sketch of ``depth`` rows of ``width`` counters: a key adds to
+    one counter per row and its estimate is the smallest of them, which can
+    only over-count (on hash collisions). Counts decay exponentially with
+    ``half_life`` seconds. Instead of decaying every counter, increments are
+    scaled up by the time elapsed and estimates scaled down by the same
+    factor, so each operation is O(depth); counters are rescaled in one pass
+    before the factor grows too large.
+    """
+
+    def __init__(self, width=4096, depth=4, half_life=600):
+        self.width = width
+        self.depth = depth
+        self._rate = math.log(2) / half_life
+        self._origin = time.monotonic()
+        self._rows = [array.array('d', bytes(8 * width)) for _i in range(depth)]
+
+    def _indexes(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self.width for row in range(self.depth)]
+
+    def _scale(self):
+        scale = math.exp(self._rate * (time.monotonic() - self._origin))
+        if scale > 1e6:
+            for row in self._rows:
+                for index in range(self.width):
+                    row[index] /= scale
+            self._origin = time.monotonic()
+            scale = 1.0
+        return scale
+
+    def add(self, key):
+        """ Count one occurrence of ``key`` and return its decayed estimate. """
+        scale = self._scale()
+        estimate = None
+        for row, index in zip(self._rows, self._indexes(key)):
+            row[index] += scale
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate / scale
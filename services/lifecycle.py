@@ -0,0 +1,213 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+# How long a start may take before the bot is reported in error
+START_TIMEOUT = 60
+# Supervision: how often bots are checked, when a silent bot counts as stalled,
+# and the exponential backoff (with jitter) between two automatic restarts.
+SUPERVISE_INTERVAL = 2
+STALL_TIMEOUT = 60
+RESTART_BACKOFF_BASE = 1
+RESTART_BACKOFF_MAX = 300
+# A bot healthy for this long gets its backoff reset
+HEALTHY_RESET = 120
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """ Return the lifecycle manager of this process, creating it on first use. """
+    global _manager
+    with _manager_lock:
+        if _manager is None or not _manager.is_alive():
+            _manager = BotLifecycleManager()
+            _manager.start()
+        return _manager
+
+
+class BotLifecycleManager(threading.Thread):
+    """
+    Owns the bot threads of the current process and performs their
+    start/stop transitions in the background, so that callers (Odoo
+    request threads, the standalone runner) never wait on Telegram.
+
+    Every transition is published on telegram.config (``bot_state``) and
+    on the bus, see ``telegram.config._set_bot_state``.
+
+    Between two requests the manager supervises its bots: a thread that
+    died (crash, invalid token, network error at startup) or whose loop
+    stopped beating is restarted with exponential backoff and jitter.
+    """
+
+    def __init__(self):
+        super().__init__(name="telegram-bot-lifecycle")
+        self.daemon = True
+        self.bots = {}  # telegram.config id -> TelegramBotThread
+        self.pending = {}  # telegram.config id -> number of queued transitions
+        self._pending_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._restarts = {}  # telegram.config id -> {'dbname', 'attempt', 'due'}
+        self._starting = {}  # telegram.config id -> time.monotonic() deadline of the start in progress
+        self.polling = True  # False in `telegram-bot --consumers-only` processes
+
+    # Thread-safe API -------------------------------------------------------
+
+    def request(self, dbname, config_id, action):
+        """ Queue a ``'start'`` or ``'stop'`` of the bot of ``config_id``. """
+        with self._pending_lock:
+            self.pending[config_id] = self.pending.get(config_id, 0) + 1
+        self._requests.put((dbname, config_id, action))
+
+    def is_running(self, config_id):
+        thread = self.bots.get(config_id)
+        return bool(thread and thread.is_alive())
+
+    def stop_all(self, timeout=None):
+        """ Stop every bot of this process and wait for them, used on process exit. """
+        threads = list(self.bots.values())
+        for thread in threads:
+            thread.stop_polling()
+        for thread in threads:
+            thread.join(timeout=timeout or thread.drain_timeout + 5)
+
+    # Manager thread --------------------------------------------------------
+
+    def run(self):
+        while True:
+            try:
+                dbname, config_id, action = self._requests.get(timeout=SUPERVISE_INTERVAL)
+            except queue.Empty:
+                try:
+                    self._supervise()
+                except Exception:
+                    # The manager must outlive any failure: it is the only reader of the requests
+                    _logger.exception("Telegram bot supervision failed")
+                continue
+            try:
+                if action == 'start':
+                    self._start(dbname, config_id)
+                elif action == 'stop':
+                    self._stop(dbname, config_id)
+            except Exception as e:
+                _logger.exception("Telegram bot %s: %s failed", config_id, action)
+                self._publish(dbname, config_id, 'error', str(e))
+            finally:
+                with self._pending_lock:
+                    self.pending[config_id] -= 1
+                    if not self.pending[config_id]:
+                        del self.pending[config_id]
+
+    def _start(self, dbname, config_id, restart=False):
+        from .telegram_worker import TelegramBotThread
+
+        if self.is_running(config_id):
+            self._publish(dbname, config_id, 'running')
+            return
+        if not restart:
+            self._restarts.pop(config_id, None)  # a manual start resets the backoff
+
+        with odoo.modules.registry.Registry(dbname).cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            record = env['telegram.config'].browse(config_id).exists()
+            if not record or record.requested_state != 'running':
+                # stopped or deleted meanwhile
+                self.bots.pop(config_id, None)
+                self._restarts.pop(config_id, None)
+                return
+            thread = TelegramBotThread(
+                dbname, record.bot_token, record._prepare_bot_config(), config_id, polling=self.polling,
+            )
+
+        self._publish(dbname, config_id, 'starting')
+        thread.start()
+        self.bots[config_id] = thread
+        # Not waited for here: the manager serves the other bots meanwhile, see _check_starts()
+        self._starting[config_id] = time.monotonic() + START_TIMEOUT
+
+    def _check_starts(self):
+        """ Publish the outcome of the starts in progress once the bot is up, gave up or timed out. """
+        now = time.monotonic()
+        for config_id, deadline in list(self._starting.items()):
+            thread = self.bots.get(config_id)
+            if thread is None:
+                del self._starting[config_id]  # stopped meanwhile
+            elif thread.ready.is_set():
+                del self._starting[config_id]
+                if thread.error or not thread.is_alive():
+                    self._publish(thread.dbname, config_id, 'error', str(thread.error or "Bot thread exited"))
+                else:
+                    self._publish(thread.dbname, config_id, 'running')
+            elif now > deadline:
+                del self._starting[config_id]
+                self._publish(thread.dbname, config_id, 'error', "Polling did not come up within %ss" % START_TIMEOUT)
+
+    def _stop(self, dbname, config_id):
+        self._restarts.pop(config_id, None)
+        thread = self.bots.pop(config_id, None)
+        if thread and thread.is_alive():
+            self._publish(dbname, config_id, 'draining')
+            thread.stop_polling()
+            thread.join(timeout=thread.drain_timeout + 5)
+            if thread.is_alive():
+                _logger.warning("Telegram thread did not exit cleanly within the drain deadline.")
+        self._publish(dbname, config_id, 'stopped')
+
+    def _supervise(self):
+        self._check_starts()
+        now = time.monotonic()
+        for config_id, thread in list(self.bots.items()):
+            restart = self._restarts.get(config_id)
+            if thread.is_alive() and not thread.is_stalled(STALL_TIMEOUT):
+                if restart and thread.started_at and now - thread.started_at > HEALTHY_RESET:
+                    del self._restarts[config_id]
+                continue
+
+            if restart is None or restart['due'] is None:
+                # Newly detected failure: record it and schedule the restart
+                if thread.is_alive():
+                    error = "Bot loop stalled: no heartbeat for %ss" % STALL_TIMEOUT
+                    thread.stop_polling()
+                else:
+                    error = str(thread.error or "Bot thread exited unexpectedly")
+                self._schedule_restart(thread.dbname, config_id, error, restart['attempt'] + 1 if restart else 1)
+            elif now >= restart['due'] and not thread.is_alive():
+                # A stalled thread must be gone before polling again with the same token
+                restart['due'] = None
+                try:
+                    self._start(restart['dbname'], config_id, restart=True)
+                except Exception as e:
+                    # Database or network down: try again at the next backoff step
+                    _logger.exception("Telegram bot %s: restart failed", config_id)
+                    self._publish(restart['dbname'], config_id, 'error', str(e))
+                    self._schedule_restart(restart['dbname'], config_id, str(e), restart['attempt'] + 1)
+
+    def _schedule_restart(self, dbname, config_id, error, attempt):
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+        self._restarts[config_id] = {'dbname': dbname, 'attempt': attempt, 'due': time.monotonic() + delay}
+        _logger.warning("Telegram bot %s failed (%s), restart #%s in %.1fs", config_id, error, attempt, delay)
+        self._record_failure(dbname, config_id, error, delay)
+
+    def _record_failure(self, dbname, config_id, error, delay):
+        try:
+            with odoo.modules.registry.Registry(dbname).cursor() as cr:
+                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+                env['telegram.config'].browse(config_id).exists()._record_bot_failure(error, delay)
+        except Exception as e:
+            _logger.error("Could not record Telegram bot failure for %s: %s", config_id, e)
+
+    def _publish(self, dbname, config_id, state, message=False):
+        try:
+            with odoo.modules.registry.Registry(dbname).cursor() as cr:
+                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+                env['telegram.config'].browse(config_id).exists()._set_bot_state(state, message)
+        except Exception as e:
+            _logger.error("Could not publish Telegram bot state %s for %s: %s", state, config_id, e)
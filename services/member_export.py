@@ -0,0 +1,98 @@
+import json
+import re
+
+# Characters that change the structure of a JSON document
+_STRUCTURE = re.compile(r'["\\{}\[\]]')
+# Chunk read from the export at a time
+READ_CHUNK = 1 << 20
+
+
+def iter_array_objects(fileobj, chunk_size=READ_CHUNK):
+    """
+    Yield the objects found as elements of the arrays of a JSON document,
+    without loading the document.
+
+    The text is scanned chunk by chunk, following strings and nesting, and
+    only the object being read is kept in memory, so exports of hundreds of
+    megabytes are read in constant memory. Objects nested in a yielded
+    object are part of it and are not yielded on their own: for a Telegram
+    export ``{"messages": [{...}, ...]}`` each message is yielded once, for
+    a member list ``[{...}, ...]`` each member.
+
+    :param fileobj: file opened in text mode
+    """
+    stack = []  # '[' and '{' of the containers currently open
+    in_string = False
+    escaped_at = None  # absolute position of the character escaped by a backslash
+    capture_depth = None  # len(stack) once the captured object is closed
+    captured = []  # text of the captured object from the previous chunks
+    offset = 0  # absolute position of the current chunk
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        capture_from = 0
+        for match in _STRUCTURE.finditer(chunk):
+            position = offset + match.start()
+            if position == escaped_at:
+                continue
+            char = match.group()
+            if in_string:
+                if char == '\\':
+                    escaped_at = position + 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '[{':
+                if char == '{' and capture_depth is None and stack and stack[-1] == '[':
+                    capture_depth = len(stack)
+                    capture_from = match.start()
+                stack.append(char)
+            elif stack:
+                stack.pop()
+                if capture_depth is not None and len(stack) == capture_depth:
+                    captured.append(chunk[capture_from:match.end()])
+                    yield json.loads(''.join(captured))
+                    captured = []
+                    capture_depth = None
+        if capture_depth is not None:
+            captured.append(chunk[capture_from:])
+        offset += len(chunk)
+
+
+def export_user(record):
+    """ ``(telegram_id, username)`` of a member export record, or None.
+
+    Accepts the usual member list shapes: ``user_id`` and ``username``, the
+    latter with or without its ``@``, or the user nested under ``user``
+    where ``id`` is accepted too. Records without a username, such as the
+    messages of a Telegram Desktop history export, are skipped: the
+    username is what the backfill resolves.
+    """
+    user = record.get('user')
+    if isinstance(user, dict):
+        record = user
+        telegram_id = user.get('user_id') or user.get('id')
+    else:
+        # The ``id`` of a top-level record may be a message's, never taken for the user's
+        telegram_id = record.get('user_id')
+    username = record.get('username')
+    if not isinstance(username, str) or not username.strip('@ '):
+        return None
+    try:
+        telegram_id = int(telegram_id)
+    except (TypeError, ValueError):
+        return None
+    if telegram_id <= 0 or record.get('is_bot'):
+        return None  # channels and groups have negative ids
+    return str(telegram_id), username.strip('@ ')
+
+
+def iter_export_users(path):
+    """ Yield the ``(telegram_id, username)`` pairs of the member export at ``path``. """
+    with open(path, encoding='utf-8') as export:
+        for record in iter_array_objects(export):
+            pair = export_user(record)
+            if pair:
+                yield pair
@@ -0,0 +1,97 @@
+import asyncio
+import collections
+import logging
+import time
+
+from telegram import Bot
+from telegram.error import BadRequest, TelegramError
+
+from .ratelimit import AsyncRateLimiter
+
+_logger = logging.getLogger(__name__)
+
+# Channel member statuses counting as "in the channel": restricted users are still
+# in it, see channel_status() for those who left while restricted
+MEMBER_STATUSES = ('member', 'administrator', 'creator', 'restricted')
+# Longest time a "not a member" answer is trusted: users join right after being told to
+NEGATIVE_TTL_MAX = 60
+
+
+def channel_status(member):
+    """ Status of a ChatMember, ``'left'`` for a restricted user who is no longer in the chat. """
+    if member.status == 'restricted' and not member.is_member:
+        return 'left'
+    return member.status
+
+
+class MembershipCache:
+    """
+    Channel statuses recently read from Telegram, per ``(channel, user)``.
+
+    Members are trusted for ``ttl`` seconds, other statuses for a tenth of
+    it (at most :data:`NEGATIVE_TTL_MAX`). At most ``max_keys`` entries are
+    kept, the least recently stored being forgotten first.
+    """
+
+    def __init__(self, ttl=300, max_keys=50000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries = collections.OrderedDict()  # (channel, user id) -> (expires at, status)
+
+    def get(self, channel_id, user_id):
+        """ The cached status, or None when unknown or expired. """
+        entry = self._entries.get((channel_id, user_id))
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[(channel_id, user_id)]
+            return None
+        return entry[1]
+
+    def put(self, channel_id, user_id, status):
+        if not self.ttl:
+            return
+        ttl = self.ttl if status in MEMBER_STATUSES else min(self.ttl / 10, NEGATIVE_TTL_MAX)
+        self._entries[(channel_id, user_id)] = (time.monotonic() + ttl, status)
+        self._entries.move_to_end((channel_id, user_id))
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+
+async def fetch_channel_statuses(bot, channel_id, telegram_ids, concurrency=5, limiter=None):
+    """ Look up the channel status of each Telegram user id.
+
+    At most ``concurrency`` lookups are in flight, paced by ``limiter``.
+
+    :return: ``{telegram_id: status}``; ``'left'`` for users Telegram does not
+        know in the channel, users whose lookup failed are missing
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def fetch(telegram_id):
+        async with semaphore:
+            if limiter:
+                await limiter.acquire()
+            try:
+                member = await bot.get_chat_member(chat_id=channel_id, user_id=int(telegram_id))
+                statuses[telegram_id] = channel_status(member)
+            except BadRequest as e:
+                # "user not found" / "participant_id_invalid": never joined
+                _logger.debug("Channel status of %s: %s", telegram_id, e)
+                statuses[telegram_id] = 'left'
+            except (TelegramError, ValueError) as e:
+                _logger.warning("Could not check the channel status of %s: %s", telegram_id, e)
+
+    await asyncio.gather(*(fetch(telegram_id) for telegram_id in telegram_ids))
+    return statuses
+
+
+def sync_channel_statuses(token, channel_id, telegram_ids, concurrency=5, rate=20):
+    """ Blocking wrapper of :func:`fetch_channel_statuses` with its own bot and event loop, for crons. """
+    async def run():
+        async with Bot(token) as bot:
+            return await fetch_channel_statuses(
+                bot, channel_id, telegram_ids, concurrency, AsyncRateLimiter(rate),
+            )
+    return asyncio.run(run())
@@ -0,0 +1,75 @@
+import collections
+import math
+import threading
+import time
+
+# Update attributes carrying a Telegram ``date``, in the order they are looked up.
+# Callback queries have none: the date of their message is the time the
+# button was posted, not the time it was clicked.
+DATED_UPDATE_TYPES = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'chat_member', 'my_chat_member', 'chat_join_request',
+)
+
+
+def update_type_and_date(update):
+    """ Return ``(type, epoch seconds)`` of an update, or ``(None, None)`` if it carries no date. """
+    for update_type in DATED_UPDATE_TYPES:
+        obj = getattr(update, update_type, None)
+        if obj is not None and getattr(obj, 'date', None):
+            return update_type, obj.date.timestamp()
+    return None, None
+
+
+def percentile(ordered, ratio):
+    """ Nearest-rank percentile of an already sorted, non-empty sequence. """
+    return ordered[max(0, math.ceil(ratio * len(ordered)) - 1)]
+
+
+class LagTracker:
+    """
+    Rolling end-to-end lag of the updates, per update type.
+
+    For each type the samples of the last ``max_age`` seconds are kept, at
+    most ``window`` of them: the delay between the Telegram ``date`` of the
+    update and the moment it was dequeued by the application, and the
+    moment its handlers finished. A bot that went idle reports nothing.
+    """
+
+    def __init__(self, window=1000, max_age=300):
+        self.window = window
+        self.max_age = max_age
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def observe(self, update, dequeued_at, finished_at):
+        update_type, sent_at = update_type_and_date(update)
+        if update_type is None:
+            return
+        with self._lock:
+            self._samples[update_type].append((finished_at, dequeued_at - sent_at, finished_at - sent_at))
+
+    def snapshot(self):
+        """ ``{type: {'count', 'dequeue_p95', 'p50', 'p95', 'p99', 'max'}}``, lags in seconds. """
+        oldest = time.time() - self.max_age
+        with self._lock:
+            samples = {}
+            for update_type, values in self._samples.items():
+                while values and values[0][0] < oldest:
+                    values.popleft()
+                samples[update_type] = list(values)
+        report = {}
+        for update_type, values in samples.items():
+            if not values:
+                continue
+            dequeued = sorted(v[1] for v in values)
+            finished = sorted(v[2] for v in values)
+            report[update_type] = {
+                'count': len(values),
+                'dequeue_p95': percentile(dequeued, 0.95),
+                'p50': percentile(finished, 0.50),
+                'p95': percentile(finished, 0.95),
+                'p99': percentile(finished, 0.99),
+                'max': finished[-1],
+            }
+        return report
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+import odoo
+from cryptography.fernet import Fernet, InvalidToken
+from telegram.ext import BasePersistence, PersistenceInput
+
+_logger = logging.getLogger(__name__)
+
+# user_data keys encrypted before they reach the database
+SENSITIVE_KEYS = frozenset({'reg_password', 'otp_code'})
+# Conversations untouched for longer than this are not restored on start
+CONVERSATION_MAX_AGE = timedelta(days=1)
+
+
+class OdooPersistence(BasePersistence):
+    """
+    Stores ``user_data`` and the states of persistent conversations in
+    ``telegram.bot.data`` so that a restart does not drop users in the
+    middle of a sign-up.
+
+    * Writes are batched: the application hands the dirty entries over
+      every ``update_interval`` seconds and they are upserted in one
+      transaction.
+    * ``user_data`` is loaded lazily, the first time a user shows up
+      again (:meth:`refresh_user_data`), not all at startup.
+    * :data:`SENSITIVE_KEYS` are encrypted with a key derived from the
+      database secret.
+    """
+
+    def __init__(self, dbname, config_id, update_interval=30):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.dbname = dbname
+        self.config_id = config_id
+        self._loaded_users = set()
+        self._forgotten_users = set()  # evicted from memory only, see forget_user()
+        self._dirty = {}  # (scope, name, key) -> serialized data, None to delete
+        self._write_task = None
+        with self._cursor() as cr:
+            cr.execute("SELECT value FROM ir_config_parameter WHERE key = 'database.secret'")
+            secret = (cr.fetchone() or [''])[0]
+        digest = hashlib.sha256(("telegram-bot-persistence:%s" % secret).encode()).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(digest))
+
+    def _cursor(self):
+        return odoo.modules.registry.Registry(self.dbname).cursor()
+
+    # Serialization ---------------------------------------------------------
+
+    def _dump_user_data(self, data):
+        return json.dumps({
+            key: {'__enc__': self._fernet.encrypt(str(value).encode()).decode()} if key in SENSITIVE_KEYS else value
+            for key, value in data.items()
+        })
+
+    def _load_user_data(self, raw):
+        data = {}
+        for key, value in json.loads(raw).items():
+            if isinstance(value, dict) and '__enc__' in value:
+                try:
+                    value = self._fernet.decrypt(value['__enc__'].encode()).decode()
+                except InvalidToken:
+                    continue  # database secret changed: drop the field
+            data[key] = value
+        return data
+
+    # Reads -----------------------------------------------------------------
+
+    def _fetch(self, scope, name=None, key=None, since=None):
+        query = "SELECT key, data FROM telegram_bot_data WHERE config_id = %s AND scope = %s AND name = %s"
+        params = [self.config_id, scope, name or '']
+        if key is not None:
+            query += " AND key = %s"
+            params.append(key)
+        if since is not None:
+            query += " AND write_date >= %s"
+            params.append(since)
+        with self._cursor() as cr:
+            cr.execute(query, params)
+            return cr.fetchall()
+
+    async def get_user_data(self):
+        return {}  # loaded per user in refresh_user_data
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        rows = await asyncio.to_thread(self._fetch, 'user', key=str(user_id))
+        if rows:
+            stored = self._load_user_data(rows[0][1])
+            stored.update(user_data)  # what happened since the restart wins
+            user_data.update(stored)
+
+    async def get_conversations(self, name):
+        since = odoo.fields.Datetime.now() - CONVERSATION_MAX_AGE
+        rows = await asyncio.to_thread(self._fetch, 'conversation', name=name, since=since)
+        return {tuple(json.loads(key)): json.loads(data) for key, data in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Writes ----------------------------------------------------------------
+
+    def _mark(self, scope, name, key, data):
+        self._dirty[(scope, name or '', key)] = data
+        if self._write_task is None or self._write_task.done():
+            # Every update_* call of one persistence run lands in the same batch
+            self._write_task = asyncio.ensure_future(self._write_dirty())
+
+    async def _write_dirty(self):
+        await asyncio.sleep(0)
+        batch, self._dirty = self._dirty, {}
+        if batch:
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                _logger.exception("Telegram persistence: could not save %s entries", len(batch))
+                # keep them for the next run, unless newer values arrived meanwhile
+                for entry, data in batch.items():
+                    self._dirty.setdefault(entry, data)
+
+    def _write(self, batch):
+        with self._cursor() as cr:
+            for (scope, name, key), data in batch.items():
+                if data is None:
+                    cr.execute("""
+                        DELETE FROM telegram_bot_data
+                        WHERE config_id = %s AND scope = %s AND name = %s AND key = %s
+                    """, (self.config_id, scope, name, key))
+                    continue
+                cr.execute("""
+                    INSERT INTO telegram_bot_data (config_id, scope, name, key, data,
+                                                   create_uid, write_uid, create_date, write_date)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+                    ON CONFLICT (config_id, scope, name, key)
+                    DO UPDATE SET data = EXCLUDED.data, write_date = EXCLUDED.write_date
+                """, (self.config_id, scope, name, key, data, odoo.SUPERUSER_ID, odoo.SUPERUSER_ID))
+
+    async def update_user_data(self, user_id, data):
+        self._loaded_users.add(user_id)
+        self._mark('user', None, str(user_id), self._dump_user_data(data) if data else None)
+
+    async def drop_user_data(self, user_id):
+        self._loaded_users.discard(user_id)
+        if user_id in self._forgotten_users:
+            self._forgotten_users.discard(user_id)
+            return
+        self._mark('user', None, str(user_id), None)
+
+    def forget_user(self, user_id):
+        """ Make the next drop of ``user_id`` free memory only and keep its stored row. """
+        self._forgotten_users.add(user_id)
+        self._loaded_users.discard(user_id)
+
+    async def update_conversation(self, name, key, new_state):
+        self._mark('conversation', name, json.dumps(list(key)), None if new_state is None else json.dumps(new_state))
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        if self._write_task:
+            await self._write_task
+        await self._write_dirty()
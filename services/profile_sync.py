@@ -0,0 +1,54 @@
+import asyncio
+import logging
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+from .ratelimit import AsyncRateLimiter
+
+_logger = logging.getLogger(__name__)
+
+
+async def fetch_profile_changes(bot, partners, concurrency=5, limiter=None):
+    """ Read the bio and latest profile photo of Telegram users, downloading the photo only when it changed.
+
+    :param partners: ``[(partner_id, telegram_id, known photo file_unique_id)]``
+    :return: ``{partner_id: {'bio': str, 'photo_unique_id': str or False, 'photo': bytes}}``;
+        ``'photo'`` is only present for a new photo, partners whose lookup failed are missing
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def call(method, *args, **kwargs):
+        if limiter:
+            await limiter.acquire()
+        return await method(*args, **kwargs)
+
+    async def fetch(partner_id, telegram_id, known_unique_id):
+        async with semaphore:
+            try:
+                user_id = int(telegram_id)
+                chat = await call(bot.get_chat, user_id)
+                result = {'bio': chat.bio or '', 'photo_unique_id': False}
+                photos = await call(bot.get_user_profile_photos, user_id, limit=1)
+                if photos.total_count:
+                    largest = photos.photos[0][-1]
+                    result['photo_unique_id'] = largest.file_unique_id
+                    if largest.file_unique_id != known_unique_id:
+                        photo_file = await call(bot.get_file, largest.file_id)
+                        result['photo'] = bytes(await photo_file.download_as_bytearray())
+                results[partner_id] = result
+            except (TelegramError, ValueError) as e:
+                # The bot only sees users who talked to it or share a chat with it
+                _logger.debug("Could not sync the Telegram profile of %s: %s", telegram_id, e)
+
+    await asyncio.gather(*(fetch(*partner) for partner in partners))
+    return results
+
+
+def sync_profile_changes(token, partners, concurrency=5, rate=20):
+    """ Blocking wrapper of :func:`fetch_profile_changes` with its own bot and event loop, for crons. """
+    async def run():
+        async with Bot(token) as bot:
+            return await fetch_profile_changes(bot, partners, concurrency, AsyncRateLimiter(rate))
+    return asyncio.run(run())
@@ -0,0 +1,158 @@
+import collections
+import cProfile
+import functools
+import io
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from .tracing import wrap_callbacks
+
+# Seconds between two samples of the bot thread's stack
+SAMPLE_INTERVAL = 0.005
+# Frames kept per tracemalloc traceback, and allocation sites listed in the diff
+TRACEMALLOC_FRAMES = 25
+TRACEMALLOC_TOP = 50
+
+
+class HandlerStats:
+    """
+    Calls and time per handler callback, counted only while :attr:`active`:
+    the callbacks are wrapped once (:meth:`install`) and cost an attribute
+    check per call the rest of the time.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._stats = collections.defaultdict(lambda: [0, 0.0, 0.0])  # name -> [calls, total, max]
+
+    def install(self, application):
+        wrap_callbacks(application, self._wrap)
+
+    def _wrap(self, callback, name):
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            if not self.active:
+                return await callback(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                stats = self._stats[name]
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+        return wrapper
+
+    def start(self):
+        self._stats.clear()
+        self.active = True
+
+    def stop(self):
+        """ Stop counting and return the counts as CSV, busiest handler first. """
+        self.active = False
+        lines = ["handler,calls,total_s,avg_ms,max_ms"]
+        for name, (calls, total, longest) in sorted(self._stats.items(), key=lambda item: -item[1][1]):
+            lines.append("%s,%d,%.6f,%.3f,%.3f" % (name, calls, total, total / calls * 1000, longest * 1000))
+        return "\n".join(lines) + "\n"
+
+
+class StackSampler(threading.Thread):
+    """ Samples the stack of one thread at a fixed interval and counts identical stacks. """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='telegram-stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        """ The samples in the collapsed format of flamegraph.pl and speedscope. """
+        return "".join("%s %d\n" % (stack, count) for stack, count in self.samples.most_common())
+
+
+class ProfilingSession:
+    """
+    One profiling run of the bot thread, started and stopped from its event
+    loop. Depending on the options, it runs:
+
+    * ``cpu``: cProfile on the loop thread (wall clock) and a stack sampler
+      of the same thread, for the pstats file and collapsed stacks;
+    * ``memory``: tracemalloc snapshots at start and stop, diffed;
+    * ``handlers``: the calls and time of every handler (``handler_stats``).
+
+    :meth:`stop` returns ``(summary, [(file name, mimetype, content)])``.
+    """
+
+    def __init__(self, cpu=False, memory=False, handler_stats=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.handler_stats = handler_stats
+        self._profiler = None
+        self._sampler = None
+        self._snapshot = None
+        self._started_tracemalloc = False
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.monotonic()
+        if self.cpu:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            self._sampler = StackSampler(threading.get_ident())
+            self._sampler.start()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.handler_stats:
+            self.handler_stats.start()
+
+    def stop(self):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        files = []
+        summary = ["Profiled for %.0fs." % (time.monotonic() - self._started_at)]
+        if self._profiler:
+            self._profiler.disable()
+            self._sampler.stop()
+            self._profiler.create_stats()
+            files.append(('profile-%s.pstats' % stamp, 'application/octet-stream', marshal.dumps(self._profiler.stats)))
+            files.append(('stacks-%s.collapsed' % stamp, 'text/plain', self._sampler.collapsed().encode()))
+            summary.append("CPU: %d functions profiled, %d stack samples." % (
+                len(self._profiler.stats), sum(self._sampler.samples.values())))
+        if self._snapshot:
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            diff = snapshot.compare_to(self._snapshot, 'lineno')
+            report = io.StringIO()
+            for stat in diff[:TRACEMALLOC_TOP]:
+                report.write("%s\n" % stat)
+            files.append(('tracemalloc-%s.txt' % stamp, 'text/plain', report.getvalue().encode()))
+            growth = sum(stat.size_diff for stat in diff)
+            summary.append("Memory: %+.1f KiB allocated and still held." % (growth / 1024))
+        if self.handler_stats:
+            files.append(('handlers-%s.csv' % stamp, 'text/csv', self.handler_stats.stop().encode()))
+            summary.append("Handlers: call counts attached.")
+        return " ".join(summary), files
@@ -0,0 +1,92 @@
+import asyncio
+import collections
+import time
+
+
+class Cooldown:
+    """
+    Lets an action through at most once per ``window`` seconds per key.
+
+    Keys whose window is over are pruned whenever the map doubles in size,
+    so memory follows the number of keys active within one window.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._last = {}  # key -> time.monotonic() of the last allowed action
+        self._prune_at = 1024
+
+    def hit(self, key):
+        """ Record an attempt for ``key``; True if the action may run now. """
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.window:
+            return False
+        self._last[key] = now
+        if len(self._last) >= self._prune_at:
+            self._last = {k: t for k, t in self._last.items() if now - t < self.window}
+            self._prune_at = max(1024, 2 * len(self._last))
+        return True
+
+
+class SlidingWindowCounter:
+    """
+    Number of events per key over the last ``window`` seconds.
+
+    Each key owns a ring buffer of ``buckets`` counters, each covering
+    ``window / buckets`` seconds: memory per key is fixed and counting is
+    O(buckets) at worst. At most ``max_keys`` keys are tracked, the least
+    recently used one being forgotten first.
+    """
+
+    def __init__(self, window, buckets=10, max_keys=10000):
+        self.buckets = buckets
+        self.bucket_span = window / buckets
+        self.max_keys = max_keys
+        self._rings = collections.OrderedDict()  # key -> [last slot, [count per bucket]]
+
+    def add(self, key, amount=1):
+        """ Count ``amount`` events for ``key`` now and return its total over the window. """
+        slot = int(time.monotonic() / self.bucket_span)
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = [slot, [0] * self.buckets]
+            if len(self._rings) > self.max_keys:
+                self._rings.popitem(last=False)
+        else:
+            self._rings.move_to_end(key)
+            self._advance(ring, slot)
+        ring[1][slot % self.buckets] += amount
+        return sum(ring[1])
+
+    def _advance(self, ring, slot):
+        """ Zero the buckets that slid out of the window since the ring was last touched. """
+        last, counts = ring
+        if slot - last >= self.buckets:
+            counts[:] = [0] * self.buckets
+        else:
+            for passed in range(last + 1, slot + 1):
+                counts[passed % self.buckets] = 0
+        ring[0] = slot
+
+
+class AsyncRateLimiter:
+    """ Token bucket for coroutines: at most ``rate`` acquisitions per second, bursts of ``burst``. """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -0,0 +1,60 @@
+import logging
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+
+class ReachabilityIndex:
+    """
+    Which users the bot cannot send private messages to.
+
+    The set lives in memory and is consulted before every private message;
+    changes are written through to ``telegram_unreachable_user`` and the set
+    is reloaded periodically (:meth:`load`) to pick up what other processes
+    of the same bot learnt. Only unreachable users are stored, so the index
+    stays small.
+
+    The write methods block on the database: call them off the event loop.
+    With ``persist=False`` (replays) the set only lives in memory.
+    """
+
+    def __init__(self, dbname, bot_id, persist=True):
+        self.dbname = dbname
+        self.bot_id = str(bot_id)
+        self.persist = persist
+        self._unreachable = set()
+
+    def is_reachable(self, user_id):
+        return user_id not in self._unreachable
+
+    def load(self):
+        if not self.persist:
+            return
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            cr.execute("SELECT user_id FROM telegram_unreachable_user WHERE bot_id = %s", (self.bot_id,))
+            self._unreachable = {int(row[0]) for row in cr.fetchall()}
+
+    def mark_unreachable(self, user_id, reason='forbidden'):
+        if user_id in self._unreachable:
+            return
+        self._unreachable.add(user_id)
+        if not self.persist:
+            return
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            cr.execute("""
+                INSERT INTO telegram_unreachable_user
+                    (bot_id, user_id, reason, create_uid, write_uid, create_date, write_date)
+                VALUES (%s, %s, %s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+                ON CONFLICT (bot_id, user_id) DO UPDATE SET reason = EXCLUDED.reason, write_date = EXCLUDED.write_date
+            """, (self.bot_id, str(user_id), reason, odoo.SUPERUSER_ID, odoo.SUPERUSER_ID))
+
+    def mark_reachable(self, user_id):
+        if user_id not in self._unreachable:
+            return
+        self._unreachable.discard(user_id)
+        if not self.persist:
+            return
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            cr.execute("DELETE FROM telegram_unreachable_user WHERE bot_id = %s AND user_id = %s",
+                       (self.bot_id, str(user_id)))
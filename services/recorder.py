@@ -0,0 +1,163 @@
+import glob
+import gzip
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Updates waiting for the writer thread; beyond this they are not recorded
+RECORD_QUEUE_SIZE = 10000
+# Updates written at once, and the longest a recorded update waits for its batch
+RECORD_BATCH_SIZE = 500
+RECORD_FLUSH_INTERVAL = 1.0
+SEGMENT_PATTERN = 'updates-*.jsonl.gz'
+
+
+def index_path(segment):
+    return segment[:-len('.jsonl.gz')] + '.idx'
+
+
+class UpdateRecorder:
+    """
+    Appends the raw JSON of the updates the bot receives to gzip segment
+    files in ``directory``, for replaying them later (``odoo-bin
+    telegram-replay``).
+
+    :meth:`record` only queues the update: serializing, compressing and
+    writing happen in a background thread, so the event loop never waits on
+    the disk, and updates are dropped (and counted) rather than queued
+    without bound if the disk falls behind. Each segment holds one JSON line
+    per update, ``{"t": epoch seconds, "update": {...}}``, and is rotated
+    once ``segment_size`` compressed bytes are written.
+
+    Each batch is a separate gzip member (gzip readers decompress the
+    concatenation transparently); the ``.idx`` file next to a segment lists
+    ``first update_id, time, byte offset`` of every member, so a reader can
+    start decompressing from any of them (:func:`iter_segment`).
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.dropped = 0
+        self._queue = queue.Queue(RECORD_QUEUE_SIZE)
+        self._segment = None
+        self._index = None
+        self._thread = threading.Thread(target=self._run, name='telegram-update-recorder', daemon=True)
+        os.makedirs(directory, exist_ok=True)
+        self._thread.start()
+
+    def record(self, update):
+        """ Update gate: queue ``update`` for recording and let it through. """
+        if not hasattr(update, 'update_id'):
+            return True  # Custom updates are not Telegram traffic
+        try:
+            self._queue.put_nowait((time.time(), update))
+        except queue.Full:
+            self.dropped += 1
+        return True
+
+    def close(self, timeout=10):
+        """ Write what is queued, close the segment and stop the writer thread. """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + RECORD_FLUSH_INTERVAL
+                while len(batch) < RECORD_BATCH_SIZE and batch[-1] is not None:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                closing = batch[-1] is None
+                records = [item for item in batch if item is not None]
+                if records:
+                    try:
+                        self._write(records)
+                    except Exception:
+                        _logger.exception("Update recorder: could not write %s updates", len(records))
+                if closing:
+                    return
+        finally:
+            self._close_segment()
+
+    def _write(self, records):
+        if self._segment is None or self._segment.tell() >= self.segment_size:
+            self._open_segment()
+        lines = []
+        for received_at, update in records:
+            data = update.to_dict()
+            lines.append(json.dumps({'t': received_at, 'update': data}, separators=(',', ':')))
+        offset = self._segment.tell()
+        with gzip.GzipFile(fileobj=self._segment, mode='wb', mtime=0) as member:
+            member.write(('\n'.join(lines) + '\n').encode())
+        self._segment.flush()
+        self._index.write("%s,%.3f,%d\n" % (records[0][1].update_id, records[0][0], offset))
+        self._index.flush()
+
+    def _open_segment(self):
+        self._close_segment()
+        # Names sort in recording order, several segments may start within the same second
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        for sequence in itertools.count():
+            path = os.path.join(self.directory, 'updates-%s-%03d.jsonl.gz' % (stamp, sequence))
+            if not os.path.exists(path):
+                break
+        self._segment = open(path, 'ab')
+        self._index = open(index_path(path), 'a', encoding='utf-8')
+        _logger.info("Update recorder: writing %s", path)
+
+    def _close_segment(self):
+        for stream in (self._segment, self._index):
+            if stream is not None:
+                stream.close()
+        self._segment = self._index = None
+
+
+def read_index(segment):
+    """ ``[(first update_id, time, offset)]`` of the members of ``segment``; empty without index. """
+    try:
+        with open(index_path(segment), encoding='utf-8') as index:
+            return [(int(update_id), float(at), int(offset))
+                    for update_id, at, offset in (line.strip().split(',') for line in index if line.strip())]
+    except FileNotFoundError:
+        return []
+
+
+def iter_segment(segment, since_update_id=None):
+    """ Yield the ``(time, update dict)`` recorded in ``segment``, in order.
+
+    With ``since_update_id``, decompression starts at the last member
+    beginning at or before it, as listed by the index.
+    """
+    offset = 0
+    if since_update_id is not None:
+        for update_id, _at, member_offset in read_index(segment):
+            if update_id > since_update_id:
+                break
+            offset = member_offset
+    with open(segment, 'rb') as raw:
+        raw.seek(offset)
+        with gzip.GzipFile(fileobj=raw, mode='rb') as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if since_update_id is not None and record['update'].get('update_id', 0) < since_update_id:
+                    continue
+                yield record['t'], record['update']
+
+
+def segments_of(path):
+    """ The segment files at ``path`` (a segment or a directory of segments), oldest first. """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, SEGMENT_PATTERN)))
+    return [path]
@@ -0,0 +1,173 @@
+import asyncio
+import collections
+import contextlib
+import datetime
+import logging
+import threading
+import time
+
+import odoo
+from psycopg2 import InterfaceError, OperationalError
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from .tracing import span
+from .transport import PooledHTTPXRequest
+
+_logger = logging.getLogger(__name__)
+
+# Bot API methods that keep going through an open breaker: moderation must not stop
+ESSENTIAL_API_METHODS = frozenset({
+    'deleteMessage', 'deleteMessages', 'restrictChatMember', 'banChatMember',
+})
+
+
+class CircuitOpen(Exception):
+    """ Raised instead of calling a dependency whose circuit breaker is open. """
+
+    def __init__(self, name):
+        super().__init__("%s is unavailable, try again shortly" % name)
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Stops calling a dependency that keeps failing or answering slowly.
+
+    The calls of the last ``window`` seconds are recorded; once there are at
+    least ``min_calls`` of them and the share of failed or slow (longer than
+    ``slow_call`` seconds) ones reaches ``failure_rate``, the breaker opens
+    and :meth:`allow` raises :class:`CircuitOpen`. After ``reset_timeout``
+    seconds a single trial call is let through: it closes the breaker if it
+    goes well, and opens it again otherwise.
+
+    Thread-safe: Odoo calls are made from worker threads too.
+    """
+
+    def __init__(self, name, window=30, min_calls=10, failure_rate=0.5, slow_call=2.0, reset_timeout=30):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._calls = collections.deque()  # (time.monotonic(), bad)
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """ True while calls are refused or only a trial goes through. """
+        return self.state != 'closed'
+
+    def allow(self):
+        """ Raise :class:`CircuitOpen` if the dependency must not be called now. """
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial = False
+            if self.state == 'half_open' and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpen(self.name)
+
+    def record(self, duration, ok=True):
+        """ Account for one call that took ``duration`` seconds and failed unless ``ok``. """
+        bad = not ok or (self.slow_call and duration >= self.slow_call)
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'half_open':
+                if bad:
+                    self._open(now, "trial call failed")
+                else:
+                    self.state = 'closed'
+                    self._calls.clear()
+                    _logger.warning("Circuit breaker %s closed", self.name)
+                self._trial = False
+                return
+            self._calls.append((now, bad))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            if self.state == 'closed' and len(self._calls) >= self.min_calls:
+                bad_calls = sum(1 for _at, was_bad in self._calls if was_bad)
+                if bad_calls >= self.failure_rate * len(self._calls):
+                    self._open(now, "%s of the last %s calls failed or were slow" % (bad_calls, len(self._calls)))
+
+    def _open(self, now, reason):
+        self.state = 'open'
+        self._opened_at = now
+        self._calls.clear()
+        _logger.warning("Circuit breaker %s opened for %ss: %s", self.name, self.reset_timeout, reason)
+
+
+@contextlib.contextmanager
+def odoo_env(dbname, breaker=None, context=None):
+    """ Superuser environment on a new cursor of ``dbname``, committed when the block succeeds.
+
+    With a ``breaker``, the block is refused while it is open, and database
+    errors (not the errors of the code in the block) and slow blocks count
+    against it.
+    """
+    if breaker:
+        breaker.allow()
+    started = time.monotonic()
+    failed = False
+    try:
+        with span('odoo'), odoo.modules.registry.Registry(dbname).cursor() as cr:
+            yield odoo.api.Environment(cr, odoo.SUPERUSER_ID, context or {})
+    except (OperationalError, InterfaceError, odoo.sql_db.PoolError):
+        failed = True
+        raise
+    finally:
+        if breaker:
+            breaker.record(time.monotonic() - started, not failed)
+
+
+class ResilientRequest(PooledHTTPXRequest):
+    """
+    Bot API transport behind a circuit breaker, with a global flood wait.
+
+    * Network errors and timeouts count against ``breaker``; while it is
+      open, calls fail fast with :class:`CircuitOpen`, except the
+      :data:`ESSENTIAL_API_METHODS`.
+    * A ``RetryAfter`` answer holds every call of the bot, not only the one
+      that received it, for the time Telegram asked; the call is then
+      retried once.
+    """
+
+    def __init__(self, breaker, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self._hold_until = 0.0
+
+    async def post(self, url, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        if method not in ESSENTIAL_API_METHODS:
+            self.breaker.allow()
+        for attempt in range(2):
+            hold = self._hold_until - time.monotonic()
+            if hold > 0:
+                await asyncio.sleep(hold)
+            started = time.monotonic()
+            ok = True
+            try:
+                return await super().post(url, *args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                self._hold_until = max(self._hold_until, time.monotonic() + retry_after)
+                _logger.warning("Telegram flood control: holding all calls for %ss", retry_after)
+                if attempt:
+                    raise
+            except BadRequest:
+                raise  # an answer, not an outage
+            except NetworkError:
+                # Includes TimedOut
+                ok = False
+                raise
+            finally:
+                self.breaker.record(time.monotonic() - started, ok)
@@ -0,0 +1,80 @@
+import collections
+import sys
+import time
+
+
+def deep_sizeof(obj, _seen=None):
+    """ Approximate memory footprint of ``obj`` and of the containers it holds, in bytes. """
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class DataRetention:
+    """
+    Keeps ``application.user_data`` and ``chat_data`` bounded.
+
+    PTB never forgets a user or a chat it has seen, so over months of
+    uptime every group member ends up with an entry. :meth:`observe` (an
+    update observer of :class:`BotApplication`) records when each user and
+    chat was last seen; :meth:`evict` then drops the entries idle for more
+    than ``idle_ttl`` seconds and, least recently seen first, those beyond
+    ``max_users`` / ``max_chats``.
+
+    Evicting only frees memory: with :class:`OdooPersistence` the pending
+    changes are saved first and the stored rows are kept, so an evicted user
+    coming back finds their data again.
+    """
+
+    def __init__(self, max_users=10000, max_chats=2000, idle_ttl=86400):
+        self.max_users = max_users
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self._users = collections.OrderedDict()  # user id -> time.monotonic() of its last update
+        self._chats = collections.OrderedDict()
+
+    def observe(self, update, dequeued_at, finished_at):
+        now = time.monotonic()
+        for seen, obj in ((self._users, getattr(update, 'effective_user', None)),
+                          (self._chats, getattr(update, 'effective_chat', None))):
+            if obj is not None:
+                seen[obj.id] = now
+                seen.move_to_end(obj.id)
+
+    def _expired(self, seen, limit):
+        """ Pop and return the ids to evict from ``seen``, oldest first. """
+        deadline = time.monotonic() - self.idle_ttl if self.idle_ttl else None
+        expired = []
+        while seen:
+            key, last_seen = next(iter(seen.items()))
+            if not (limit and len(seen) > limit) and not (deadline and last_seen < deadline):
+                break
+            seen.popitem(last=False)
+            expired.append(key)
+        return expired
+
+    async def evict(self, application):
+        """ Drop the expired entries from ``application`` and return ``(users, chats, bytes)`` still held. """
+        users = [user_id for user_id in self._expired(self._users, self.max_users) if user_id in application.user_data]
+        chats = [chat_id for chat_id in self._expired(self._chats, self.max_chats) if chat_id in application.chat_data]
+        persistence = application.persistence
+        if (users or chats) and persistence:
+            await application.update_persistence()  # save what changed before forgetting it
+        for user_id in users:
+            if persistence:
+                persistence.forget_user(user_id)
+            application.drop_user_data(user_id)
+        for chat_id in chats:
+            application.drop_chat_data(chat_id)
+        if (users or chats) and persistence:
+            # Hand the drops over now, so they do not hold back the next updates of these users
+            await application.update_persistence()
+        size = deep_sizeof(dict(application.user_data)) + deep_sizeof(dict(application.chat_data))
+        return len(application.user_data), len(application.chat_data), size
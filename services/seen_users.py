@@ -0,0 +1,94 @@
+import threading
+
+import odoo
+
+# Pairs written per statement
+STORE_BATCH = 500
+# Users remembered as already stored; forgotten all at once beyond this
+KNOWN_USERS_LIMIT = 100000
+
+
+def store_seen_users(cr, pairs):
+    """ Upsert ``(telegram_id, username)`` pairs into ``telegram_seen_user``.
+
+    Usernames are lowercased. A username moving to another account is taken
+    away from the one that held it before, so a username always resolves to
+    its latest owner; later pairs win over earlier ones. Returns the number
+    of rows written.
+    """
+    by_id = {}
+    for telegram_id, username in pairs:
+        if telegram_id and username:
+            by_id[str(telegram_id)] = username.lstrip('@').lower()
+    by_username = {username: telegram_id for telegram_id, username in by_id.items()}
+    rows = [(telegram_id, username) for username, telegram_id in by_username.items()]
+    for start in range(0, len(rows), STORE_BATCH):
+        batch = rows[start:start + STORE_BATCH]
+        cr.execute(
+            "DELETE FROM telegram_seen_user WHERE username IN %s AND telegram_id NOT IN %s",
+            (tuple(username for _id, username in batch), tuple(telegram_id for telegram_id, _name in batch)),
+        )
+        placeholders = ", ".join(["(%s, %s, now() at time zone 'UTC', %s, %s, "
+                                  "now() at time zone 'UTC', now() at time zone 'UTC')"] * len(batch))
+        params = []
+        for telegram_id, username in batch:
+            params += [telegram_id, username, odoo.SUPERUSER_ID, odoo.SUPERUSER_ID]
+        cr.execute("""
+            INSERT INTO telegram_seen_user
+                (telegram_id, username, seen_at, create_uid, write_uid, create_date, write_date)
+            VALUES {}
+            ON CONFLICT (telegram_id) DO UPDATE
+               SET username = EXCLUDED.username, seen_at = EXCLUDED.seen_at, write_date = EXCLUDED.write_date
+        """.format(placeholders), params)
+    return len(rows)
+
+
+class SeenUsers:
+    """
+    Collects the id and username of the users appearing in updates, to
+    resolve the profiles that only know a username (see
+    ``telegram.config._backfill_telegram_ids``).
+
+    :meth:`observe` is an update observer of :class:`BotApplication`: it
+    only fills an in-memory buffer, :meth:`flush` writes it in one go off
+    the event loop. A user is buffered again only when their username
+    changed since the last flush.
+    """
+
+    def __init__(self):
+        self._pending = {}  # telegram id -> username
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def observe(self, update, dequeued_at, finished_at):
+        users = [getattr(update, 'effective_user', None)]
+        message = getattr(update, 'effective_message', None)
+        if message is not None and message.new_chat_members:
+            users += message.new_chat_members
+        member = getattr(update, 'chat_member', None)
+        if member is not None:
+            users.append(member.new_chat_member.user)
+        with self._lock:
+            for user in users:
+                if user is None or user.is_bot or not user.username:
+                    continue
+                if self._known.get(user.id) != user.username:
+                    self._pending[user.id] = user.username
+
+    def flush(self, cr):
+        """ Store the buffered pairs on ``cr``; the caller commits. """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            count = store_seen_users(cr, pending.items())
+        except Exception:
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+        with self._lock:
+            if len(self._known) > KNOWN_USERS_LIMIT:
+                self._known.clear()
+            self._known.update(pending)
+        return count
@@ -0,0 +1,22 @@
+import logging
+import sys
+import time
+
+_logger = logging.getLogger(__name__)
+
+# step name -> duration in seconds, filled while the add-on loads
+TIMINGS = {}
+
+
+def record(step, started):
+    """ Store the time elapsed since ``started`` (a ``time.perf_counter()`` value). """
+    TIMINGS[step] = time.perf_counter() - started
+
+
+def report():
+    """ Log the collected startup timings of the add-on in one line. """
+    steps = ", ".join("%s %.1f ms" % (step, duration * 1000) for step, duration in TIMINGS.items())
+    _logger.info(
+        "telegram_bot_manager startup: %s (python-telegram-bot loaded: %s)",
+        steps or "no timings", 'telegram' in sys.modules,
+    )
@@ -3,13 +3,34 @@ import logging
 import asyncio
 import base64
 import os
-import httpx
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler, CallbackQueryHandler, ChatMemberHandler
-from telegram.error import BadRequest, Forbidden
-from telegram.constants import ParseMode
+import time
+import functools
+from datetime import datetime, timedelta, timezone
+from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler, CallbackQueryHandler, ChatMemberHandler, TypeHandler
+from telegram.error import BadRequest, Forbidden, TelegramError
+from telegram.constants import ChatMemberStatus, ChatType, ParseMode
 import odoo
+from .application import BotApplication
+from .conversation import TimedConversationHandler
+from .dedup import UpdateWindow
+from .expiry import MessageExpiry
+from .fingerprint import DecayingCountMinSketch, message_fingerprints
+from .update_queue import PostgresUpdateQueue
+from .persistence import OdooPersistence
+from .ratelimit import Cooldown, SlidingWindowCounter
+from .reachability import ReachabilityIndex
+from .resilience import CircuitBreaker, CircuitOpen, ResilientRequest, odoo_env
+from .transport import PooledHTTPXRequest, transport_options
+from .membership import MEMBER_STATUSES, MembershipCache, channel_status
+from .metrics import LagTracker
+from .retention import DataRetention
+from .seen_users import SeenUsers
+from .bot_config import config_settings, freeze_bot_config
+from .tracing import make_tracer, trace_handlers
+from .profiling import HandlerStats, ProfilingSession
+from .eventlog import EventLog
+from .recorder import UpdateRecorder
 from odoo.addons.myfansbook_core.utils.helpers import reclaim_telegram_username, validate_username
 from odoo.addons.myfansbook_core.utils.helpers import (
     check_password_strength,
@@ -27,24 +48,719 @@ _logger = logging.getLogger(__name__)
 # Constants at the top
 CHOOSING_METHOD, WAITING_EMAIL, WAITING_PASSWORD, WAITING_OTP, WAITING_PHONE, WAITING_LINK_LOGIN, WAITING_LINK_PASSWORD = range(7)
 # CHOOSING_METHOD, WAITING_EMAIL, WAITING_PASSWORD, WAITING_OTP, WAITING_PHONE = range(5)
+# user_data keys of an ongoing registration, cleared when it times out
+REGISTRATION_KEYS = ('reg_login', 'reg_phone', 'reg_type', 'reg_password', 'otp_code', 'link_login')
+
+# Update types the bot listens for.
+# If we don't include 'chat_member', the welcome_new_member function never triggers
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member", "my_chat_member"]
+# Seconds between two heartbeats of the bot loop, watched by the lifecycle supervisor
+HEARTBEAT_INTERVAL = 5
+# Seconds between two writes of the rolling lag percentiles on telegram.config
+METRICS_FLUSH_INTERVAL = 30
+# Seconds between two saves of the processed update_id window on telegram.config
+UPDATE_WINDOW_FLUSH_INTERVAL = 5
+# Durable queue consumers: rows claimed at once, and idle wait when the queue is empty
+QUEUE_BATCH_SIZE = 50
+QUEUE_IDLE_DELAY = 0.5
+# Updates written to the durable queue in one transaction, at most
+QUEUE_WRITE_BATCH_SIZE = 200
+# Seconds between two evictions of idle user/chat data from memory
+DATA_EVICT_INTERVAL = 60
+# Seconds between two sweeps of the expired transient messages, and how long
+# short status notices stay visible
+MESSAGE_EXPIRY_INTERVAL = 5
+STATUS_MESSAGE_TTL = 5
+# Seconds between two reloads of the users unreachable in private, shared by all processes of a bot
+REACHABILITY_RELOAD_INTERVAL = 60
+# Raid and flood protection: counting windows, and how often messages queued
+# for deletion are removed in bulk
+JOIN_WINDOW = 60
+FLOOD_WINDOW = 10
+BULK_DELETE_INTERVAL = 1
+# Telegram's service account and the anonymous group admin, never moderated
+SERVICE_USER_IDS = (777000, 1087968824)
+# Non-essential work postponed while a breaker is open ('defer' shedding policy):
+# how many callbacks may wait, and for how long at most
+MAX_DEFERRED = 500
+DEFER_MAX_DELAY = 300
+# Seconds between two writes of the usernames seen in updates, used by the telegram_id backfill
+SEEN_USERS_FLUSH_INTERVAL = 60
+# Seconds between two checks of telegram.config for changed settings, applied without a restart
+CONFIG_RELOAD_INTERVAL = 10
+# Seconds between two checks for a profiling request made from the form
+PROFILING_POLL_INTERVAL = 5
+
 
 class TelegramBotThread(threading.Thread):
-    def __init__(self, dbname, token, config):
+    """
+    Runs one bot in its own event loop.
+
+    With ``polling=False`` the thread does not fetch updates from Telegram
+    and only consumes the durable update queue (``UPDATE_INGESTION`` set to
+    ``'postgres'``), which lets several processes share the processing.
+    """
+
+    def __init__(self, dbname, token, config, config_id=None, polling=True):
         super().__init__()
         self.daemon = True
         self.dbname = dbname
         self.token = token
-        self.config = config
+        self.config = freeze_bot_config(config)
+        self._config_settings = config_settings(config)
+        self._config_write_date = None
+        self.config_id = config_id
+        self.polling = polling
         self.application = None # Store application to access it later
         self.loop = None        # Store loop to stop it safely
+        self.ready = threading.Event()  # Set once polling is up, or once run() gave up
+        self.error = None               # Exception that ended run(), if any
+        self.drain_timeout = config.get('DRAIN_TIMEOUT', 10)
+        self.started_at = None          # time.monotonic() when polling came up
+        self.last_heartbeat = None      # time.monotonic() of the last beat of the bot loop
+        self.lag_tracker = LagTracker()
+        self._lag_reported = False      # the Monitoring tab shows figures that are not all expired
+        self.update_window = UpdateWindow.load(config.get('LAST_UPDATE_ID'), config.get('UPDATE_WINDOW'))
+        self._saved_update_window = self.update_window.dump()
+        self.update_queue = None
+        if config.get('UPDATE_INGESTION') == 'postgres':
+            self.update_queue = PostgresUpdateQueue(
+                dbname, config_id, config.get('QUEUE_PARTITIONS', 8), config.get('QUEUE_PROCESSES', 1),
+            )
+        self._ingested = asyncio.Queue()  # updates gated for the durable queue, not written yet
+        self.message_expiry = MessageExpiry(dbname, config_id) if config_id else None
+        self.link_warning_cooldown = Cooldown(config.get('LINK_WARNING_COOLDOWN', 300))
+        # A replay (odoo-bin telegram-replay) keeps the bot's own bookkeeping out of the database
+        self.replay = bool(config.get('REPLAY'))
+        self.reachability = ReachabilityIndex(dbname, token.split(':')[0], persist=not self.replay)
+        self.join_counter = SlidingWindowCounter(JOIN_WINDOW, max_keys=1000)
+        self.flood_counter = SlidingWindowCounter(FLOOD_WINDOW)
+        self.lockdowns = {}  # chat id -> {'until': time.monotonic(), 'until_date', 'admins'}
+        self._deletions = {}  # chat id -> message ids waiting for the next bulk delete
+        breaker_options = {
+            'failure_rate': config.get('BREAKER_FAILURE_RATE', 50) / 100,
+            'slow_call': config.get('BREAKER_SLOW_CALL', 2.0),
+            'reset_timeout': config.get('BREAKER_RESET_TIMEOUT', 30),
+        }
+        self.odoo_breaker = CircuitBreaker("Odoo", **breaker_options)
+        self.api_breaker = CircuitBreaker("Telegram Bot API", **breaker_options)
+        self._deferred = set()  # tasks waiting for the breakers to close
+        self.requests = {}  # pool label -> PooledHTTPXRequest, set up in _serve()
+        self.spam_sketch = None
+        if config.get('SPAM_FINGERPRINT_THRESHOLD'):
+            self.spam_sketch = DecayingCountMinSketch(half_life=config.get('SPAM_FINGERPRINT_HALF_LIFE') or 600)
+        self.data_retention = DataRetention(
+            config.get('DATA_MAX_USERS', 10000), config.get('DATA_MAX_CHATS', 2000), config.get('DATA_IDLE_TTL', 86400),
+        )
+        self.seen_users = SeenUsers()
+        self.membership_cache = MembershipCache(config.get('GATE_CACHE_TTL', 300))
+        self.tracer = make_tracer(config, 'telegram-bot %s' % dbname)
+        self.handler_stats = HandlerStats()
+        self.events = EventLog(config)
+        self.recorder = None
+        if config.get('RECORD_DIRECTORY'):
+            self.recorder = UpdateRecorder(config['RECORD_DIRECTORY'], config.get('RECORD_SEGMENT_SIZE', 64) * 1024 * 1024)
+        self._profiling = None  # concurrent.futures.Future of the profiling run in progress
+        self._stop_requested = asyncio.Event()
 
     def run(self):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
-        self.application = Application.builder().token(self.token).build()
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            self.error = e
+            _logger.exception("Telegram Bot for DB %s crashed", self.dbname)
+        finally:
+            self.ready.set()
+            self.loop.close()
+
+    async def _serve(self):
+        """ Bring polling up, flag the thread as ready and wait for a stop request. """
+        builder = Application.builder().token(self.token).application_class(BotApplication)
+        # Separate pools: getUpdates never waits behind the handlers' calls
+        self.requests = {
+            'API': ResilientRequest(self.api_breaker, **transport_options(self.config)),
+            'polling': PooledHTTPXRequest(**transport_options(self.config, 'POLLING')),
+        }
+        builder.request(self.requests['API']).get_updates_request(self.requests['polling'])
+        if self.config.get('API_BASE_URL'):
+            # A local Bot API server, or the fake API of telegram-replay
+            base_url = self.config['API_BASE_URL']
+            builder.base_url(base_url).base_file_url(base_url.replace('/bot', '/file/bot'))
+        if self.config_id and self.config.get('PERSISTENCE_INTERVAL'):
+            builder.persistence(OdooPersistence(self.dbname, self.config_id, self.config['PERSISTENCE_INTERVAL']))
+        self.application = builder.build()
+        if self.application.job_queue is None:
+            _logger.error(
+                "Telegram Bot for DB %s: no job queue (install python-telegram-bot[job-queue]), "
+                "conversations will never time out", self.dbname,
+            )
+        self.application.update_gates.append(self._is_new_update)
+        if self.recorder:
+            self.application.update_gates.append(self.recorder.record)
+        if self.update_queue:
+            self.application.update_gates.append(self._enqueue_update)
+        self.application.update_observers.append(self.lag_tracker.observe)
+        self.application.update_observers.append(self.data_retention.observe)
+        if not self.replay:
+            self.application.update_observers.append(self.seen_users.observe)
+        self._add_handlers()
+        self.handler_stats.install(self.application)
+        trace_handlers(self.application)
+        self.application.tracer = self.tracer
+        self.application.add_error_handler(self._on_error)
+
+        await self.application.initialize()
+        # The access keyboard links to the bot itself, known once initialized
+        self.config = freeze_bot_config({**self._config_settings, 'BOT_USERNAME': self.application.bot.username})
+        try:
+            await asyncio.to_thread(self.reachability.load)
+            if self.polling:
+                if self.update_window.high:
+                    # Resume right after the persisted watermark: getUpdates confirms everything
+                    # below the offset, so nothing already dispatched is fetched again.
+                    # (Updater has no public API for the initial offset.)
+                    self.application.updater._last_update_id = self.update_window.high + 1
+                await self.application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+            await self.application.start()
+            _logger.info("Telegram Bot Started for DB: %s", self.dbname)
+            self.started_at = self.last_heartbeat = time.monotonic()
+            self.ready.set()
+            jobs = [asyncio.create_task(job) for job in self._background_jobs()]
+            consumers = [
+                asyncio.create_task(self._consume_update_queue())
+                for _i in range(self.config.get('QUEUE_CONSUMERS', 4) if self.update_queue else 0)
+            ]
+            try:
+                await self._stop_requested.wait()
+            finally:
+                for job in jobs:
+                    job.cancel()
+                if self._profiling:
+                    self._profiling.cancel()
+                # Consumers stop claiming on the stop request; let them finish their batch
+                if consumers:
+                    _done, pending = await asyncio.wait(consumers, timeout=self.drain_timeout)
+                    for consumer in pending:
+                        consumer.cancel()
+        finally:
+            await self._shutdown()
+
+    def _background_jobs(self):
+        """ Coroutines running alongside polling, cancelled on stop. """
+        return [
+            self._heartbeat(),
+            self._periodic(METRICS_FLUSH_INTERVAL, self._flush_lag_metrics),
+            self._periodic(METRICS_FLUSH_INTERVAL, self._flush_pool_metrics),
+            self._periodic(UPDATE_WINDOW_FLUSH_INTERVAL, self._flush_update_window),
+            self._evict_data(),
+            self._delete_expired_messages(),
+            self._periodic(REACHABILITY_RELOAD_INTERVAL, self.reachability.load),
+            self._bulk_delete(),
+            self._periodic(SEEN_USERS_FLUSH_INTERVAL, self._flush_seen_users),
+            self._periodic(CONFIG_RELOAD_INTERVAL, self._reload_config),
+            self._periodic(PROFILING_POLL_INTERVAL, self._check_profiling_request),
+        ] + ([self._write_update_queue()] if self.update_queue else [])
+
+    async def _periodic(self, interval, job):
+        """ Run the blocking ``job`` every ``interval`` seconds, off the event loop. """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(job)
+            except CircuitOpen:
+                pass  # Odoo is unavailable: skip this run
+            except Exception:
+                _logger.exception("Telegram Bot periodic job %s failed", job.__name__)
+
+    async def _heartbeat(self):
+        """ Beat while polling is alive; a stale beat means the loop is blocked or polling died. """
+        while True:
+            if not self.polling or self.application.updater.running:
+                self.last_heartbeat = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def _is_new_update(self, update):
+        """ Update gate: drop updates already dispatched (redelivery after a crash or restart).
+
+        The id is recorded before the handlers run: delivery is at-most-once,
+        an update whose handlers were interrupted by a crash is not retried.
+        """
+        if not isinstance(update, Update) or self.update_window.add(update.update_id):
+            return True
+        _logger.info("Telegram Bot for DB %s: dropping duplicate update %s", self.dbname, update.update_id)
+        return False
+
+    def _enqueue_update(self, update):
+        """ Update gate of the 'postgres' ingestion: buffer the update for the queue writer. """
+        if not isinstance(update, Update):
+            return True
+        self._ingested.put_nowait(update)
+        return False
+
+    async def _write_update_queue(self):
+        """ Store the buffered updates in the durable queue, in batches and off the event loop. """
+        while True:
+            batch = [await self._ingested.get()]
+            while len(batch) < QUEUE_WRITE_BATCH_SIZE and not self._ingested.empty():
+                batch.append(self._ingested.get_nowait())
+            await self._store_ingested(batch)
+
+    async def _store_ingested(self, batch):
+        try:
+            await asyncio.to_thread(self.update_queue.put_many, batch)
+        except Exception as e:
+            _logger.error("Could not queue %s updates, processing them in memory: %s", len(batch), e)
+            for update in batch:
+                await self.application.dispatch_update(update)
+
+    async def _flush_ingested(self):
+        """ On stop, once polling is down: store what the writer did not get to. """
+        batch = []
+        while not self._ingested.empty():
+            batch.append(self._ingested.get_nowait())
+        if batch:
+            await self._store_ingested(batch)
+
+    async def _consume_update_queue(self):
+        """ Claim batches of queued updates, one partition at a time, and dispatch them in order. """
+        while not self._stop_requested.is_set():
+            try:
+                claim = await asyncio.to_thread(self.update_queue.claim, QUEUE_BATCH_SIZE)
+            except Exception as e:
+                _logger.error("Telegram update queue: claim failed: %s", e)
+                claim = None
+            if not claim:
+                await asyncio.sleep(QUEUE_IDLE_DELAY)
+                continue
+            done = []
+            failure = None
+            try:
+                for row_id, payload in claim.rows:
+                    try:
+                        update = Update.de_json(payload, self.application.bot)
+                        await self.application.dispatch_update(update)
+                    except Exception as e:
+                        # The later updates of the partition wait for this one to be retried
+                        _logger.exception("Telegram update queue: row %s failed", row_id)
+                        failure = (row_id, str(e))
+                        break
+                    done.append(row_id)
+            except BaseException:
+                # Cancelled mid-batch: give the rows back, they will be consumed again
+                await asyncio.to_thread(claim.release)
+                raise
+            await asyncio.to_thread(claim.complete, done, failure)
+
+    def _flush_update_window(self):
+        """ Persist the update_id watermark and bitmap when they changed since the last save. """
+        state = self.update_window.dump()
+        if state == self._saved_update_window or not self.config_id or not self.polling:
+            return
+        with self.odoo_env() as env:
+            env['telegram.config'].browse(self.config_id).exists().write({
+                'last_update_id': state[0],
+                'update_window': state[1],
+            })
+        self._saved_update_window = state
+
+    async def expire_messages(self, messages, ttl):
+        """ Have the bot delete ``messages`` (Message objects) in ``ttl`` seconds, even across restarts. """
+        messages = [(message.chat_id, message.message_id) for message in messages if message]
+        if not self.message_expiry or not ttl or not messages:
+            return
+        try:
+            await asyncio.to_thread(self.message_expiry.schedule, messages, ttl)
+        except Exception as e:
+            _logger.error("Could not schedule the deletion of %s messages: %s", len(messages), e)
+
+    async def _delete_expired_messages(self):
+        """ Delete the transient messages whose time has come, 100 per call and chat. """
+        if not self.message_expiry:
+            return
+        while True:
+            await asyncio.sleep(MESSAGE_EXPIRY_INTERVAL)
+            try:
+                due = await asyncio.to_thread(self.message_expiry.pop_due)
+            except Exception as e:
+                _logger.error("Telegram message expiry: could not read the due messages: %s", e)
+                continue
+            for chat_id, message_ids in due.items():
+                for start in range(0, len(message_ids), 100):
+                    batch = message_ids[start:start + 100]
+                    try:
+                        await self.application.bot.delete_messages(chat_id, batch)
+                    except BadRequest as e:
+                        # Already deleted, too old, or the bot lost its rights: nothing to retry
+                        _logger.info("Could not delete expired messages in chat %s: %s", chat_id, e)
+                    except TelegramError as e:
+                        _logger.warning("Deleting expired messages in chat %s failed, retrying later: %s", chat_id, e)
+                        await self._reschedule_expired(chat_id, batch)
+
+    async def _reschedule_expired(self, chat_id, message_ids):
+        try:
+            await asyncio.to_thread(
+                self.message_expiry.schedule, [(chat_id, message_id) for message_id in message_ids], MESSAGE_EXPIRY_INTERVAL,
+            )
+        except Exception as e:
+            _logger.error("Could not reschedule the deletion of %s messages: %s", len(message_ids), e)
+
+    async def send_private(self, user_id, text, **kwargs):
+        """ Send a private message, unless ``user_id`` is known not to receive them.
+
+        :return: the sent message, or None when it was not delivered
+        """
+        if not self.reachability.is_reachable(user_id):
+            return None
+        try:
+            return await self.application.bot.send_message(chat_id=user_id, text=text, **kwargs)
+        except Forbidden:
+            # Never started the bot, or blocked it
+            await self._set_reachable(user_id, False)
+            return None
+
+    async def _set_reachable(self, user_id, reachable, reason='forbidden'):
+        if self.reachability.is_reachable(user_id) == reachable:
+            return
+        try:
+            if reachable:
+                await asyncio.to_thread(self.reachability.mark_reachable, user_id)
+            else:
+                await asyncio.to_thread(self.reachability.mark_unreachable, user_id, reason)
+        except Exception as e:
+            _logger.error("Could not store the reachability of user %s: %s", user_id, e)
+
+    async def _track_private_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ A user writing to the bot privately (/start or anything else) can be written to again. """
+        if update.my_chat_member or not update.effective_user:
+            return
+        if update.effective_chat and update.effective_chat.type == ChatType.PRIVATE:
+            await self._set_reachable(update.effective_user.id, True)
+
+    async def track_bot_membership(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ Follow users blocking and unblocking the bot in their private chat. """
+        result = update.my_chat_member
+        if result.chat.type != ChatType.PRIVATE:
+            return
+        status = result.new_chat_member.status
+        if status == ChatMemberStatus.BANNED:
+            await self._set_reachable(result.chat.id, False, 'blocked')
+        elif status == ChatMemberStatus.MEMBER:
+            await self._set_reachable(result.chat.id, True)
+
+    def delete_soon(self, message):
+        """ Queue ``message`` for the next bulk delete of its chat. """
+        self._deletions.setdefault(message.chat_id, []).append(message.message_id)
+
+    async def _bulk_delete(self):
+        """ Delete the queued messages with one call per chat and per 100 messages. """
+        while True:
+            await asyncio.sleep(BULK_DELETE_INTERVAL)
+            deletions, self._deletions = self._deletions, {}
+            for chat_id, message_ids in deletions.items():
+                for start in range(0, len(message_ids), 100):
+                    try:
+                        await self.application.bot.delete_messages(chat_id, message_ids[start:start + 100])
+                    except TelegramError as e:
+                        _logger.warning("Bulk delete in chat %s failed: %s", chat_id, e)
+
+    def _active_lockdown(self, chat_id):
+        lockdown = self.lockdowns.get(chat_id)
+        if lockdown and lockdown['until'] <= time.monotonic():
+            del self.lockdowns[chat_id]
+            _logger.info("Telegram Bot for DB %s: lockdown of chat %s is over", self.dbname, chat_id)
+            return None
+        return lockdown
+
+    async def _enter_lockdown(self, context, chat, reason):
+        """ Switch ``chat`` to lockdown for LOCKDOWN_DURATION seconds. """
+        duration = self.config.get('LOCKDOWN_DURATION', 600)
+        try:
+            admins = {member.user.id for member in await context.bot.get_chat_administrators(chat.id)}
+        except TelegramError as e:
+            _logger.error("Lockdown of chat %s: could not list the admins: %s", chat.id, e)
+            admins = set()
+        lockdown = self.lockdowns[chat.id] = {
+            'until': time.monotonic() + duration,
+            'until_date': datetime.now(timezone.utc) + timedelta(seconds=duration),
+            'admins': admins,
+        }
+        _logger.warning("Telegram Bot for DB %s: chat %s locked down for %ss (%s)", self.dbname, chat.id, duration, reason)
+        try:
+            notice = await context.bot.send_message(
+                chat_id=chat.id,
+                text=f"🔒 This group is in lockdown for {duration // 60} minutes ({reason}). New members are muted.",
+            )
+            await self.expire_messages([notice], duration)
+        except TelegramError as e:
+            _logger.warning("Lockdown of chat %s: could not post the notice: %s", chat.id, e)
+        return lockdown
+
+    async def guard_flood(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ Count messages per user; in lockdown, floods and links of non-admins go without further processing.
+
+        Content posted too often across chats (same normalized text or media) is deleted as well.
+        """
+        message = update.effective_message
+        user = update.effective_user
+        chat = update.effective_chat
+        if not message or not user or user.id in SERVICE_USER_IDS or user.id == context.bot.id:
+            return
+        if user.id == self.config['OWNER_ID']:
+            return
+
+        limit = self.config.get('FLOOD_MESSAGE_LIMIT')
+        flooding = bool(limit) and self.flood_counter.add((chat.id, user.id)) > limit
+        lockdown = self._active_lockdown(chat.id)
+        if flooding and lockdown is None:
+            lockdown = await self._enter_lockdown(context, chat, "message flood")
+        if lockdown is not None and user.id not in lockdown['admins']:
+            has_link = any(e.type in ["url", "text_link"] for e in message.entities or ())
+            if flooding or has_link:
+                # No Odoo lookup and no warning: delete and stop here
+                self.delete_soon(message)
+                raise ApplicationHandlerStop
+
+        if self.spam_sketch and await self._is_repeated_spam(context, message, chat, user):
+            self.delete_soon(message)
+            raise ApplicationHandlerStop
+
+    async def guard_joins(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """ Count joins per group; during a lockdown newcomers are muted, neither looked up nor welcomed.
+
+        Runs before the welcome, which is shed under overload: moderation never is.
+        """
+        result = update.chat_member
+        chat = result.chat
+        if result.new_chat_member.status != ChatMemberStatus.MEMBER or chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+            return
+        user = result.new_chat_member.user
+        limit = self.config.get('RAID_JOIN_LIMIT')
+        joins = self.join_counter.add(chat.id)
+        lockdown = self._active_lockdown(chat.id)
+        if lockdown is None and limit and joins > limit:
+            lockdown = await self._enter_lockdown(context, chat, "join raid")
+        if lockdown is None:
+            return
+        try:
+            await context.bot.restrict_chat_member(
+                chat.id, user.id, ChatPermissions.no_permissions(), until_date=lockdown['until_date'],
+            )
+        except TelegramError as e:
+            self.events.warning('welcome_new_member', 'restrict_failed', chat=chat.id, user=user.id, error=e)
+        raise ApplicationHandlerStop
+
+    async def _is_repeated_spam(self, context, message, chat, user):
+        """ True when the text or media of ``message`` was seen too often lately, in any chat. """
+        threshold = self.config['SPAM_FINGERPRINT_THRESHOLD']
+        # Count every fingerprint (text and media) before testing any of them
+        counts = [self.spam_sketch.add(fingerprint) for fingerprint in message_fingerprints(message)]
+        if not any(count > threshold for count in counts):
+            return False
+        # Rare path: admins may repeat their announcements
+        try:
+            member = await context.bot.get_chat_member(chat.id, user.id)
+            if member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+                return False
+        except TelegramError:
+            pass
+        _logger.info("Telegram Bot for DB %s: deleting repeated content from %s in chat %s", self.dbname, user.id, chat.id)
+        return True
+
+    async def _evict_data(self):
+        """ Evict idle user/chat data from memory and report what is left on telegram.config. """
+        while True:
+            await asyncio.sleep(DATA_EVICT_INTERVAL)
+            try:
+                held = await self.data_retention.evict(self.application)
+                await asyncio.to_thread(self._store_memory_report, *held)
+            except Exception:
+                _logger.exception("Telegram Bot for DB %s: data eviction failed", self.dbname)
+
+    def _store_memory_report(self, users, chats, size):
+        if not self.config_id:
+            return
+        with self.odoo_env() as env:
+            env['telegram.config'].browse(self.config_id).exists().write({
+                'data_memory_report': "%s users, %s chats, ~%d KiB" % (users, chats, size // 1024),
+            })
+
+    def _flush_lag_metrics(self):
+        snapshot = self.lag_tracker.snapshot()
+        # An idle bot clears its figures once, instead of leaving the last burst on display
+        if not self.config_id or not (snapshot or self._lag_reported):
+            return
+        with self.odoo_env() as env:
+            env['telegram.config'].browse(self.config_id).exists()._store_lag_metrics(snapshot)
+        self._lag_reported = bool(snapshot)
+
+    def _flush_pool_metrics(self):
+        """ Store how long requests waited for a pooled connection, per pool. """
+        if not self.config_id:
+            return
+        parts = []
+        for label, request in self.requests.items():
+            stats = request.pool_stats.snapshot()
+            parts.append("%s: %d/%d waited (p95 %.3fs, max %.3fs), %d timeouts" % (
+                label, stats['waited'], stats['requests'], stats['p95'], stats['max_wait'], stats['timeouts'],
+            ))
+        with self.odoo_env() as env:
+            env['telegram.config'].browse(self.config_id).exists().write({'http_pool_report': "; ".join(parts)})
+
+    def _reload_config(self):
+        """ Pick up changed settings of telegram.config; a single indexed read when nothing changed. """
+        if not self.config_id:
+            return
+        with self.odoo_env() as env:
+            env.cr.execute("SELECT write_date FROM telegram_config WHERE id = %s", (self.config_id,))
+            row = env.cr.fetchone()
+            if not row or row[0] == self._config_write_date:
+                return
+            self._config_write_date = row[0]
+            # The bot's own writes (metrics, update window) touch write_date too: compare the settings
+            settings = config_settings(env['telegram.config'].browse(self.config_id)._prepare_bot_config())
+        if settings == self._config_settings:
+            return
+        self._config_settings = settings
+        self.loop.call_soon_threadsafe(
+            self._apply_config, freeze_bot_config({**settings, 'BOT_USERNAME': self.application.bot.username}),
+        )
+
+    def _apply_config(self, config):
+        """ Swap in ``config`` (on the event loop) and retune what was built from the previous one.
+
+        The connection pools, the update ingestion, persistence and the
+        conversation timeouts are set up once: changing them still takes a
+        restart of the bot.
+        """
+        self.config = config
+        self.drain_timeout = config.get('DRAIN_TIMEOUT', 10)
+        self.link_warning_cooldown.window = config.get('LINK_WARNING_COOLDOWN', 300)
+        for breaker in (self.odoo_breaker, self.api_breaker):
+            breaker.failure_rate = config.get('BREAKER_FAILURE_RATE', 50) / 100
+            breaker.slow_call = config.get('BREAKER_SLOW_CALL', 2.0)
+            breaker.reset_timeout = config.get('BREAKER_RESET_TIMEOUT', 30)
+        self.data_retention.max_users = config.get('DATA_MAX_USERS', 10000)
+        self.data_retention.max_chats = config.get('DATA_MAX_CHATS', 2000)
+        self.data_retention.idle_ttl = config.get('DATA_IDLE_TTL', 86400)
+        self.membership_cache.ttl = config.get('GATE_CACHE_TTL', 300)
+        self.tracer.sample_ratio = config.get('TRACE_SAMPLE_RATIO') or 0.0
+        self.events.configure(config)
+        if not config.get('SPAM_FINGERPRINT_THRESHOLD'):
+            self.spam_sketch = None
+        elif not self.spam_sketch:
+            self.spam_sketch = DecayingCountMinSketch(half_life=config.get('SPAM_FINGERPRINT_HALF_LIFE') or 600)
+        _logger.info("Telegram Bot for DB %s: configuration reloaded", self.dbname)
+
+    def _check_profiling_request(self):
+        """ Claim a profiling request of the form and start the run on the event loop. """
+        if not self.config_id or (self._profiling and not self._profiling.done()):
+            return
+        with self.odoo_env() as env:
+            # Claimed atomically: every process running this configuration polls it
+            env.cr.execute("""
+                UPDATE telegram_config SET profile_state = 'running'
+                 WHERE id = %s AND profile_state = 'requested'
+             RETURNING profile_cpu, profile_memory, profile_handlers, profile_duration
+            """, (self.config_id,))
+            row = env.cr.fetchone()
+        if row:
+            self._profiling = asyncio.run_coroutine_threadsafe(self._profile(*row), self.loop)
+
+    async def _profile(self, cpu, memory, handlers, duration):
+        session = ProfilingSession(cpu, memory, self.handler_stats if handlers else None)
+        session.start()
+        _logger.info("Telegram Bot for DB %s: profiling for %ss", self.dbname, duration)
+        try:
+            await asyncio.sleep(duration or 60)
+        finally:
+            summary, files = session.stop()
+            await asyncio.to_thread(self._store_profile, summary, files)
+
+    def _store_profile(self, summary, files):
+        """ Post the profiling results on the configuration, as attachments. """
+        with self.odoo_env() as env:
+            config = env['telegram.config'].browse(self.config_id).exists()
+            attachments = env['ir.attachment'].create([{
+                'name': name,
+                'raw': content,
+                'mimetype': mimetype,
+                'res_model': 'telegram.config',
+                'res_id': config.id,
+            } for name, mimetype, content in files])
+            config.write({'profile_state': 'idle', 'profile_report': summary})
+            config.message_post(body=summary, attachment_ids=attachments.ids)
+
+    def _flush_seen_users(self):
+        with self.odoo_env() as env:
+            self.seen_users.flush(env.cr)
+
+    def odoo_env(self, context=None):
+        """ Environment on a new cursor, committed at the end of the block, behind the Odoo breaker. """
+        return odoo_env(self.dbname, self.odoo_breaker, context)
+
+    def _shedding(self):
+        """ True when non-essential work should be dropped or postponed. """
+        return self.config.get('SHEDDING_POLICY', 'off') != 'off' and (
+            self.odoo_breaker.is_open or self.api_breaker.is_open
+        )
+
+    def non_essential(self, callback):
+        """ Wrap a handler callback whose work can be skipped or postponed while a dependency is down. """
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            if not self._shedding():
+                return await callback(update, context)
+            if self.config.get('SHEDDING_POLICY') == 'defer' and len(self._deferred) < MAX_DEFERRED:
+                task = asyncio.create_task(self._run_when_recovered(callback, update, context))
+                self._deferred.add(task)
+                task.add_done_callback(self._deferred.discard)
+            else:
+                _logger.debug("Shedding %s for update %s", callback.__name__, update.update_id)
+        return wrapper
+
+    async def _run_when_recovered(self, callback, update, context):
+        deadline = time.monotonic() + DEFER_MAX_DELAY
+        while self._shedding():
+            if time.monotonic() > deadline:
+                _logger.info("Dropping deferred %s for update %s", callback.__name__, update.update_id)
+                return
+            await asyncio.sleep(1)
+        try:
+            await callback(update, context)
+        except Exception:
+            _logger.exception("Deferred %s failed", callback.__name__)
+
+    async def _on_error(self, update, context: ContextTypes.DEFAULT_TYPE):
+        """ Fail fast while a dependency is down: tell the user to come back shortly. """
+        if not isinstance(context.error, CircuitOpen):
+            _logger.error("Telegram Bot handler error on update %s", getattr(update, 'update_id', None), exc_info=context.error)
+            return
+        _logger.info("Telegram Bot for DB %s: %s", self.dbname, context.error)
+        if isinstance(update, Update) and update.effective_chat and update.effective_chat.type == ChatType.PRIVATE:
+            try:
+                await update.effective_chat.send_message("⏳ We are experiencing high load. Please try again shortly.")
+            except (CircuitOpen, TelegramError):
+                pass
+
+    def is_stalled(self, timeout):
+        """ True when the bot came up but has not beaten for ``timeout`` seconds. """
+        return bool(self.last_heartbeat and time.monotonic() - self.last_heartbeat > timeout)
+
+    def _add_handlers(self):
+        # 0. Raid/flood guards first (never shed), then bookkeeping that must see every update
+        self.application.add_handler(
+            MessageHandler(filters.ChatType.GROUPS & filters.UpdateType.MESSAGE, self.guard_flood), group=-2,
+        )
+        self.application.add_handler(ChatMemberHandler(self.guard_joins, ChatMemberHandler.CHAT_MEMBER), group=-2)
+        self.application.add_handler(TypeHandler(Update, self._track_private_activity), group=-1)
+        self.application.add_handler(ChatMemberHandler(self.track_bot_membership, ChatMemberHandler.MY_CHAT_MEMBER))
 
         # 1. The Registration Conversation (MOVE THIS TO THE TOP)
-        reg_conv = ConversationHandler(
+        default_timeout = self.config.get('CONVERSATION_TIMEOUT')
+        secret_timeout = self.config.get('CONVERSATION_SECRET_TIMEOUT') or default_timeout
+        reg_conv = TimedConversationHandler(
             entry_points=[CommandHandler("start", self.start_command),
             CallbackQueryHandler(self.start_command, pattern="^restart_start$"),
 
@@ -76,9 +792,18 @@ class TelegramBotThread(threading.Thread):
                 CallbackQueryHandler(self.cancel_reg, pattern="^cancel_reg$"),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, self.process_link_password),
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, self.registration_timeout)],
             },
             fallbacks=[CommandHandler("cancel", self.cancel_reg)],
             per_message=False,
+            name="reg_conv",
+            persistent=self.application.persistence is not None,
+            # Steps holding a password or a one-time code expire sooner
+            state_timeouts={
+                state: secret_timeout if state in (WAITING_PASSWORD, WAITING_OTP, WAITING_LINK_PASSWORD) else default_timeout
+                for state in (CHOOSING_METHOD, WAITING_EMAIL, WAITING_PASSWORD, WAITING_OTP,
+                              WAITING_PHONE, WAITING_LINK_LOGIN, WAITING_LINK_PASSWORD)
+            },
         )
         self.application.add_handler(reg_conv)
 
@@ -86,11 +811,11 @@ class TelegramBotThread(threading.Thread):
         
 
         # Welcome Handler for new members
-        self.application.add_handler(ChatMemberHandler(self.welcome_new_member, ChatMemberHandler.CHAT_MEMBER))
+        self.application.add_handler(ChatMemberHandler(self.non_essential(self.welcome_new_member), ChatMemberHandler.CHAT_MEMBER))
 
         # 2. Handlers that run OUTSIDE the conversation (AFTER ConversationHandler)
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.link_handler))
-        self.application.add_handler(CommandHandler("hello", self.greetings))
+        self.application.add_handler(CommandHandler("hello", self.non_essential(self.greetings)))
         self.application.add_handler(CommandHandler("setup_post", self.post_welcome_button))
 
   
@@ -100,58 +825,54 @@ class TelegramBotThread(threading.Thread):
         # 3. Catch-all (STAYS LAST)
         self.application.add_handler(MessageHandler(filters.COMMAND, self.unknown_command))
 
-        _logger.info(f"Telegram Bot Started for DB: {self.dbname}")
-        # Define which updates the bot should listen for
-        # If we don't include 'chat_member', the welcome_new_member function never triggers
-        allowed_updates = ["message", "callback_query", "chat_member", "my_chat_member"]
-
-        self.application.run_polling(
-            close_loop=False, 
-            stop_signals=False,
-            allowed_updates=allowed_updates # CRITICAL ADDITION
-        )
-    
-
-
     def stop_polling(self):
-        """ Method called from the Odoo Main Thread to stop the bot """
-        if self.application and self.application.running:
-            _logger.info("Stopping Telegram Bot for DB: %s", self.dbname)
-            
-            # Use the loop to schedule the shutdown tasks
-            try:
-                # We use a threadsafe call to stop the polling first
-                # This breaks the run_polling() block
-                future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
-                future.result(timeout=10) 
-            except Exception as e:
-                _logger.error("Error during bot shutdown: %s", e)
-            finally:
-                # Force the loop to stop if it hasn't already
-                if self.loop and self.loop.is_running():
-                    self.loop.call_soon_threadsafe(self.loop.stop)
+        """ Ask the bot loop to stop. Returns immediately, join() the thread to wait. """
+        _logger.info("Stopping Telegram Bot for DB: %s", self.dbname)
+        loop = self.loop
+        if loop and loop.is_running():
+            loop.call_soon_threadsafe(self._stop_requested.set)
+        else:
+            self._stop_requested.set()
 
     async def _shutdown(self):
         """ Private coroutine to handle async shutdown sequences """
         try:
-            # 1. Stop the updater/polling first
+            # 1. Stop the updater/polling first: no new updates come in
             if self.application.updater and self.application.updater.running:
                 await self.application.updater.stop()
-            
-            # 2. Stop the application logic
+            if self.update_queue:
+                await self._flush_ingested()
+
+            # 2. Drain the updates already fetched, within the deadline
             if self.application.running:
-                await self.application.stop()
-            
+                try:
+                    await asyncio.wait_for(self.application.stop(), timeout=self.drain_timeout)
+                except asyncio.TimeoutError:
+                    _logger.warning(
+                        "Telegram Bot for DB %s: pending updates not drained within %ss, dropping them",
+                        self.dbname, self.drain_timeout,
+                    )
+
             # 3. Final shutdown of network transports
             await self.application.shutdown()
+
+            # 4. Save the watermark of what was dispatched, hand the queue partitions over
+            await asyncio.to_thread(self._flush_update_window)
+            if self.update_queue:
+                await asyncio.to_thread(self.update_queue.close)
+
+            # 5. Export the spans still queued
+            await asyncio.to_thread(self.tracer.close)
+
+            # 6. Write the updates still waiting to be recorded
+            if self.recorder:
+                await asyncio.to_thread(self.recorder.close)
         except Exception as e:
             _logger.warning("Graceful shutdown encountered an issue: %s", e)
 
     def trigger_odoo_otp(self, email, name, otp_code):
         try:
-            db_registry = odoo.modules.registry.Registry(self.dbname)
-            with db_registry.cursor() as cr:
-                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            with self.odoo_env() as env:
                 
                 # 1. Save to your existing otp.verification model
                 env['otp.verification'].sudo().create({
@@ -185,31 +906,28 @@ class TelegramBotThread(threading.Thread):
                 }
                 env['mail.mail'].sudo().create(mail_values).send()
                 
-                cr.commit()
+                env.cr.commit()
             return True
         except Exception as e:
             _logger.error(f"OTP Email Error: {e}")
             return False
 
     def get_odoo_user(self, tg_user):
-        """Helper to query Odoo using permanent ID first, then username."""
+        """Helper to query Odoo by the permanent Telegram ID (indexed)."""
         tg_id = str(tg_user.id)
         tg_handle = tg_user.username # This will be None/False if not set
         
-        db_registry = odoo.modules.registry.Registry(self.dbname)
-        with db_registry.cursor() as cr:
-            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        with self.odoo_env() as env:
             
-            # Construct the domain dynamically
-            # We ALWAYS search by ID
-            domain = [('telegram_id', '=', tg_id)]
-            
-            # ONLY add the username to the search if it exists
-            # This prevents matching a user with no username against an Odoo record with no username
-            if tg_handle:
-                domain = ['|'] + domain + [('telegram_username', '=', tg_handle)]
-            
-            user_profile = env['myfans.user'].search(domain, limit=1)
+            user_profile = env['myfans.user'].search([('telegram_id', '=', tg_id)], limit=1)
+
+            # Profiles not backfilled yet: a username only ever claims a profile
+            # without an ID, so a recycled username cannot take over an account
+            if not user_profile and tg_handle:
+                user_profile = env['myfans.user'].search([
+                    ('telegram_id', '=', False),
+                    ('telegram_username', '=', tg_handle),
+                ], limit=1)
             
             if user_profile:
                 vals = {}
@@ -223,10 +941,11 @@ class TelegramBotThread(threading.Thread):
                 
                 if vals:
                     user_profile.sudo().write(vals)
-                    cr.commit()
+                    env.cr.commit()
 
                 return {
                     'allowed': user_profile.allowed_url_message,
+                    'channel_member': user_profile._is_telegram_channel_member(self.config['CHANNEL_ID']),
                     'name': user_profile.display_name,
                     'status': user_profile.account_status,
                     'phone': user_profile.phone,
@@ -234,6 +953,22 @@ class TelegramBotThread(threading.Thread):
                 }
         return None
 
+    async def registration_timeout(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Runs when a registration was left idle too long: forget what was typed so far."""
+        for key in REGISTRATION_KEYS:
+            context.user_data.pop(key, None)
+        start_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("Restart Registration 🔄", callback_data="restart_start")]
+        ])
+        try:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text="Your registration timed out. Type /start or use the button below to begin again.",
+                reply_markup=start_keyboard,
+            )
+        except (BadRequest, Forbidden) as e:
+            _logger.info("Could not notify user of the registration timeout: %s", e)
+
     async def cancel_reg(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Cancels and ends the conversation, handling both command and button input."""
         query = update.callback_query
@@ -275,13 +1010,14 @@ class TelegramBotThread(threading.Thread):
         # We reuse your existing is_user_admin logic but check for the current chat
         try:
             member = await chat.get_member(user.id)
-            print(f"DEBUG: User {user.id} status in {chat.id} is: {member.status} and the username is: {user.username}")
+            self.events.debug('clear_chat', 'admin_check', user=user.id, chat=chat.id, status=member.status)
             # username is: GroupAnonymousBot
             if member.status not in ["left",'administrator', 'creator'] and user.id != self.config['OWNER_ID']:
+                self.events.info('clear_chat', 'unauthorized', user=user.id, chat=chat.id)
                 await update.message.reply_text("❌ Unauthorized: Only admins can clear the chat.")
                 return
         except Exception as e:
-            _logger.error(f"Error checking admin status for clear: {e}")
+            self.events.error('clear_chat', 'admin_check_failed', user=user.id, chat=chat.id, error=e)
             return
 
         # 3. Message Deletion Loop
@@ -301,7 +1037,9 @@ class TelegramBotThread(threading.Thread):
                 # This happens if message is > 48h old or already deleted
                 continue
             except Exception as e:
-                _logger.error(f"Clear chat error at ID {i}: {e}")
+                self.events.error('clear_chat', 'delete_failed', chat=chat.id, message=i, error=e)
+
+        self.events.info('clear_chat', 'cleared', chat=chat.id, user=user.id, deleted=deleted_count)
 
         # Send confirmation and set it to auto-delete after 5 seconds
         final_msg = await context.bot.send_message(
@@ -309,13 +1047,8 @@ class TelegramBotThread(threading.Thread):
             text=f"✅ Cleaned {deleted_count} messages."
         )
         
-        # Optional: Delete the "Cleaned" notification after 5 seconds
-        context.job_queue.run_once(self.delete_notification, 5, data={'chat_id': chat.id, 'message_id': final_msg.message_id})
-
-    async def delete_notification(self, context: ContextTypes.DEFAULT_TYPE):
-        """Helper to delete the 'Cleaned' status message."""
-        job = context.job
-        await context.bot.delete_message(chat_id=job.data['chat_id'], message_id=job.data['message_id'])
+        # Delete the status notices after 5 seconds
+        await self.expire_messages([status_msg, final_msg], STATUS_MESSAGE_TTL)
 
 
     async def start_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -362,17 +1095,15 @@ class TelegramBotThread(threading.Thread):
         if not phone.startswith('+'):
             phone = f"+{phone}"
 
-        db_registry = odoo.modules.registry.Registry(self.dbname)
-        with db_registry.cursor() as cr:
-            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
-
-                
-            if is_phone_taken(env, phone):
-                await update.message.reply_text(
-                    "⚠️ This phone number is already linked to an account.",
-                    reply_markup=ReplyKeyboardRemove()
-                )
-                return ConversationHandler.END
+        # Only the lookup holds the cursor: Telegram is answered once it is closed
+        with self.odoo_env() as env:
+            taken = is_phone_taken(env, phone)
+        if taken:
+            await update.message.reply_text(
+                "⚠️ This phone number is already linked to an account.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+            return ConversationHandler.END
 
         context.user_data['reg_login'] = phone
         context.user_data['reg_phone'] = phone
@@ -399,13 +1130,11 @@ class TelegramBotThread(threading.Thread):
             return WAITING_EMAIL # Stay in this state to wait for a correct email
         
         # 2. Database Check (Create a thread-safe env)
-        db_registry = odoo.modules.registry.Registry(self.dbname)
-        with db_registry.cursor() as cr:
-            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
-                
-            if is_email_taken(env, email):
-                await update.message.reply_text("⚠️ This email is already registered. Please use another:")
-                return WAITING_EMAIL
+        with self.odoo_env() as env:
+            taken = is_email_taken(env, email)
+        if taken:
+            await update.message.reply_text("⚠️ This email is already registered. Please use another:")
+            return WAITING_EMAIL
         
         # If valid, store data and move to password
         context.user_data['reg_login'] = email
@@ -492,54 +1221,46 @@ class TelegramBotThread(threading.Thread):
         tg_username = update.effective_user.username
         user_id = update.effective_user.id
         tg_bio = ""
-        tg_dob = False
 
-        try:
-            # We must get the full Chat object to see the 'bio' field
-            full_chat = await context.bot.get_chat(user_id)
-            print(f"DEBUG: Bio is: {full_chat}")
-            tg_bio = full_chat.bio or ""
-
-            # 2. Collect Birthday (if available and shared by user)
-            if full_chat.birthdate:
-                bd = full_chat.birthdate
-                # format for Odoo (YYYY-MM-DD). If year is hidden, we use a placeholder or handle it.
-                year = bd.year or 1900 
-                tg_dob = f"{year}-{bd.month:02d}-{bd.day:02d}"
-                print(f"DEBUG: Birthday is: {tg_dob}")
-        except Exception as bio_err:
-            _logger.warning(f"Could not fetch user bio: {bio_err}")
+        # Bio and photo are extras: skipped while a dependency is struggling
+        profile_image_base64 = False
+        photo_unique_id = False
+        if not self._shedding():
+            try:
+                # We must get the full Chat object to see the 'bio' field
+                full_chat = await context.bot.get_chat(user_id)
+                tg_bio = full_chat.bio or ""
+            except Exception as bio_err:
+                _logger.warning(f"Could not fetch user bio: {bio_err}")
 
     
-        # 3. Get Profile Picture
-        profile_image_base64 = False
-        try:
-            user_id = update.effective_user.id
-            # Get list of profile photos (returns a list of PhotoSize objects)
-            photos = await context.bot.get_user_profile_photos(user_id, limit=1)
+            # 3. Get Profile Picture
+            profile_image_base64 = False
+            try:
+                user_id = update.effective_user.id
+                # Get list of profile photos (returns a list of PhotoSize objects)
+                photos = await context.bot.get_user_profile_photos(user_id, limit=1)
             
-            if photos.total_count > 0:
-                # Get the largest size of the most recent photo
-                file_id = photos.photos[0][-1].file_id
-                new_file = await context.bot.get_file(file_id)
+                if photos.total_count > 0:
+                    # Get the largest size of the most recent photo
+                    file_id = photos.photos[0][-1].file_id
+                    photo_unique_id = photos.photos[0][-1].file_unique_id
+                    new_file = await context.bot.get_file(file_id)
                 
-                # Download file into memory
-                image_bytes = await new_file.download_as_bytearray()
-                profile_image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        except Exception as photo_err:
-            _logger.warning(f"Could not fetch profile photo: {photo_err}")
+                    # Download file into memory
+                    image_bytes = await new_file.download_as_bytearray()
+                    profile_image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            except Exception as photo_err:
+                _logger.warning(f"Could not fetch profile photo: {photo_err}")
 
         try:
-            db_registry = odoo.modules.registry.Registry(self.dbname)
-            with db_registry.cursor() as cr:
-                # Create environment with tg_username in context
-                # This triggers the automatic profile creation logic in your res_users.py
-                env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {
-                    'tg_username': tg_username,
-                    'tg_bio': tg_bio,
-                    'tg_id': user_id,
-                     
-                })
+            # Create environment with tg_username in context
+            # This triggers the automatic profile creation logic in your res_users.py
+            with self.odoo_env(context={
+                'tg_username': tg_username,
+                'tg_bio': tg_bio,
+                'tg_id': user_id,
+            }) as env:
                 
                 # 1. Find Company
                 company = env['res.company'].sudo().search([('name', 'ilike', 'Myfansbook')], limit=1)
@@ -564,18 +1285,18 @@ class TelegramBotThread(threading.Thread):
                 if data.get('reg_type') == 'email':
                     user_vals['email'] = login
 
-                env['res.users'].sudo().create(user_vals)
-                
-                cr.commit()
+                new_user = env['res.users'].sudo().create(user_vals)
+                # Lets the profile sync cron skip this photo until it changes
+                new_user.partner_id.write({
+                    'telegram_bio': tg_bio,
+                    'telegram_photo_unique_id': photo_unique_id if profile_image_base64 else False,
+                })
+
+                env.cr.commit()
 
 
             # Send Private Message with Web App link
-            private_markup = InlineKeyboardMarkup([
-                [InlineKeyboardButton("Login to your account🔗", url=self.config['TELEGRAM_WEB_APP_URL'])],
-                [InlineKeyboardButton("Browser Login🔗", url=self.config['DASHBOARD_URL'])],
-                [InlineKeyboardButton("Back to Channel", url=self.config['CHANNEL_LINK'])],
-                [InlineKeyboardButton("Join Group", url=self.config['GROUP_LINK'])]
-            ])
+            private_markup = self.config['KEYBOARDS']['registered']
 
             await update.message.reply_text(
                 f"🎉 <b>Registration Successful!</b>\n\n"
@@ -632,11 +1353,12 @@ class TelegramBotThread(threading.Thread):
 
         try:
             member = await context.bot.get_chat_member(chat.id, user.id)
-            print(f"DEBUG: Owner ID is: {self.config['OWNER_ID']} User {user.id} status in {chat.id} is: {member.status} and the username is: {user.username}")
+            self.events.debug('link_handler', 'member_status', user=user.id, chat=chat.id, status=member.status)
             if member.status in ['administrator', 'creator', 'left']:
                 return
-        except Exception:
-            pass # If we can't check, proceed to filter  
+        except Exception as e:
+            # If we can't check, proceed to filter
+            self.events.debug('link_handler', 'member_status_failed', user=user.id, chat=chat.id, error=e)
 
         if not message.entities:
             return
@@ -651,54 +1373,119 @@ class TelegramBotThread(threading.Thread):
 
         # Check Odoo Permissions
         identifier = user.username if user.username else str(user.id)
-        odoo_data = self.get_odoo_user(user)
+        try:
+            odoo_data = self.get_odoo_user(user)
+        except CircuitOpen:
+            # Odoo is down: moderation goes on, without warnings we could not back up
+            self.events.info('link_handler', 'deleted_unchecked', user=user.id, chat=chat.id, message=message.message_id)
+            self.delete_soon(message)
+            return
 
         # Logic: If user not found in Odoo or not allowed_url_message
         if not odoo_data or not odoo_data.get('allowed'):
-            try:
-                await message.delete()
-                
-                # Tag user in group
-                bot_url = f"https://t.me/{context.bot.username}"
-                markup = InlineKeyboardMarkup([[InlineKeyboardButton("Send it Here 🚀", url=bot_url)]])
-                
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=f"Hey {user.mention_html()}, you are not allowed to send links into the group! 🚫",
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=markup
-                )
+            # Every offending message goes; the user is only warned once per cooldown window
+            calls = [message.delete()]
+            warned = self.link_warning_cooldown.hit(user.id)
+            if warned:
+                calls.append(self._warn_link_in_group(context, chat, user))
+                calls.append(self._send_link_help(user))
+            self.events.info('link_handler', 'deleted', user=user.id, chat=chat.id, message=message.message_id,
+                             registered=bool(odoo_data), warned=warned)
+            for result in await asyncio.gather(*calls, return_exceptions=True):
+                if isinstance(result, Exception):
+                    self.events.error('link_handler', 'action_failed', user=user.id, chat=chat.id, error=result)
+
+    async def _warn_link_in_group(self, context, chat, user):
+        """Tag the user in the group; the warning disappears after LINK_WARNING_TTL."""
+        bot_url = f"https://t.me/{context.bot.username}"
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("Send it Here 🚀", url=bot_url)]])
+        warning = await context.bot.send_message(
+            chat_id=chat.id,
+            text=f"Hey {user.mention_html()}, you are not allowed to send links into the group! 🚫",
+            parse_mode=ParseMode.HTML,
+            reply_markup=markup
+        )
+        await self.expire_messages([warning], self.config.get('LINK_WARNING_TTL'))
+
+    async def _send_link_help(self, user):
+        """Send Private Message with Web App link, unless the user cannot receive them."""
+        private_markup = self.config['KEYBOARDS']['link_help']
+        await self.send_private(
+            user.id,
+            f"Hi {user.first_name}, In order to post links, log into your account and post it there.",
+            reply_markup=private_markup
+        )
 
-                # Send Private Message with Web App link
-                private_markup = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Login to your account🔗", url=self.config['TELEGRAM_WEB_APP_URL'])],
-                    [InlineKeyboardButton("Back to Channel", url=self.config['CHANNEL_LINK'])],
-                    [InlineKeyboardButton("Back to Group", url=self.config['GROUP_LINK'])]
-                ])
-                await context.bot.send_message(
-                    chat_id=user.id,
-                    text=f"Hi {user.first_name}, In order to post links, log into your account and post it there.",
-                    reply_markup=private_markup
-                )
-            except Exception as e:
-                _logger.error("Bot Handler Error: %s", e)
 
 
+    def _gate_rule(self, chat_id=None):
+        """(channel, join link) pairs required in ``chat_id``: its own rule, or the default one."""
+        rules = self.config['GATE_RULES']
+        return rules.get(str(chat_id), rules['']) if chat_id is not None else rules['']
 
-    async def is_member(self, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    def gate_keyboard(self, chat_id=None):
+        """Join buttons of the channels required in ``chat_id``."""
+        keyboards = self.config['GATE_KEYBOARDS']
+        return keyboards.get(str(chat_id), keyboards['']) if chat_id is not None else keyboards['']
+
+    async def is_member(self, user_id: int, context: ContextTypes.DEFAULT_TYPE, odoo_data=None, chat_id=None) -> bool:
+        """Whether the user joined every channel required in ``chat_id`` (default rule in private).
+
+        The channels are checked concurrently and the check stops at the first
+        one the user is missing from, so several channels cost about one call.
+        """
+        rule = self._gate_rule(chat_id)
+        # Membership stored by the reconciliation cron: no API call for known members.
+        # The cron only follows CHANNEL_ID, so the stored status answers for a rule of that
+        # channel alone, never for part of a multi-channel rule. A stored "not a member" is
+        # checked again, the user may have just joined.
+        if (odoo_data and odoo_data.get('channel_member')
+                and [channel_id for channel_id, _link in rule] == [self.config['CHANNEL_ID']]):
+            return True
+        pending = []
+        for channel_id, _link in rule:
+            status = self.membership_cache.get(channel_id, user_id)
+            if status is None:
+                pending.append(channel_id)
+            elif status not in MEMBER_STATUSES:
+                return False
+        if not pending:
+            return True
+        lookups = [
+            asyncio.create_task(self._channel_status(context.bot, channel_id, user_id, odoo_data))
+            for channel_id in pending
+        ]
+        try:
+            for lookup in asyncio.as_completed(lookups):
+                if await lookup not in MEMBER_STATUSES:
+                    return False
+            return True
+        finally:
+            for lookup in lookups:
+                lookup.cancel()
+
+    async def _channel_status(self, bot, channel_id, user_id, odoo_data=None):
+        """Status of the user in the channel, None if it could not be read."""
         try:
             # Note: The bot MUST be an administrator in the channel for this to work reliably
-            member = await context.bot.get_chat_member(chat_id=self.config['CHANNEL_ID'], user_id=user_id)
-            _logger.info(f"DEBUG: User {user_id} status in {self.config['CHANNEL_ID']} is: {member.status}")
-            
-            # Check against valid 'joined' statuses
-            # Missing colon fixed here:
-            if member.status in ['member', 'administrator', 'creator']:
-                return True
-            return False
+            member = await bot.get_chat_member(chat_id=channel_id, user_id=user_id)
         except Exception as e:
-            _logger.error(f"DEBUG: Failed to check membership for {user_id}: {e}")
-            return False
+            self.events.error('is_member', 'lookup_failed', user=user_id, channel=channel_id, error=e)
+            return None
+        status = channel_status(member)
+        self.events.debug('is_member', 'lookup', user=user_id, channel=channel_id, status=status)
+        self.membership_cache.put(channel_id, user_id, status)
+        if odoo_data and channel_id == self.config['CHANNEL_ID'] and not self.replay:
+            try:
+                await asyncio.to_thread(self._store_channel_status, channel_id, user_id, status)
+            except Exception as e:
+                self.events.warning('is_member', 'store_failed', user=user_id, channel=channel_id, error=e)
+        return status
+
+    def _store_channel_status(self, channel_id, user_id, status):
+        with self.odoo_env() as env:
+            profiles = env['myfans.user'].search([('telegram_id', '=', str(user_id))])
+            profiles._set_telegram_channel_status(channel_id, status)
 
 
 
@@ -716,8 +1503,7 @@ class TelegramBotThread(threading.Thread):
         
         # USE update.effective_message INSTEAD OF update.message
         if update.effective_chat.type == "supergroup":
-            keyboard = [[InlineKeyboardButton("Go to your Assistant📢", url=f"{self.config['BOT_INBOX_URL']}?start=join")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = self.config['KEYBOARDS']['assistant']
             
             # Changed to update.effective_message
             await update.effective_message.reply_text(
@@ -728,12 +1514,10 @@ class TelegramBotThread(threading.Thread):
             return
 
         if odoo_data and update.effective_chat.type == "private":
-            is_in_channel = await self.is_member(user.id, context)
+            is_in_channel = await self.is_member(user.id, context, odoo_data)
             
             if not is_in_channel:
-                channel_username = self.config['CHANNEL_ID'].replace('@', '')
-                keyboard = [[InlineKeyboardButton(f"Join Channel 📢", url=f"https://t.me/{channel_username}")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = self.gate_keyboard()
                 
                 # Changed to update.effective_message
                 await update.effective_message.reply_text(
@@ -744,13 +1528,7 @@ class TelegramBotThread(threading.Thread):
                 )
             else:
                 if update.effective_chat.type == "private":
-                    keyboard = [
-                        [InlineKeyboardButton("Go to Channel", url=self.config['CHANNEL_LINK'])],
-                        [InlineKeyboardButton("Go to Group", url=self.config['GROUP_LINK'])],
-                        [InlineKeyboardButton("Login to your account🔗", url=self.config['TELEGRAM_WEB_APP_URL'])],
-                        [InlineKeyboardButton("Browser Login🔗", url=self.config['DASHBOARD_URL'])],
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
+                    reply_markup = self.config['KEYBOARDS']['verified']
 
                     # Changed to update.effective_message
                     await update.effective_message.reply_text(
@@ -841,9 +1619,9 @@ class TelegramBotThread(threading.Thread):
         tg_user = update.effective_user
         tg_username = tg_user.username if tg_user.username else str(tg_user.id)
 
-        db_registry = odoo.modules.registry.Registry(self.dbname)
-        with db_registry.cursor() as cr:
-            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        linked_name = None
+        error = None
+        with self.odoo_env() as env:
             try:
                 # Odoo authenticate signature: authenticate(db, credentials, user_agent_env)
                 
@@ -863,7 +1641,7 @@ class TelegramBotThread(threading.Thread):
 
                 uid = result.get('uid') if isinstance(result, dict) else result
                 
-                _logger.info(f"DEBUG: Extracted UID for browse: {uid}")
+                _logger.debug("Account link: authenticated as uid %s", uid)
 
 
                 if uid:
@@ -881,24 +1659,31 @@ class TelegramBotThread(threading.Thread):
                     # if profile:
                     #     profile.write({'telegram_username': tg_username})
 
-                    cr.commit()
-                    
-                    await update.message.reply_text(
-                        f"✅ Success! Your Telegram account is now linked to <b>{user.name}</b>.\n\n"
-                        "You are now fully verified.",
-                        parse_mode=ParseMode.HTML
-                    )
-                    return ConversationHandler.END
+                    env.cr.commit()
+                    linked_name = user.name
                 
             except odoo.exceptions.AccessDenied:
                 # This is the standard Odoo error for wrong credentials
-                await update.message.reply_text("❌ Invalid login or password. Authentication failed.")
-                return await self.show_retry_menu(update)
+                error = 'access_denied'
                 
             except Exception as e:
-                _logger.error(f"Linking Error: {str(e)}")
-                await update.message.reply_text("❌ A technical error occurred. Please try again later.")
-                return ConversationHandler.END
+                _logger.error("Linking Error: %s", e)
+                error = 'technical'
+
+        # The cursor is closed: the replies do not count against the Odoo breaker
+        if linked_name:
+            await update.message.reply_text(
+                f"✅ Success! Your Telegram account is now linked to <b>{linked_name}</b>.\n\n"
+                "You are now fully verified.",
+                parse_mode=ParseMode.HTML
+            )
+            return ConversationHandler.END
+        if error == 'access_denied':
+            await update.message.reply_text("❌ Invalid login or password. Authentication failed.")
+            return await self.show_retry_menu(update)
+        if error:
+            await update.message.reply_text("❌ A technical error occurred. Please try again later.")
+            return ConversationHandler.END
 
     async def show_retry_menu(self, update):
         keyboard = [
@@ -957,8 +1742,10 @@ class TelegramBotThread(threading.Thread):
     
     async def welcome_new_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Greets new members and validates their status immediately."""
-        _logger.info(f"DEBUG: Chat Member Update Received: {update.chat_member}")
         result = update.chat_member
+        self.events.debug('welcome_new_member', 'chat_member', chat=result.chat.id,
+                          user=result.new_chat_member.user.id, old=result.old_chat_member.status,
+                          new=result.new_chat_member.status)
         
         # Check if the status changed to 'member' (meaning they just joined)
         if result.new_chat_member.status == "member":
@@ -984,16 +1771,14 @@ class TelegramBotThread(threading.Thread):
 
             # --- CASE 2: ON WEBSITE, BUT NOT IN CHANNEL ---
             else:
-                is_in_channel = await self.is_member(user.id, context)
+                is_in_channel = await self.is_member(user.id, context, odoo_data, chat.id)
                 if not is_in_channel:
-                    channel_username = self.config['CHANNEL_ID'].replace('@', '')
                     welcome_text = (
                         f"Welcome back {odoo_data['name']}! 👋\n\n"
                         f"You are registered on our site, but you must join our official "
                         f"channel to participate in the group."
                     )
-                    keyboard = [[InlineKeyboardButton("Join Channel 📢", url=f"https://t.me/{channel_username}")]]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
+                    reply_markup = self.gate_keyboard(chat.id)
                 
                 # --- CASE 3: FULLY VERIFIED ---
                 else:
@@ -1003,6 +1788,9 @@ class TelegramBotThread(threading.Thread):
                     )
                     reply_markup = None # No buttons needed for verified users
 
+            self.events.info('welcome_new_member', 'welcomed', chat=chat.id, user=user.id,
+                             registered=bool(odoo_data), verified=bool(odoo_data) and reply_markup is None)
+
             # Send the final message to the group
             await context.bot.send_message(
                 chat_id=chat.id,
@@ -1032,9 +1820,7 @@ class TelegramBotThread(threading.Thread):
             await update.message.reply_text("❌ Unauthorized: This command is restricted to channel admins.")
             return
 
-        bot_url = f"https://t.me/{context.bot.username}?start=join"
-        keyboard = [[InlineKeyboardButton(f"Get Access to {WEBSITE_NAME} Group 🚀", url=bot_url)]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.config['KEYBOARDS']['access']
 
         try:
             # Handle old message deletion using the configured LOG_FILE
@@ -1073,9 +1859,8 @@ class TelegramBotThread(threading.Thread):
         # User(first_name='Group', id=1087968824, is_bot=True, username='GroupAnonymousBot')
 
 
-        print(f"DEBUG: User is: {update.effective_user}")
-        print(f"DEBUG: Chat is: {update.effective_chat}")
-        print(f"DEBUG: Username is: {update.effective_user.username}")
+        self.events.debug('greetings', 'hello', user=update.effective_user.id, chat=update.effective_chat.id,
+                          chat_type=update.effective_chat.type)
 
 
         # Check if it is group anonymous bot
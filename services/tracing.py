@@ -0,0 +1,268 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+from telegram.ext import ConversationHandler
+
+_logger = logging.getLogger(__name__)
+
+# Finished spans waiting for the exporter; beyond this they are dropped
+EXPORT_QUEUE_SIZE = 10000
+# Spans written or sent at once, and the longest a finished span waits for its batch
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 1.0
+# Rotated trace files kept next to the current one
+TRACE_FILE_BACKUPS = 5
+
+_current_span = contextvars.ContextVar('telegram_bot_span', default=None)
+
+
+class Span:
+    """ One timed operation of a trace; created by :meth:`Tracer.trace` and :func:`span`. """
+
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start_ns / 1e9,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+@contextlib.contextmanager
+def _activate(new_span):
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = '%s: %s' % (type(e).__name__, e)
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        new_span.tracer.export(new_span)
+
+
+def span(name, **attributes):
+    """ Context manager timing ``name`` as a child of the current span.
+
+    Outside of a sampled trace it does nothing and yields None, so
+    instrumented code costs a context variable lookup when tracing is off.
+    The current span follows ``await``, the tasks created inside it and
+    ``asyncio.to_thread``.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return contextlib.nullcontext()
+    return _activate(Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes))
+
+
+def traced(callback, name=None):
+    """ Wrap the coroutine function ``callback`` in a span named after it. """
+    name = name or getattr(callback, '__qualname__', repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        with span(name):
+            return await callback(*args, **kwargs)
+    return wrapper
+
+
+def callback_name(handler):
+    return getattr(handler.callback, '__qualname__', type(handler).__name__)
+
+
+def wrap_callbacks(application, wrap):
+    """ Replace the callback of every handler of ``application``, conversations
+    included, by ``wrap(callback, name)``. """
+    def walk(handlers):
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                walk(handler.entry_points)
+                for state_handlers in handler.states.values():
+                    walk(state_handlers)
+                walk(handler.fallbacks)
+            elif getattr(handler, 'callback', None) is not None:
+                handler.callback = wrap(handler.callback, callback_name(handler))
+
+    for group_handlers in application.handlers.values():
+        walk(group_handlers)
+
+
+def trace_handlers(application):
+    """ Time the callback of every handler of ``application`` in a span. """
+    wrap_callbacks(application, lambda callback, name: traced(callback, 'handler ' + name))
+
+
+class Tracer:
+    """
+    Starts the root span of sampled traces and hands finished spans to an
+    exporter, in batches, from a background thread: exporting never blocks
+    the event loop, and spans are dropped rather than queued without bound
+    when the exporter falls behind.
+
+    ``sample_ratio`` (0 to 1) is the share of traces recorded; the decision
+    is taken once per trace, at its root.
+    """
+
+    def __init__(self, exporter, sample_ratio=0.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.dropped = 0
+        self._queue = queue.Queue(EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def trace(self, name, **attributes):
+        """ Context manager of the root span of a new trace, or a no-op when not sampled. """
+        if not self.exporter or random.random() >= self.sample_ratio:
+            return contextlib.nullcontext()
+        return _activate(Span(self, name, '%032x' % random.getrandbits(128), attributes=attributes))
+
+    def export(self, finished_span):
+        try:
+            self._queue.put_nowait(finished_span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='telegram-trace-export', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if None in batch:  # close() sentinel
+                self._export([item for item in batch if item is not None])
+                return
+            self._export(batch)
+
+    def _export(self, batch):
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            _logger.warning("Could not export %s trace spans: %s", len(batch), e)
+
+    def close(self, timeout=5):
+        """ Export what is queued and stop the exporter thread. """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class JsonlSpanExporter:
+    """ Appends spans as JSON lines to ``path``, rotated past ``max_bytes`` like logging's RotatingFileHandler. """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backups=TRACE_FILE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(item.to_dict(), separators=(',', ':'), default=str) + '\n' for item in spans)
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as trace_file:
+            trace_file.write(lines)
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = '%s.%d' % (self.path, index)
+            if os.path.exists(source):
+                os.replace(source, '%s.%d' % (self.path, index + 1))
+        if self.backups:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+
+
+class OtlpHttpSpanExporter:
+    """ Posts spans to an OTLP/HTTP collector (``/v1/traces``, JSON encoding). """
+
+    def __init__(self, endpoint, service_name='telegram-bot', timeout=5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=timeout)
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        return {'key': key, 'value': typed}
+
+    def export(self, spans):
+        otlp_spans = []
+        for item in spans:
+            otlp_span = {
+                'traceId': item.trace_id,
+                'spanId': item.span_id,
+                'name': item.name,
+                'kind': 1,  # internal
+                'startTimeUnixNano': str(item.start_ns),
+                'endTimeUnixNano': str(item.end_ns),
+                'attributes': [self._attribute(key, value) for key, value in item.attributes.items()],
+                'status': {'code': 2, 'message': item.error} if item.error else {'code': 1},
+            }
+            if item.parent_id:
+                otlp_span['parentSpanId'] = item.parent_id
+            otlp_spans.append(otlp_span)
+        response = self._client.post(self.endpoint, json={'resourceSpans': [{
+            'resource': {'attributes': [self._attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': 'telegram_bot_manager'}, 'spans': otlp_spans}],
+        }]})
+        response.raise_for_status()
+
+
+def make_tracer(config, service_name='telegram-bot'):
+    """ Tracer set up from the ``TRACE_*`` entries of the bot config. """
+    exporter = None
+    if config.get('TRACE_EXPORTER') == 'otlp' and config.get('TRACE_ENDPOINT'):
+        exporter = OtlpHttpSpanExporter(config['TRACE_ENDPOINT'], service_name)
+    elif config.get('TRACE_EXPORTER') == 'file' and config.get('TRACE_FILE'):
+        exporter = JsonlSpanExporter(config['TRACE_FILE'], (config.get('TRACE_FILE_SIZE') or 0) * 1024 * 1024)
+    return Tracer(exporter, config.get('TRACE_SAMPLE_RATIO') or 0.0)
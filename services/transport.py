@@ -0,0 +1,108 @@
+import asyncio
+import collections
+import threading
+import time
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
+
+from .metrics import percentile
+from .tracing import span
+
+# Below this many seconds, getting a connection did not involve waiting
+POOL_WAIT_EPSILON = 0.001
+
+
+def transport_options(config, prefix='HTTP'):
+    """ HTTPXRequest arguments from the ``<prefix>_*`` entries of the bot config. """
+    pool_size = config.get(prefix + '_POOL_SIZE') or 1
+    keepalive = config.get('HTTP_KEEPALIVE', True)
+    return {
+        'connection_pool_size': pool_size,
+        'connect_timeout': config.get('HTTP_CONNECT_TIMEOUT', 5.0),
+        'read_timeout': config.get('HTTP_READ_TIMEOUT', 5.0),
+        'write_timeout': config.get('HTTP_WRITE_TIMEOUT', 5.0),
+        'pool_timeout': config.get('HTTP_POOL_TIMEOUT', 1.0),
+        'http_version': '2' if config.get('HTTP2') else '1.1',
+        'httpx_kwargs': {
+            'limits': httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size if keepalive else 0,
+                keepalive_expiry=config.get('HTTP_KEEPALIVE_EXPIRY', 30.0) if keepalive else 0,
+            ),
+        },
+    }
+
+
+class PoolWaitStats:
+    """ How long requests waited for a pooled connection: totals and rolling percentiles. """
+
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.waited = 0  # requests that found every connection busy
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, wait, timed_out=False):
+        with self._lock:
+            self.requests += 1
+            self.timeouts += timed_out
+            self._samples.append(wait)
+            if wait > POOL_WAIT_EPSILON:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        with self._lock:
+            ordered = sorted(self._samples)
+            return {
+                'requests': self.requests,
+                'waited': self.waited,
+                'timeouts': self.timeouts,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'p95': percentile(ordered, 0.95) if ordered else 0.0,
+            }
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest that hands out its connections through a semaphore sized
+    like the pool, so the time spent waiting for one can be measured
+    (:attr:`pool_stats`). The pool timeout applies to that wait.
+    """
+
+    def __init__(self, connection_pool_size=1, pool_timeout=1.0, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.pool_stats = PoolWaitStats()
+        self._default_pool_timeout = pool_timeout
+        self._slots = asyncio.Semaphore(connection_pool_size)
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        timeout = self._default_pool_timeout if pool_timeout is BaseRequest.DEFAULT_NONE else pool_timeout
+        with span('bot_api ' + url.rsplit('/', 1)[-1]) as api_span:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.pool_stats.observe(time.monotonic() - started, timed_out=True)
+                raise TimedOut("Pool timeout: all connections in the pool are occupied.") from None
+            self.pool_stats.observe(time.monotonic() - started)
+            if api_span:
+                api_span.set('pool_wait_ms', round((time.monotonic() - started) * 1000, 3))
+            try:
+                code, payload = await super().do_request(
+                    url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout,
+                )
+            finally:
+                self._slots.release()
+            if api_span:
+                api_span.set('http.status_code', code)
+            return code, payload
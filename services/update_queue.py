@@ -0,0 +1,215 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+import odoo
+
+_logger = logging.getLogger(__name__)
+
+# Namespace of the transaction-level advisory locks taken on queue partitions
+LOCK_NAMESPACE = 0x7467  # "tg"
+# Namespace of the session-level advisory locks giving a process the ownership of a partition
+OWNER_NAMESPACE = LOCK_NAMESPACE + 1
+# Seconds between two revisions of the partitions a process owns
+REBALANCE_INTERVAL = 5
+# A partition nobody owns is adopted beyond the fair share once its oldest update waited this long
+ORPHAN_DELAY = 30
+# Processing attempts of an update before it is left in the 'failed' state
+MAX_ATTEMPTS = 3
+
+
+def chat_key(update):
+    """ Ordering key of an update: its chat, else its user, else a shared key. """
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+class PostgresUpdateQueue:
+    """
+    Durable update queue stored in ``telegram_update_queue``.
+
+    Producers append raw updates. Consumers claim the oldest pending rows
+    of one partition at a time. Each partition is guarded by an advisory
+    lock, so the updates of a chat are processed in order even with many
+    consumer threads. The claim transaction stays open while the batch is
+    processed: if the consumer dies, its rows are released and consumed
+    again.
+
+    Conversation states and ``user_data`` live in the memory of the process
+    handling a chat, so a partition is owned by one process for as long as
+    it runs: ownership is a session-level advisory lock, held on a dedicated
+    connection until :meth:`close` or the death of the process, and never
+    given back while idle (a conversation waits for the user's next message).
+    Each process takes up to ``partitions / processes`` partitions as they
+    get pending updates, and adopts the partitions of a dead process once
+    their updates waited ``ORPHAN_DELAY`` seconds.
+    """
+
+    def __init__(self, dbname, config_id, partitions=8, processes=1):
+        self.dbname = dbname
+        self.config_id = config_id
+        self.partitions = max(1, partitions)
+        self.share = math.ceil(self.partitions / max(1, processes))
+        self.owned = set()
+        self._owner_cr = None
+        self._owner_lock = threading.Lock()
+        self._rebalanced_at = None
+
+    def put_many(self, updates):
+        """ Append raw updates in one transaction; a redelivered update_id is ignored. Blocks: run off the loop. """
+        with odoo.modules.registry.Registry(self.dbname).cursor() as cr:
+            for update in updates:
+                key = chat_key(update)
+                cr.execute("""
+                    INSERT INTO telegram_update_queue
+                        (config_id, update_id, chat_id, partition, payload, state, attempts,
+                         create_uid, write_uid, create_date, write_date)
+                    VALUES (%s, %s, %s, %s, %s, 'pending', 0,
+                            %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+                    ON CONFLICT (config_id, update_id) DO NOTHING
+                """, (self.config_id, update.update_id, str(key), key % self.partitions,
+                      json.dumps(update.to_dict()), odoo.SUPERUSER_ID, odoo.SUPERUSER_ID))
+
+    def _owner_key(self, partition):
+        return self.config_id * 1024 + partition
+
+    def _rebalance(self):
+        """ Revise the partitions owned by this process; called with ``_owner_lock`` held. """
+        if self._owner_cr is None:
+            self._owner_cr = odoo.modules.registry.Registry(self.dbname).cursor()
+        cr = self._owner_cr
+        cr.execute("""
+            SELECT partition, min(create_date) < now() at time zone 'UTC' - make_interval(secs => %s)
+            FROM telegram_update_queue
+            WHERE config_id = %s AND state = 'pending'
+            GROUP BY partition
+        """, (ORPHAN_DELAY, self.config_id))
+        pending = dict(cr.fetchall())  # partition -> waited past ORPHAN_DELAY
+        for partition, orphaned in pending.items():
+            if partition in self.owned or (len(self.owned) >= self.share and not orphaned):
+                continue
+            cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (OWNER_NAMESPACE, self._owner_key(partition)))
+            if cr.fetchone()[0]:
+                self.owned.add(partition)
+        # Session locks outlive the transaction: do not sit idle in one
+        cr.commit()
+
+    def owned_partitions(self):
+        """ The partitions this process may consume, revised every ``REBALANCE_INTERVAL`` seconds. """
+        with self._owner_lock:
+            now = time.monotonic()
+            if self._rebalanced_at is None or now - self._rebalanced_at >= REBALANCE_INTERVAL:
+                self._rebalanced_at = now
+                try:
+                    self._rebalance()
+                except Exception:
+                    # The connection is gone, and the session locks with it
+                    self._close_owner_cursor()
+                    raise
+            return list(self.owned)
+
+    def close(self):
+        """ Give up the owned partitions, for another process to take them over right away. """
+        with self._owner_lock:
+            if self._owner_cr is not None:
+                try:
+                    # The connection goes back to the pool: release its session locks explicitly
+                    self._owner_cr.execute("SELECT pg_advisory_unlock_all()")
+                    self._owner_cr.commit()
+                except Exception as e:
+                    _logger.warning("Telegram update queue: could not release the partitions: %s", e)
+            self._close_owner_cursor()
+
+    def _close_owner_cursor(self):
+        if self._owner_cr is not None:
+            try:
+                self._owner_cr.close()
+            except Exception:
+                pass
+        self._owner_cr = None
+        self.owned = set()
+
+    def claim(self, limit=50):
+        """ Lock an owned partition and its oldest pending rows.
+
+        :return: a :class:`QueueClaim`, or None when there is nothing to consume
+        """
+        owned = self.owned_partitions()
+        if not owned:
+            return None
+        cr = odoo.modules.registry.Registry(self.dbname).cursor()
+        try:
+            cr.execute("""
+                SELECT DISTINCT partition FROM telegram_update_queue
+                WHERE config_id = %s AND state = 'pending' AND partition IN %s
+            """, (self.config_id, tuple(owned)))
+            partitions = [row[0] for row in cr.fetchall()]
+            random.shuffle(partitions)
+            for partition in partitions:
+                cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)",
+                           (LOCK_NAMESPACE, self._owner_key(partition)))
+                if not cr.fetchone()[0]:
+                    continue  # another consumer of this process is on this partition
+                cr.execute("""
+                    SELECT id, payload FROM telegram_update_queue
+                    WHERE config_id = %s AND partition = %s AND state = 'pending'
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                """, (self.config_id, partition, limit))
+                rows = cr.fetchall()
+                if rows:
+                    return QueueClaim(cr, partition, rows)
+        except Exception:
+            cr.close()
+            raise
+        cr.close()
+        return None
+
+
+class QueueClaim:
+    """ Rows of one partition locked by a consumer until :meth:`complete` or :meth:`release`. """
+
+    def __init__(self, cr, partition, rows):
+        self.cr = cr
+        self.partition = partition
+        self.rows = [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def complete(self, done, failure=None):
+        """ Record the outcome of the batch and unlock it.
+
+        A chat's updates are processed in order, so the consumer stops at the
+        first row that raised: the rows after it stay pending untouched and
+        come back after it, once it is retried or given up on.
+
+        :param done: ids of the rows processed
+        :param failure: ``(row_id, error message)`` of the row whose processing raised;
+            it stays pending until it failed ``MAX_ATTEMPTS`` times
+        """
+        try:
+            if done:
+                self.cr.execute("""
+                    UPDATE telegram_update_queue
+                    SET state = 'done', attempts = attempts + 1, write_date = now() at time zone 'UTC'
+                    WHERE id IN %s
+                """, (tuple(done),))
+            if failure:
+                self.cr.execute("""
+                    UPDATE telegram_update_queue
+                    SET state = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'pending' END,
+                        attempts = attempts + 1, error = %s, write_date = now() at time zone 'UTC'
+                    WHERE id = %s
+                """, (MAX_ATTEMPTS, failure[1], failure[0]))
+            self.cr.commit()
+        finally:
+            self.cr.close()
+
+    def release(self):
+        """ Give the rows back untouched. """
+        self.cr.close()
@@ -0,0 +1,51 @@
+/**@odoo-module */
+import { registry } from "@web/core/registry"
+import { useService } from "@web/core/utils/hooks";
+import { standardFieldProps } from "@web/views/fields/standard_field_props";
+import { Component, onWillUnmount } from "@odoo/owl";
+
+const STATE_CLASSES = {
+    starting: "bg-info",
+    running: "bg-success",
+    draining: "bg-warning",
+    stopped: "bg-secondary",
+    error: "bg-danger",
+};
+
+// Selection badge that follows the bot lifecycle pushed on the bus by telegram.config
+export class BotStateBadge extends Component{
+    setup() {
+        this.busService = useService("bus_service");
+        this.onBotState = (payload) => this.refresh(payload);
+        this.busService.addChannel("telegram_bot_manager");
+        this.busService.subscribe("telegram_bot_state", this.onBotState);
+        onWillUnmount(() => this.busService.unsubscribe("telegram_bot_state", this.onBotState));
+    }
+    async refresh(payload) {
+        const record = this.props.record;
+        if (payload.id !== record.resId || await record.isDirty()) {
+            return;
+        }
+        await record.load();
+    }
+    get value() {
+        return this.props.record.data[this.props.name]
+    }
+    get label() {
+        const selection = this.props.record.fields[this.props.name].selection;
+        const option = selection.find(([value]) => value === this.value);
+        return option ? option[1] : "";
+    }
+    get badgeClass() {
+        return STATE_CLASSES[this.value] || "bg-secondary";
+    }
+}
+BotStateBadge.template = "BotStateBadge"
+BotStateBadge.props = {
+        ...standardFieldProps,
+        }
+export const botStateBadge = {
+    component: BotStateBadge,
+    supportedTypes: ["selection"],
+};
+registry.category("fields").add("bot_state_badge", botStateBadge)
@@ -0,0 +1,9 @@
+from . import test_ratelimit
+from . import test_fingerprint
+from . import test_dedup
+from . import test_metrics
+from . import test_member_export
+from . import test_bot_config
+from . import test_conversation
+from . import test_recorder
+from . import test_update_queue
@@ -0,0 +1,71 @@
+from odoo.tests import BaseCase
+
+from ..services.bot_config import config_settings, freeze_bot_config
+
+
+def urls(markup):
+    return [button.url for row in markup.inline_keyboard for button in row]
+
+
+class TestFreezeBotConfig(BaseCase):
+
+    def test_read_only(self):
+        data = {'ALLOWED_COMMANDS': ['start'], 'CHANNEL_ID': '@news'}
+        config = freeze_bot_config(data)
+        with self.assertRaises(TypeError):
+            config['CHANNEL_ID'] = '@other'
+        with self.assertRaises(TypeError):
+            config['KEYBOARDS']['access'] = None
+        self.assertEqual(data['ALLOWED_COMMANDS'], ['start'], "the snapshot given is left alone")
+
+    def test_derived_values(self):
+        config = freeze_bot_config({'ALLOWED_COMMANDS': ['start', 'help', 'start'], 'OWNER_ID': ' 12345 '})
+        self.assertEqual(config['ALLOWED_COMMANDS'], frozenset({'start', 'help'}))
+        self.assertEqual(config['OWNER_ID'], 12345)
+        self.assertIsNone(freeze_bot_config({'OWNER_ID': False})['OWNER_ID'])
+        self.assertIsNone(freeze_bot_config({'OWNER_ID': '@owner'})['OWNER_ID'])
+        self.assertEqual(freeze_bot_config({})['ALLOWED_COMMANDS'], frozenset())
+
+    def test_keyboards_leave_out_unconfigured_links(self):
+        config = freeze_bot_config({
+            'TELEGRAM_WEB_APP_URL': 'https://example.com/app',
+            'CHANNEL_LINK': 'https://t.me/news',
+            'GROUP_LINK': False,
+            'BOT_INBOX_URL': 'https://t.me/inbox_bot',
+        })
+        keyboards = config['KEYBOARDS']
+        self.assertEqual(urls(keyboards['registered']), ['https://example.com/app', 'https://t.me/news'])
+        self.assertEqual(urls(keyboards['verified']), ['https://t.me/news', 'https://example.com/app'])
+        self.assertEqual(urls(keyboards['assistant']), ['https://t.me/inbox_bot?start=join'])
+
+    def test_access_keyboard_links_to_the_bot(self):
+        self.assertEqual(urls(freeze_bot_config({})['KEYBOARDS']['access']), [])
+        keyboard = freeze_bot_config({'BOT_USERNAME': 'my_bot', 'WEBSITE_NAME': 'Example'})['KEYBOARDS']['access']
+        self.assertEqual(urls(keyboard), ['https://t.me/my_bot?start=join'])
+        self.assertIn('Example', keyboard.inline_keyboard[0][0].text)
+
+    def test_default_gate_rule_is_the_channel(self):
+        config = freeze_bot_config({'CHANNEL_ID': ' @news '})
+        self.assertEqual(dict(config['GATE_RULES']), {'': (('@news', 'https://t.me/news'),)})
+        self.assertEqual(urls(config['GATE_KEYBOARDS']['']), ['https://t.me/news'])
+        self.assertEqual(dict(freeze_bot_config({})['GATE_RULES']), {'': ()})
+
+    def test_gate_channels(self):
+        config = freeze_bot_config({
+            'CHANNEL_ID': '@news',
+            'GATE_CHANNELS': [
+                ('-100777', '@vip', False),
+                ('-100777', '-100999', 'https://t.me/+invite'),
+                ('', '-100888', False),
+            ],
+        })
+        rules = config['GATE_RULES']
+        self.assertEqual(rules['-100777'], (('@vip', 'https://t.me/vip'), ('-100999', 'https://t.me/+invite')))
+        # Lines without a group replace the Channel ID as the default rule
+        self.assertEqual(rules[''], (('-100888', None),))
+        self.assertEqual(urls(config['GATE_KEYBOARDS']['-100777']), ['https://t.me/vip', 'https://t.me/+invite'])
+        self.assertEqual(urls(config['GATE_KEYBOARDS']['']), [], "a private channel without link has no button")
+
+    def test_config_settings_leave_out_state(self):
+        data = {'CHANNEL_ID': '@news', 'LAST_UPDATE_ID': 10, 'UPDATE_WINDOW': 'ff'}
+        self.assertEqual(config_settings(data), {'CHANNEL_ID': '@news'})
@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock
+
+from telegram.ext import CommandHandler, ConversationHandler
+
+from odoo.tests import BaseCase
+
+from ..services.conversation import TimedConversationHandler
+
+WAITING_NAME, WAITING_CODE, WAITING_PHOTO = range(3)
+
+
+async def callback(update, context):
+    return ConversationHandler.END
+
+
+class TestTimedConversationHandler(BaseCase):
+
+    def make_handler(self, **kwargs):
+        return TimedConversationHandler(
+            entry_points=[CommandHandler('start', callback)],
+            states={
+                state: [CommandHandler('next', callback)]
+                for state in (WAITING_NAME, WAITING_CODE, WAITING_PHOTO)
+            },
+            fallbacks=[],
+            **kwargs,
+        )
+
+    def scheduled_timeout(self, handler, state):
+        application = MagicMock()
+        handler._schedule_job(state, application, MagicMock(), MagicMock(), (1, 1))
+        application.job_queue.run_once.assert_called_once()
+        return application.job_queue.run_once.call_args.args[1]
+
+    def test_default_timeout_is_the_longest(self):
+        handler = self.make_handler(state_timeouts={WAITING_NAME: 300, WAITING_CODE: 600, WAITING_PHOTO: 0})
+        self.assertEqual(handler.conversation_timeout, 600)
+        self.assertEqual(handler.state_timeouts, {WAITING_NAME: 300, WAITING_CODE: 600})
+        self.assertIsNone(self.make_handler().conversation_timeout)
+
+    def test_explicit_default_timeout(self):
+        handler = self.make_handler(state_timeouts={WAITING_NAME: 300}, conversation_timeout=120)
+        self.assertEqual(handler.conversation_timeout, 120)
+
+    def test_each_state_schedules_its_timeout(self):
+        handler = self.make_handler(state_timeouts={WAITING_NAME: 300, WAITING_CODE: 600})
+        self.assertEqual(self.scheduled_timeout(handler, WAITING_NAME), 300)
+        self.assertEqual(self.scheduled_timeout(handler, WAITING_CODE), 600)
+        # A state without a timeout of its own falls back to the default
+        self.assertEqual(self.scheduled_timeout(handler, WAITING_PHOTO), 600)
+        self.assertEqual(handler.conversation_timeout, 600, "the default is restored after scheduling")
+
+    def test_end_schedules_nothing(self):
+        handler = self.make_handler(state_timeouts={WAITING_NAME: 300})
+        application = MagicMock()
+        handler._schedule_job(ConversationHandler.END, application, MagicMock(), MagicMock(), (1, 1))
+        application.job_queue.run_once.assert_not_called()
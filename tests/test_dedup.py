@@ -0,0 +1,59 @@
+from odoo.tests import BaseCase
+
+from ..services.dedup import UpdateWindow
+
+
+class TestUpdateWindow(BaseCase):
+
+    def test_duplicates_are_refused(self):
+        window = UpdateWindow()
+        self.assertTrue(window.add(10))
+        self.assertFalse(window.add(10))
+        self.assertTrue(window.add(11))
+        self.assertFalse(window.add(10))
+
+    def test_gaps_and_out_of_order_delivery(self):
+        window = UpdateWindow(size=16)
+        self.assertTrue(window.add(100))
+        self.assertTrue(window.add(105))
+        # Ids skipped below the highest are still accepted once
+        self.assertTrue(window.add(103))
+        self.assertTrue(window.add(101))
+        self.assertFalse(window.add(103))
+        self.assertEqual(window.high, 105)
+
+    def test_ids_older_than_the_window_count_as_seen(self):
+        window = UpdateWindow(size=8)
+        window.add(100)
+        self.assertFalse(window.add(92))
+        self.assertTrue(window.add(93))
+
+    def test_jump_past_the_window_resets_the_bitmap(self):
+        window = UpdateWindow(size=8)
+        window.add(1)
+        window.add(2)
+        self.assertTrue(window.add(50))
+        self.assertEqual(window.bits, 1)
+        self.assertTrue(window.add(49))
+
+    def test_dump_and_load_round_trip(self):
+        window = UpdateWindow(size=64)
+        for update_id in (5, 7, 8, 12):
+            window.add(update_id)
+        high, bits_hex = window.dump()
+        restored = UpdateWindow.load(high, bits_hex, size=64)
+        for update_id in (5, 7, 8, 12):
+            self.assertFalse(restored.add(update_id))
+        self.assertTrue(restored.add(6))
+
+    def test_load_without_state(self):
+        window = UpdateWindow.load(False, False)
+        self.assertEqual((window.high, window.bits), (0, 0))
+        self.assertTrue(window.add(1))
+
+    def test_bitmap_stays_within_its_size(self):
+        window = UpdateWindow(size=8)
+        for update_id in range(1, 100):
+            window.add(update_id)
+        self.assertLess(window.bits, 1 << 8)
+        self.assertEqual(UpdateWindow(bits=(1 << 20) - 1, size=8).bits, 0xff)
@@ -0,0 +1,86 @@
+import types
+from unittest.mock import patch
+
+from odoo.tests import BaseCase
+
+from ..services import fingerprint
+from ..services.fingerprint import DecayingCountMinSketch, message_fingerprints, normalize_text
+
+
+def make_message(text=None, caption=None, photo=(), **media):
+    fields = dict.fromkeys(('video', 'animation', 'document', 'audio', 'voice', 'video_note'))
+    fields.update(media)
+    return types.SimpleNamespace(text=text, caption=caption, photo=list(photo), **fields)
+
+
+def make_file(file_unique_id):
+    return types.SimpleNamespace(file_unique_id=file_unique_id)
+
+
+class TestMessageFingerprints(BaseCase):
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text("Ça VA, très_bien !!"), "cavatresbien")
+        # Look-alike characters fold to the same text
+        self.assertEqual(normalize_text("ＦＲＥＥ ｍｏｎｅｙ"), normalize_text("free money"))
+
+    def test_variants_of_a_text_share_a_fingerprint(self):
+        first = message_fingerprints(make_message(text="Join my channel NOW for free crypto!"))
+        second = message_fingerprints(make_message(caption="join my channel now... for FREE crypto"))
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 1)
+
+    def test_short_texts_are_not_fingerprinted(self):
+        self.assertEqual(message_fingerprints(make_message(text="hello everyone")), [])
+
+    def test_media_fingerprint(self):
+        message = make_message(
+            caption="Look at this amazing offer right here",
+            photo=[make_file('small'), make_file('large')],
+        )
+        fingerprints = message_fingerprints(message)
+        self.assertEqual(len(fingerprints), 2)
+        self.assertIn('f:large', fingerprints, "the largest size identifies a photo")
+        self.assertEqual(message_fingerprints(make_message(voice=make_file('v1'))), ['f:v1'])
+
+
+class TestDecayingCountMinSketch(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = patch.object(fingerprint, 'time', types.SimpleNamespace(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counts_occurrences(self):
+        sketch = DecayingCountMinSketch(width=1024, depth=4, half_life=600)
+        for count in range(1, 4):
+            self.assertAlmostEqual(sketch.add('spam'), count)
+        self.assertAlmostEqual(sketch.add('other'), 1)
+
+    def test_counts_decay_with_half_life(self):
+        sketch = DecayingCountMinSketch(half_life=600)
+        sketch.add('spam')
+        sketch.add('spam')
+        self.now += 600
+        # The two previous occurrences count for one, plus this one
+        self.assertAlmostEqual(sketch.add('spam'), 2)
+        self.now += 6000
+        self.assertAlmostEqual(sketch.add('spam'), 1, places=2)
+
+    def test_rescaling_keeps_the_estimates(self):
+        sketch = DecayingCountMinSketch(width=64, depth=2, half_life=1)
+        sketch.add('spam')
+        sketch.add('spam')
+        # 2 ** 30 is past the rescaling threshold
+        self.now += 30
+        self.assertAlmostEqual(sketch.add('spam'), 1 + 2 / 2 ** 30)
+        self.assertEqual(sketch._origin, self.now)
+        self.assertAlmostEqual(sketch.add('spam'), 2 + 2 / 2 ** 30)
+
+    def test_never_under_counts(self):
+        sketch = DecayingCountMinSketch(width=8, depth=2)
+        for key in range(100):
+            sketch.add(str(key))
+        self.assertGreaterEqual(sketch.add('0'), 2)
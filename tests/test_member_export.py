@@ -0,0 +1,82 @@
+import io
+import json
+import os
+import tempfile
+
+from odoo.tests import BaseCase
+
+from ..services.member_export import export_user, iter_array_objects, iter_export_users
+
+
+class TestArrayObjectScanner(BaseCase):
+
+    def scan(self, document, chunk_size=7):
+        return list(iter_array_objects(io.StringIO(document), chunk_size=chunk_size))
+
+    def test_member_list(self):
+        members = [{'user_id': 1, 'username': 'a'}, {'user_id': 2, 'username': 'b'}]
+        self.assertEqual(self.scan(json.dumps(members)), members)
+
+    def test_objects_of_nested_arrays(self):
+        document = {'name': "Chat", 'messages': [{'id': 1, 'user': {'id': 5}}, {'id': 2, 'tags': [{'x': 1}]}]}
+        # Objects nested in a yielded object stay part of it
+        self.assertEqual(self.scan(json.dumps(document)), document['messages'])
+
+    def test_structure_characters_in_strings(self):
+        records = [
+            {'text': 'braces } { and [brackets]', 'username': 'a'},
+            {'text': 'quote \\" and backslash \\\\', 'username': 'b"}'},
+        ]
+        for chunk_size in (1, 2, 3, 5, 1 << 20):
+            self.assertEqual(self.scan(json.dumps(records), chunk_size), records, chunk_size)
+
+    def test_escapes_split_across_chunks(self):
+        records = [{'text': '\\"' * 10, 'n': index} for index in range(5)]
+        document = json.dumps(records)
+        for chunk_size in range(1, 12):
+            self.assertEqual(self.scan(document, chunk_size), records, chunk_size)
+
+    def test_unicode(self):
+        records = [{'username': 'élodie', 'bio': '🙂 [x]'}]
+        self.assertEqual(self.scan(json.dumps(records, ensure_ascii=False), 3), records)
+
+    def test_no_array(self):
+        self.assertEqual(self.scan('{"user": {"id": 1}}'), [])
+
+
+class TestExportUser(BaseCase):
+
+    def test_member_list_record(self):
+        self.assertEqual(export_user({'user_id': 42, 'username': '@alice'}), ('42', 'alice'))
+        self.assertEqual(export_user({'user_id': '42', 'username': 'alice'}), ('42', 'alice'))
+
+    def test_nested_user(self):
+        self.assertEqual(export_user({'status': 'member', 'user': {'id': 42, 'username': 'bob'}}), ('42', 'bob'))
+        self.assertEqual(export_user({'user': {'user_id': 42, 'username': 'bob'}}), ('42', 'bob'))
+
+    def test_top_level_id_is_not_a_user_id(self):
+        # A message record: its id is the message's
+        self.assertIsNone(export_user({'id': 1234, 'username': 'carol'}))
+        self.assertIsNone(export_user({'id': 1234, 'from_id': 'user42', 'username': 'carol'}))
+
+    def test_records_without_username(self):
+        self.assertIsNone(export_user({'user_id': 42}))
+        self.assertIsNone(export_user({'user_id': 42, 'username': '@ '}))
+        self.assertIsNone(export_user({'user': {'id': 42, 'username': None}}))
+
+    def test_invalid_ids_and_bots(self):
+        self.assertIsNone(export_user({'user_id': 'abc', 'username': 'a'}))
+        self.assertIsNone(export_user({'user_id': -1001234, 'username': 'a_channel'}))
+        self.assertIsNone(export_user({'user': {'id': 42, 'username': 'a_bot', 'is_bot': True}}))
+
+    def test_iter_export_users(self):
+        records = [
+            {'user_id': 1, 'username': 'a'},
+            {'id': 2, 'username': 'b'},
+            {'user': {'id': 3, 'username': '@c'}},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'members.json')
+            with open(path, 'w', encoding='utf-8') as export:
+                json.dump({'members': records}, export)
+            self.assertEqual(list(iter_export_users(path)), [('1', 'a'), ('3', 'c')])
@@ -0,0 +1,62 @@
+import datetime
+import time
+import types
+
+from odoo.tests import BaseCase
+
+from ..services.metrics import LagTracker, percentile, update_type_and_date
+
+
+def make_update(update_type, sent_at):
+    date = datetime.datetime.fromtimestamp(sent_at, datetime.timezone.utc)
+    return types.SimpleNamespace(**{update_type: types.SimpleNamespace(date=date)})
+
+
+class TestLagTracker(BaseCase):
+
+    def test_update_type_and_date(self):
+        self.assertEqual(update_type_and_date(make_update('chat_member', 1000)), ('chat_member', 1000))
+        # Callback queries carry no date of their own
+        self.assertEqual(update_type_and_date(types.SimpleNamespace(callback_query=object())), (None, None))
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual(percentile(ordered, 0.5), 50)
+        self.assertEqual(percentile(ordered, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+    def test_snapshot_per_update_type(self):
+        tracker = LagTracker()
+        now = float(int(time.time()))  # whole seconds: exact lags
+        for lag in range(1, 11):
+            tracker.observe(make_update('message', now - lag), now - lag + 0.5, now)
+        tracker.observe(make_update('chat_member', now - 2), now - 1, now)
+        tracker.observe(types.SimpleNamespace(), now, now)  # undated, ignored
+
+        report = tracker.snapshot()
+        self.assertEqual(set(report), {'message', 'chat_member'})
+        message = report['message']
+        self.assertEqual(message['count'], 10)
+        self.assertAlmostEqual(message['dequeue_p95'], 0.5)
+        self.assertAlmostEqual(message['p50'], 5)
+        self.assertAlmostEqual(message['p95'], 10)
+        self.assertAlmostEqual(message['max'], 10)
+        self.assertAlmostEqual(report['chat_member']['p99'], 2)
+
+    def test_window_keeps_the_latest_samples(self):
+        tracker = LagTracker(window=3)
+        now = float(int(time.time()))
+        for lag in (100, 1, 2, 3):
+            tracker.observe(make_update('message', now - lag), now, now)
+        report = tracker.snapshot()['message']
+        self.assertEqual(report['count'], 3)
+        self.assertAlmostEqual(report['max'], 3)
+
+    def test_old_samples_are_dropped(self):
+        tracker = LagTracker(max_age=300)
+        now = float(int(time.time()))
+        tracker.observe(make_update('message', now - 400), now - 400, now - 390)
+        tracker.observe(make_update('edited_message', now - 5), now - 4, now - 3)
+        report = tracker.snapshot()
+        self.assertEqual(list(report), ['edited_message'], "an idle update type reports nothing")
+        self.assertAlmostEqual(report['edited_message']['p50'], 2)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import types
+from unittest.mock import patch
+
+from odoo.tests import BaseCase
+
+from ..services import ratelimit
+
+
+class FakeClock:
+    """ time.monotonic() of the module under test, moved by hand. """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+class TestCooldown(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        patcher = patch.object(ratelimit, 'time', types.SimpleNamespace(monotonic=self.clock.monotonic))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_once_per_window_per_key(self):
+        cooldown = ratelimit.Cooldown(60)
+        self.assertTrue(cooldown.hit('a'))
+        self.assertFalse(cooldown.hit('a'))
+        self.assertTrue(cooldown.hit('b'), "keys are limited independently")
+        self.clock.now += 59
+        self.assertFalse(cooldown.hit('a'))
+        self.clock.now += 1
+        self.assertTrue(cooldown.hit('a'))
+
+    def test_refused_attempts_do_not_extend_the_window(self):
+        cooldown = ratelimit.Cooldown(10)
+        cooldown.hit('a')
+        self.clock.now += 5
+        self.assertFalse(cooldown.hit('a'))
+        self.clock.now += 5
+        self.assertTrue(cooldown.hit('a'))
+
+    def test_expired_keys_are_pruned(self):
+        cooldown = ratelimit.Cooldown(10)
+        for key in range(1000):
+            cooldown.hit(key)
+        self.clock.now += 10
+        for key in range(1000, 1100):
+            cooldown.hit(key)
+        self.assertEqual(len(cooldown._last), 100)
+        self.assertTrue(cooldown.hit(0), "a pruned key is let through again")
+
+
+class TestSlidingWindowCounter(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        patcher = patch.object(ratelimit, 'time', types.SimpleNamespace(monotonic=self.clock.monotonic))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counts_over_the_window(self):
+        counter = ratelimit.SlidingWindowCounter(10, buckets=10)
+        self.assertEqual(counter.add('a'), 1)
+        self.assertEqual(counter.add('a', 2), 3)
+        self.assertEqual(counter.add('b'), 1)
+        self.clock.now += 5
+        self.assertEqual(counter.add('a'), 4)
+        # The first events leave the window, the one of 5s ago stays
+        self.clock.now += 6
+        self.assertEqual(counter.add('a'), 2)
+
+    def test_idle_key_restarts_from_zero(self):
+        counter = ratelimit.SlidingWindowCounter(10, buckets=10)
+        counter.add('a', 5)
+        self.clock.now += 60
+        self.assertEqual(counter.add('a'), 1)
+
+    def test_least_recently_used_key_is_forgotten(self):
+        counter = ratelimit.SlidingWindowCounter(10, max_keys=2)
+        counter.add('a', 5)
+        counter.add('b', 5)
+        counter.add('a')
+        counter.add('c')
+        self.assertEqual(list(counter._rings), ['a', 'c'])
+        self.assertEqual(counter.add('b'), 1)
+
+
+class TestAsyncRateLimiter(BaseCase):
+
+    def test_burst_then_paced(self):
+        async def run():
+            limiter = ratelimit.AsyncRateLimiter(rate=50, burst=2)
+            started = time.monotonic()
+            await limiter.acquire()
+            await limiter.acquire()
+            burst = time.monotonic() - started
+            await limiter.acquire()
+            await limiter.acquire()
+            return burst, time.monotonic() - started
+
+        burst, total = asyncio.run(run())
+        self.assertLess(burst, 0.02, "the burst is not waited for")
+        # Two more tokens at 50/s: about 40ms
+        self.assertGreaterEqual(total, 0.03)
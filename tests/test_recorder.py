@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+from odoo.tests import BaseCase
+
+from ..services.recorder import UpdateRecorder, iter_segment, read_index, segments_of
+
+
+class FakeUpdate:
+
+    def __init__(self, update_id):
+        self.update_id = update_id
+
+    def to_dict(self):
+        return {'update_id': self.update_id, 'message': {'text': "update %s" % self.update_id}}
+
+
+class TestUpdateRecorder(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def record_batches(self, batches, segment_size=64 * 1024 * 1024):
+        """ Write each batch of update ids as one gzip member, as the writer thread does. """
+        recorder = UpdateRecorder(self.directory, segment_size=segment_size)
+        for batch in batches:
+            recorder._write([(1000.0 + update_id, FakeUpdate(update_id)) for update_id in batch])
+        recorder.close()
+        return segments_of(self.directory)
+
+    def test_record_and_read_back(self):
+        recorder = UpdateRecorder(self.directory)
+        for update_id in (1, 2, 3):
+            self.assertTrue(recorder.record(FakeUpdate(update_id)))
+        self.assertTrue(recorder.record(object()), "custom updates pass without being recorded")
+        recorder.close()
+
+        [segment] = segments_of(self.directory)
+        records = list(iter_segment(segment))
+        self.assertEqual([update['update_id'] for _at, update in records], [1, 2, 3])
+        self.assertEqual(records[0][1]['message'], {'text': "update 1"})
+        self.assertEqual(recorder.dropped, 0)
+
+    def test_index_lists_each_member(self):
+        [segment] = self.record_batches([[1, 2, 3], [4, 5], [6]])
+        index = read_index(segment)
+        self.assertEqual([(update_id, at) for update_id, at, _offset in index], [(1, 1001.0), (4, 1004.0), (6, 1006.0)])
+        self.assertEqual(index[0][2], 0)
+        self.assertLess(index[1][2], index[2][2])
+        self.assertLess(index[2][2], os.path.getsize(segment))
+
+    def test_iter_segment_since(self):
+        [segment] = self.record_batches([[1, 2, 3], [4, 5], [6]])
+        for since, expected in ((None, [1, 2, 3, 4, 5, 6]), (5, [5, 6]), (4, [4, 5, 6]), (0, [1, 2, 3, 4, 5, 6]),
+                                (7, [])):
+            self.assertEqual([update['update_id'] for _at, update in iter_segment(segment, since)], expected, since)
+
+    def test_iter_segment_without_index(self):
+        [segment] = self.record_batches([[1, 2], [3, 4]])
+        os.remove(segment[:-len('.jsonl.gz')] + '.idx')
+        self.assertEqual(read_index(segment), [])
+        self.assertEqual([update['update_id'] for _at, update in iter_segment(segment, 3)], [3, 4])
+
+    def test_segments_rotate_in_order(self):
+        segments = self.record_batches([[1], [2], [3]], segment_size=1)
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(segments_of(segments[1]), [segments[1]])
+        replayed = [update['update_id'] for segment in segments for _at, update in iter_segment(segment)]
+        self.assertEqual(replayed, [1, 2, 3])
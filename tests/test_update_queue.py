@@ -0,0 +1,101 @@
+import types
+
+from odoo.tests import TransactionCase, tagged
+
+from ..services.update_queue import MAX_ATTEMPTS, PostgresUpdateQueue
+
+
+def make_update(update_id, chat_id):
+    chat = types.SimpleNamespace(id=chat_id)
+    return types.SimpleNamespace(
+        update_id=update_id, effective_chat=chat, effective_user=None,
+        to_dict=lambda: {'update_id': update_id, 'message': {'chat': {'id': chat_id}}},
+    )
+
+
+@tagged('post_install', '-at_install')
+class TestPostgresUpdateQueue(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = self.env['telegram.config'].create({
+            'bot_token': '123:test',
+            'bot_inbox_url': 'https://t.me/test_bot',
+        })
+        # The queue opens its own cursors: let them share the test transaction
+        self.env.flush_all()
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        self.queue = PostgresUpdateQueue(self.cr.dbname, self.config.id, partitions=4)
+        self.addCleanup(self.queue.close)
+
+    def rows(self):
+        self.env.invalidate_all()
+        return self.env['telegram.update.queue'].search([('config_id', '=', self.config.id)])
+
+    def claimed_update_ids(self, claim):
+        return [payload['update_id'] for _row_id, payload in claim.rows]
+
+    def test_put_many(self):
+        self.queue.put_many([make_update(1, 10), make_update(2, 11), make_update(1, 10)])
+        rows = self.rows()
+        self.assertEqual(rows.mapped('update_id'), [1, 2], "a redelivered update is queued once")
+        self.assertEqual(rows.mapped('partition'), [2, 3])
+        self.assertEqual(set(rows.mapped('state')), {'pending'})
+
+    def test_claim_and_complete(self):
+        self.queue.put_many([make_update(1, 10), make_update(2, 11), make_update(3, 10)])
+        claimed = {}
+        while True:
+            claim = self.queue.claim()
+            if claim is None:
+                break
+            self.assertNotIn(claim.partition, claimed, "a completed partition has nothing pending left")
+            claimed[claim.partition] = self.claimed_update_ids(claim)
+            claim.complete([row_id for row_id, _payload in claim.rows])
+        # The updates of a chat come in order, in one batch per partition
+        self.assertEqual(claimed, {2: [1, 3], 3: [2]})
+        self.assertEqual(set(self.rows().mapped('state')), {'done'})
+        self.assertEqual(set(self.rows().mapped('attempts')), {1})
+
+    def test_release(self):
+        self.queue.put_many([make_update(1, 10), make_update(2, 10)])
+        claim = self.queue.claim()
+        self.assertEqual(self.claimed_update_ids(claim), [1, 2])
+        claim.release()
+        rows = self.rows()
+        self.assertEqual(set(rows.mapped('state')), {'pending'})
+        self.assertEqual(set(rows.mapped('attempts')), {0})
+        claim = self.queue.claim(limit=1)
+        self.assertEqual(self.claimed_update_ids(claim), [1])
+        claim.release()
+
+    def test_failure_keeps_the_chat_in_order(self):
+        self.queue.put_many([make_update(1, 10), make_update(2, 10), make_update(3, 10)])
+        claim = self.queue.claim()
+        first, second, _third = [row_id for row_id, _payload in claim.rows]
+        claim.complete([first], failure=(second, "boom"))
+
+        rows = self.rows()
+        self.assertEqual(rows.mapped('state'), ['done', 'pending', 'pending'])
+        self.assertEqual(rows.mapped('attempts'), [1, 1, 0])
+        self.assertEqual(rows[1].error, "boom")
+        # The failed update is retried before the rest of its chat
+        for _attempt in range(MAX_ATTEMPTS - 1):
+            claim = self.queue.claim()
+            self.assertEqual(self.claimed_update_ids(claim), [2, 3])
+            claim.complete([], failure=(second, "boom"))
+
+        rows = self.rows()
+        self.assertEqual(rows.mapped('state'), ['done', 'failed', 'pending'])
+        self.assertEqual(rows[1].attempts, MAX_ATTEMPTS)
+        claim = self.queue.claim()
+        self.assertEqual(self.claimed_update_ids(claim), [3], "a given up update no longer holds its chat")
+        claim.release()
+
+    def test_nothing_to_claim(self):
+        self.assertIsNone(self.queue.claim())
+        self.queue.put_many([make_update(1, 10)])
+        self.assertEqual(self.queue.owned_partitions(), [], "ownership is revised every few seconds")
+        self.queue._rebalanced_at = None
+        self.assertEqual(self.queue.owned_partitions(), [2])